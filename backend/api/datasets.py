@@ -1,18 +1,37 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import time
 import uuid
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-import pandas as pd
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
 from pydantic import BaseModel
 
-from ..data_agent.dataset_registry import datasets_root, get_dataset, list_datasets
-from ..data_agent.duckdb_query import run_query
-from ..data_agent.orchestrator import create_dataset, run_dataset_agent
+from ..data_agent import duckdb_init, etl_jobs, exports, query_cache, user_map
+from ..data_agent.agents import agent_cache_stats
+from ..data_agent.aggregates import aggregate
+from ..data_agent.dataset_registry import DatasetMetadata, dataset_owner, datasets_root, get_dataset, list_datasets
+from ..data_agent.duckdb_query import (
+    arrow_ipc_bytes,
+    estimate_total,
+    iter_query_batches,
+    run_query_arrow,
+    run_query_columnar,
+    run_query_page,
+)
+from ..data_agent.executors import run_in
+from ..data_agent.leaf_index import get_leaf_index, load_per_dim
+from ..data_agent.orchestrator import run_dataset_agent_async
+from ..data_agent.uploads import CHUNK_SIZE as UPLOAD_CHUNK_SIZE
+from ..data_agent.uploads import UploadResult, UploadSink
+from . import limits
 
 
 router = APIRouter()
@@ -22,6 +41,9 @@ class PreviewResponse(BaseModel):
     upload_id: str
     columns: List[str]
     inferred_types: Dict[str, str]
+    content_hash: Optional[str] = None
+    size_bytes: Optional[int] = None
+    compression: Optional[str] = None
 
 
 class DatasetCreateRequest(BaseModel):
@@ -37,11 +59,32 @@ class DatasetCreateResponse(BaseModel):
     dims: List[str]
     metrics: List[str]
     stats: Dict[str, Any]
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+class DatasetAppendRequest(BaseModel):
+    upload_id: str
 
 
 class FiltersRunRequest(BaseModel):
     filters: Dict[str, List[str]]
     limit: Optional[int] = None
+    # Setting either switches to keyset pagination; limit is then ignored.
+    cursor: Optional[str] = None
+    page_size: Optional[int] = None
+
+
+class AggregateRequest(BaseModel):
+    filters: Dict[str, List[str]] = {}
+    group_by: Optional[str] = None
+    order_by: Optional[str] = None
+    top_k: Optional[int] = None
+
+
+class FiltersExportRequest(BaseModel):
+    filters: Dict[str, List[str]]
+    limit: Optional[int] = None
 
 
 class AgentRunRequest(BaseModel):
@@ -49,6 +92,7 @@ class AgentRunRequest(BaseModel):
     email: Optional[str] = None
     client_id: Optional[str] = None
     session_id: Optional[str] = None
+    export_format: str = exports.DEFAULT_RESULT_FORMAT
 
 
 class DatasetSummary(BaseModel):
@@ -57,7 +101,9 @@ class DatasetSummary(BaseModel):
     dims: List[str]
     metrics: List[str]
     stats: Dict[str, Any]
-    taxonomy_yaml: str
+    # Only filled when asked for (include_yaml=true); has_taxonomy is always set.
+    taxonomy_yaml: str = ""
+    has_taxonomy: bool = False
     is_current: bool
 
 
@@ -68,106 +114,273 @@ def _uploads_dir() -> Path:
     return d
 
 
-def _user_map_path() -> Path:
-    root = datasets_root().parent
-    return root / "user_datasets.json"
-
-
-def _load_user_map() -> Dict[str, str]:
-    path = _user_map_path()
-    if not path.exists():
-        return {}
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
+def _get_user_dataset(user_id: str) -> str:
+    dataset_id = user_map.get_user_dataset(user_id)
+    if dataset_id is None:
+        raise HTTPException(status_code=404, detail="No dataset configured for this user")
+    return dataset_id
 
 
-def _save_user_map(mapping: Dict[str, str]) -> None:
-    path = _user_map_path()
-    path.write_text(json.dumps(mapping, ensure_ascii=False, indent=2), encoding="utf-8")
+def _preview_response(result: UploadResult) -> PreviewResponse:
+    return PreviewResponse(
+        upload_id=result.path.stem,
+        columns=result.columns,
+        inferred_types=result.inferred_types,
+        content_hash=result.content_hash,
+        size_bytes=result.bytes_written,
+        compression=result.compression,
+    )
 
 
-def _set_user_dataset(user_id: str, dataset_id: str) -> None:
-    mapping = _load_user_map()
-    mapping[user_id] = dataset_id
-    _save_user_map(mapping)
+async def _stream_upload(filename: str, chunks: AsyncIterator[bytes]) -> PreviewResponse:
+    upload_id = uuid.uuid4().hex
+    sink = UploadSink(dest=_uploads_dir() / f"{upload_id}.csv", filename=filename)
+    try:
+        async for chunk in chunks:
+            await run_in("io", sink.feed, chunk)
+        result = await run_in("io", sink.finish)
+    except ValueError as e:
+        await run_in("io", sink.abort)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await run_in("io", sink.abort)
+        raise
+    return _preview_response(result)
+
+
+class _MultipartFile:
+    """
+    The ``file`` field of a multipart/form-data body, parsed as it arrives.
+
+    An ``UploadFile`` parameter makes Starlette spool the whole body to a
+    temporary file before the handler runs; this feeds ``request.stream()``
+    through the multipart parser instead, so the upload reaches the sink
+    chunk by chunk.
+    """
+
+    def __init__(self, request: Request, field_name: str = "file") -> None:
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+        self.filename = ""
+        self._field_name = field_name.encode("utf-8")
+        self._body = request.stream().__aiter__()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_file = False
+        self._file_done = False
+        self._pending = bytearray()
+        self._parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
 
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if not self._file_done and options.get(b"name") == self._field_name and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+            self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._pending += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file, self._file_done = False, True
+
+    async def _pump(self) -> bool:
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            return False
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise ValueError(f"Malformed multipart body: {e}")
+        return True
+
+    async def start(self) -> str:
+        # Reads only as far as the file part's headers and returns its filename.
+        try:
+            while not (self._in_file or self._file_done):
+                if not await self._pump():
+                    raise HTTPException(status_code=400, detail="File is required")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return self.filename
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            more = not self._file_done and await self._pump()
+            if len(self._pending) >= UPLOAD_CHUNK_SIZE or (self._pending and not more):
+                chunk, self._pending = bytes(self._pending), bytearray()
+                yield chunk
+            if not more:
+                break
+        if not self._file_done:
+            raise ValueError("Upload ended before the file was complete")
+
+
+@router.post(
+    "/users/{user_id}/datasets/preview",
+    response_model=PreviewResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
+async def preview_dataset(user_id: str, request: Request) -> PreviewResponse:
+    upload = _MultipartFile(request)
+    async with limits.PREVIEW.slot():
+        filename = await upload.start()
+        if not filename:
+            raise HTTPException(status_code=400, detail="File name is required")
+        return await _stream_upload(filename, upload.chunks())
 
-def _get_user_dataset(user_id: str) -> str:
-    mapping = _load_user_map()
-    if user_id not in mapping:
-        raise HTTPException(status_code=404, detail="No dataset configured for this user")
-    return mapping[user_id]
 
+@router.post("/users/{user_id}/datasets/preview/stream", response_model=PreviewResponse)
+async def preview_dataset_stream(user_id: str, request: Request, filename: str = "") -> PreviewResponse:
+    # Raw request body (no multipart), so the upload is never spooled to a temp
+    # file first: bytes go straight from the socket into the sink.
+    async with limits.PREVIEW.slot():
+        return await _stream_upload(filename, request.stream())
 
-@router.post("/users/{user_id}/datasets/preview", response_model=PreviewResponse)
-async def preview_dataset(user_id: str, file: UploadFile = File(...)) -> PreviewResponse:
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="File name is required")
-    upload_id = uuid.uuid4().hex
-    dest = _uploads_dir() / f"{upload_id}.csv"
-    content = await file.read()
-    dest.write_bytes(content)
 
-    try:
-        df = pd.read_csv(dest, nrows=100)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Could not read CSV: {e}")
+def _on_job_succeeded(job: etl_jobs.EtlJob) -> None:
+    if job.kind == "create_dataset" and job.user_id:
+        user_map.set_user_dataset(job.user_id, job.dataset_id)
 
-    cols = list(df.columns)
-    inferred: Dict[str, str] = {}
-    for c in cols:
-        dt = df[c].dtype
-        if pd.api.types.is_numeric_dtype(dt):
-            inferred[c] = "number"
-        elif pd.api.types.is_datetime64_any_dtype(dt):
-            inferred[c] = "datetime"
-        else:
-            inferred[c] = "string"
 
-    return PreviewResponse(upload_id=upload_id, columns=cols, inferred_types=inferred)
+etl_jobs.add_listener(_on_job_succeeded)
 
 
-@router.post("/users/{user_id}/datasets", response_model=DatasetCreateResponse)
-async def create_user_dataset(user_id: str, body: DatasetCreateRequest) -> DatasetCreateResponse:
+def _submit_create_job(user_id: str, body: DatasetCreateRequest) -> DatasetCreateResponse:
     upload_path = _uploads_dir() / f"{body.upload_id}.csv"
     if not upload_path.exists():
         raise HTTPException(status_code=404, detail="Upload not found; preview may have expired")
 
     dataset_id = f"{user_id}_{int(time.time())}"
-    meta = create_dataset(
+    display_name = body.display_name or dataset_id
+    try:
+        job = etl_jobs.submit(
+            "create_dataset",
+            dataset_id,
+            {
+                "raw_file_path": str(upload_path),
+                "dims": body.dims,
+                "metrics": body.metrics,
+                "display_name": display_name,
+            },
+            user_id=user_id,
+        )
+    except etl_jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+    return DatasetCreateResponse(
         dataset_id=dataset_id,
-        raw_file_path=str(upload_path),
+        display_name=display_name,
         dims=body.dims,
         metrics=body.metrics,
-        display_name=body.display_name or dataset_id,
+        stats={},
+        job_id=job.job_id,
+        status=job.status,
     )
-    _set_user_dataset(user_id, dataset_id)
 
-    return DatasetCreateResponse(
-        dataset_id=meta.dataset_id,
-        display_name=meta.display_name or meta.dataset_id,
-        dims=meta.dims,
-        metrics=meta.metrics,
-        stats=meta.stats,
-    )
 
+@router.post("/users/{user_id}/datasets", response_model=DatasetCreateResponse, status_code=202)
+async def create_user_dataset(user_id: str, body: DatasetCreateRequest) -> DatasetCreateResponse:
+    return await run_in("io", _submit_create_job, user_id, body)
 
-@router.get("/users/{user_id}/datasets", response_model=List[DatasetSummary])
-async def list_user_datasets(user_id: str) -> List[DatasetSummary]:
-    mapping = _load_user_map()
-    current_id = mapping.get(user_id)
+
+def _owned_dataset(user_id: str, dataset_id: str) -> DatasetMetadata:
+    try:
+        meta = get_dataset(dataset_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown dataset_id")
+    if dataset_owner(meta) != user_id:
+        raise HTTPException(status_code=404, detail="Unknown dataset_id")
+    return meta
+
+
+def _submit_append_job(user_id: str, dataset_id: str, body: DatasetAppendRequest) -> Dict[str, Any]:
+    _owned_dataset(user_id, dataset_id)
+    upload_path = _uploads_dir() / f"{body.upload_id}.csv"
+    if not upload_path.exists():
+        raise HTTPException(status_code=404, detail="Upload not found; preview may have expired")
+    try:
+        job = etl_jobs.submit("append_dataset", dataset_id, {"raw_file_path": str(upload_path)}, user_id=user_id)
+    except etl_jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return {"ok": True, "dataset_id": dataset_id, "job_id": job.job_id, "status": job.status}
+
+
+@router.post("/users/{user_id}/datasets/{dataset_id}/append", status_code=202)
+async def append_user_dataset(user_id: str, dataset_id: str, body: DatasetAppendRequest) -> Dict[str, Any]:
+    return await run_in("io", _submit_append_job, user_id, dataset_id, body)
+
+
+@router.get("/users/{user_id}/jobs")
+async def list_user_jobs(user_id: str) -> List[Dict[str, Any]]:
+    jobs = await run_in("io", etl_jobs.list_jobs, user_id)
+    return [etl_jobs.job_to_dict(j) for j in jobs]
+
+
+@router.get("/users/{user_id}/jobs/{job_id}")
+async def get_user_job(user_id: str, job_id: str) -> Dict[str, Any]:
+    try:
+        job = await run_in("io", etl_jobs.get_job, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    if job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return etl_jobs.job_to_dict(job)
+
+
+def _read_yaml(meta: DatasetMetadata) -> str:
+    if meta.taxonomy_yaml_path:
+        p = Path(meta.taxonomy_yaml_path)
+        if p.exists():
+            return p.read_text(encoding="utf-8")
+    return ""
+
+
+def _list_user_datasets(user_id: str, include_yaml: bool = False) -> List[DatasetSummary]:
+    current_id = user_map.get_user_dataset(user_id)
     summaries: List[DatasetSummary] = []
-    prefix = f"{user_id}_"
-    for meta in list_datasets():
-        if not meta.dataset_id.startswith(prefix):
-            continue
-        yaml_str = ""
-        if meta.taxonomy_yaml_path:
-            p = Path(meta.taxonomy_yaml_path)
-            if p.exists():
-                yaml_str = p.read_text(encoding="utf-8")
+    for meta in list_datasets(user_id=user_id):
         summaries.append(
             DatasetSummary(
                 dataset_id=meta.dataset_id,
@@ -175,33 +388,37 @@ async def list_user_datasets(user_id: str) -> List[DatasetSummary]:
                 dims=meta.dims,
                 metrics=meta.metrics,
                 stats=meta.stats,
-                taxonomy_yaml=yaml_str,
+                taxonomy_yaml=_read_yaml(meta) if include_yaml else "",
+                has_taxonomy=bool(meta.taxonomy_yaml_path),
                 is_current=(meta.dataset_id == current_id),
             )
         )
     return summaries
 
 
-@router.get("/users/{user_id}/taxonomy")
-async def get_user_taxonomy(user_id: str) -> Dict[str, Any]:
+@router.get("/users/{user_id}/datasets", response_model=List[DatasetSummary])
+async def list_user_datasets(user_id: str, include_yaml: bool = False) -> List[DatasetSummary]:
+    async with limits.READ.slot():
+        return await run_in("io", _list_user_datasets, user_id, include_yaml)
+
+
+def _user_dataset_taxonomy(user_id: str, dataset_id: str) -> Dict[str, Any]:
+    meta = _owned_dataset(user_id, dataset_id)
+    return {"ok": True, "dataset_id": dataset_id, "taxonomy_yaml": _read_yaml(meta)}
+
+
+@router.get("/users/{user_id}/datasets/{dataset_id}/taxonomy")
+async def get_user_dataset_taxonomy(user_id: str, dataset_id: str) -> Dict[str, Any]:
+    async with limits.READ.slot():
+        return await run_in("io", _user_dataset_taxonomy, user_id, dataset_id)
+
+
+def _user_taxonomy(user_id: str) -> Dict[str, Any]:
     dataset_id = _get_user_dataset(user_id)
     meta = get_dataset(dataset_id)
 
-    yaml_str = ""
-    if meta.taxonomy_yaml_path:
-        p = Path(meta.taxonomy_yaml_path)
-        if p.exists():
-            yaml_str = p.read_text(encoding="utf-8")
-
-    per_dim: Dict[str, List[str]] = {}
-    if meta.valid_sets_path:
-        vp = Path(meta.valid_sets_path)
-        if vp.exists():
-            try:
-                vs = json.loads(vp.read_text(encoding="utf-8"))
-                per_dim = vs.get("per_dim", {}) or {}
-            except Exception:
-                per_dim = {}
+    yaml_str = _read_yaml(meta)
+    per_dim = load_per_dim(meta)
 
     return {
         "ok": True,
@@ -215,13 +432,91 @@ async def get_user_taxonomy(user_id: str) -> Dict[str, Any]:
     }
 
 
-@router.post("/users/{user_id}/run/filters")
-async def run_user_filters(user_id: str, body: FiltersRunRequest) -> Dict[str, Any]:
+@router.get("/users/{user_id}/taxonomy")
+async def get_user_taxonomy(user_id: str) -> Dict[str, Any]:
+    async with limits.READ.slot():
+        return await run_in("io", _user_taxonomy, user_id)
+
+
+def _user_taxonomy_children(user_id: str, prefix: List[str]) -> Dict[str, Any]:
     dataset_id = _get_user_dataset(user_id)
     meta = get_dataset(dataset_id)
+    index = get_leaf_index(meta)
+    if index is None:
+        raise HTTPException(status_code=409, detail="Dataset has no leaf index")
+    path = [None if v == "nan" else v.strip().lower() for v in prefix]
+    codes = index.encode(path) if len(path) < len(index.dims) else None
+    if codes is None:
+        raise HTTPException(status_code=404, detail="Unknown taxonomy prefix")
+    dim = index.dims[len(codes)]
+    child_codes, leaves, rows = index.children(codes)
+    children = [
+        {"value": index.value(dim, int(c)), "leaves": int(n), "rows": int(r)}
+        for c, n, r in zip(child_codes.tolist(), leaves.tolist(), rows.tolist())
+    ]
+    return {"ok": True, "dataset_id": dataset_id, "prefix": path, "dim": dim, "children": children}
+
+
+@router.get("/users/{user_id}/taxonomy/children")
+async def get_user_taxonomy_children(user_id: str, prefix: List[str] = Query(default=[])) -> Dict[str, Any]:
+    async with limits.READ.slot():
+        return await run_in("io", _user_taxonomy_children, user_id, prefix)
+
+
+def _user_aggregate(user_id: str, body: AggregateRequest) -> Dict[str, Any]:
+    dataset_id = _get_user_dataset(user_id)
+    meta = get_dataset(dataset_id)
+    try:
+        result = aggregate(meta, body.filters, body.group_by, body.order_by, body.top_k)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "dataset_id": dataset_id, "filters": body.filters, **result}
+
+
+@router.post("/users/{user_id}/run/aggregate")
+async def run_user_aggregate(user_id: str, body: AggregateRequest) -> Dict[str, Any]:
+    async with limits.READ.slot():
+        return await run_in("io", _user_aggregate, user_id, body)
+
+
+_ARROW_STREAM = "application/vnd.apache.arrow.stream"
+_COLUMNS_JSON = "application/vnd.baab.columns+json"
+_RESULT_FORMATS = ("rows", "columns", "arrow")
+_DEFAULT_PAGE_SIZE = 500
+_EXPORT_BATCH_ROWS = 10_000
+# Longest a result download request waits for its file to be written.
+_MAX_EXPORT_WAIT = 30.0
+
+
+def _negotiate_format(requested: Optional[str], accept: str) -> str:
+    if requested:
+        if requested not in _RESULT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(_RESULT_FORMATS)}")
+        return requested
+    accept = (accept or "").lower()
+    if _ARROW_STREAM in accept:
+        return "arrow"
+    if _COLUMNS_JSON in accept:
+        return "columns"
+    return "rows"
+
+
+def _json_response(payload: Dict[str, Any], media_type: str = "application/json", status_code: int = 200) -> Response:
+    # Serialized directly; letting FastAPI walk large row payloads through
+    # jsonable_encoder costs more than the query itself. It still renders the
+    # values json cannot (dates, decimals, UUIDs), so they read as they always did.
+    return Response(
+        content=json.dumps(payload, ensure_ascii=False, default=jsonable_encoder),
+        media_type=media_type,
+        status_code=status_code,
+    )
 
+
+def _canonical_filters(meta: DatasetMetadata, filters: Dict[str, List[str]]) -> Dict[str, List[str]]:
     filt_norm: Dict[str, List[str]] = {}
-    for dim, vals in (body.filters or {}).items():
+    for dim, vals in (filters or {}).items():
         if dim not in meta.dims:
             continue
         cleaned: List[str] = []
@@ -233,38 +528,231 @@ async def run_user_filters(user_id: str, body: FiltersRunRequest) -> Dict[str, A
                 cleaned.append(s)
         if cleaned:
             filt_norm[dim] = cleaned
+    return filt_norm
+
+
+def _run_user_filters(user_id: str, body: FiltersRunRequest, fmt: str = "rows") -> Response:
+    dataset_id = _get_user_dataset(user_id)
+    meta = get_dataset(dataset_id)
+    filt_norm = _canonical_filters(meta, body.filters)
 
     diag: Dict[str, Any] = {"requested": body.filters, "used": filt_norm}
     if not filt_norm:
-        return {
-            "ok": False,
-            "filters": body.filters,
-            "canonical_filters": {},
-            "rows": [],
-            "row_count": 0,
-            "diag": {**diag, "reason": "no_valid_filters"},
-        }
+        return _json_response(
+            {
+                "ok": False,
+                "filters": body.filters,
+                "canonical_filters": {},
+                "rows": [],
+                "row_count": 0,
+                "diag": {**diag, "reason": "no_valid_filters"},
+            }
+        )
 
-    rows, row_count = run_query(dataset_id, filt_norm, limit=body.limit, meta=meta)
-    return {
-        "ok": True,
-        "filters": body.filters,
-        "canonical_filters": filt_norm,
-        "rows": rows,
-        "row_count": row_count,
-        "diag": diag,
-    }
+    if fmt == "arrow":
+        if body.cursor or body.page_size:
+            raise HTTPException(status_code=400, detail="Pagination is not supported for arrow results")
+        try:
+            table = run_query_arrow(dataset_id, filt_norm, limit=body.limit, meta=meta)
+            content = arrow_ipc_bytes(table)
+        except RuntimeError as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        return Response(content=content, media_type=_ARROW_STREAM, headers={"X-Row-Count": str(table.num_rows)})
+
+    if body.cursor or body.page_size:
+        try:
+            page = run_query_page(
+                dataset_id, filt_norm, body.page_size or _DEFAULT_PAGE_SIZE, cursor_token=body.cursor, meta=meta
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result = page.result
+        paging = {"next_cursor": page.next_cursor, "total": page.total, "total_exact": page.total_exact}
+    else:
+        result = run_query_columnar(dataset_id, filt_norm, limit=body.limit, meta=meta)
+        total, total_exact = estimate_total(meta, filt_norm) or (None, False)
+        paging = {"total": total, "total_exact": total_exact}
+
+    payload = {"ok": True, "filters": body.filters, "canonical_filters": filt_norm}
+    if fmt == "columns":
+        return _json_response({**payload, **result.to_columns(), **paging, "diag": diag}, media_type=_COLUMNS_JSON)
+    return _json_response({**payload, "rows": result.rows(), "row_count": result.row_count, **paging, "diag": diag})
+
+
+@router.post("/users/{user_id}/run/filters")
+async def run_user_filters(
+    user_id: str,
+    body: FiltersRunRequest,
+    request: Request,
+    format: Optional[str] = None,
+) -> Response:
+    fmt = _negotiate_format(format, request.headers.get("accept", ""))
+    async with limits.FILTERS.slot():
+        return await run_in("query", _run_user_filters, user_id, body, fmt)
+
+
+def _start_export(user_id: str, body: FiltersExportRequest, fmt: str) -> Tuple[str, Iterator[bytes], bytes]:
+    dataset_id = _get_user_dataset(user_id)
+    meta = get_dataset(dataset_id)
+    filt_norm = _canonical_filters(meta, body.filters)
+    if not filt_norm:
+        raise HTTPException(status_code=400, detail="no_valid_filters")
+    encode, _ = exports.STREAM_FORMATS[fmt]
+    batches = iter_query_batches(dataset_id, filt_norm, batch_size=_EXPORT_BATCH_ROWS, limit=body.limit, meta=meta)
+    chunks = encode(batches)
+    # Pulling the first chunk here runs the query before the response starts, so
+    # errors still surface as a status code and the header goes out at once.
+    first = next(chunks, b"")
+    return dataset_id, chunks, first
+
+
+class _ExportStream:
+    """
+    Body of a streaming export, holding the EXPORT slot and the pool cursor
+    behind ``chunks``. close() gives both back exactly once, whether the body
+    was sent in full, cut off by a disconnect or never started at all.
+    """
+
+    def __init__(self, chunks: Iterator[bytes], first: bytes) -> None:
+        self._chunks = chunks
+        self._first = first
+        self._closed = False
+
+    async def body(self) -> AsyncIterator[bytes]:
+        try:
+            if self._first:
+                yield self._first
+            while True:
+                chunk = await run_in("query", next, self._chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._chunks.close()
+        except ValueError:
+            # Still running in a worker after a disconnect; it is closed when collected.
+            pass
+        limits.EXPORT.release()
+
+
+class _ExportResponse(StreamingResponse):
+    def __init__(self, stream: _ExportStream, **kwargs: Any) -> None:
+        super().__init__(stream.body(), **kwargs)
+        self._stream = stream
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        # A body generator that never started has no finally to run, so the
+        # response closes the stream itself once it is done, however it ends.
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._stream.close()
+
+
+@router.post("/users/{user_id}/run/filters/export")
+async def export_user_filters(user_id: str, body: FiltersExportRequest, format: str = "ndjson") -> StreamingResponse:
+    if format not in exports.STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(exports.STREAM_FORMATS)}")
+    limits.EXPORT.acquire()
+    try:
+        dataset_id, chunks, first = await run_in("query", _start_export, user_id, body, format)
+    except BaseException:
+        limits.EXPORT.release()
+        raise
+    stream = _ExportStream(chunks, first)
+    try:
+        _, media_type = exports.STREAM_FORMATS[format]
+        return _ExportResponse(
+            stream,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{dataset_id}.{format}"'},
+        )
+    except BaseException:
+        stream.close()
+        raise
 
 
 @router.post("/users/{user_id}/run/agent")
 async def run_user_agent(user_id: str, body: AgentRunRequest) -> Dict[str, Any]:
-    dataset_id = _get_user_dataset(user_id)
-    result = run_dataset_agent(
-        dataset_id=dataset_id,
-        natural_query=body.natural_query,
-        email=body.email,
-        client_id=body.client_id,
-        session_id=body.session_id,
-    )
+    if body.export_format not in exports.RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"export_format must be one of {', '.join(exports.RESULT_FORMATS)}")
+    async with limits.AGENT.slot():
+        dataset_id = await run_in("io", _get_user_dataset, user_id)
+        result = await run_dataset_agent_async(
+            dataset_id=dataset_id,
+            natural_query=body.natural_query,
+            email=body.email,
+            client_id=body.client_id,
+            session_id=body.session_id,
+            export_format=body.export_format,
+        )
     return result
 
+
+def _find_user_export(user_id: str, export_id: str) -> exports.ResultExport:
+    # Looked up under the dataset the run used, not the user's current one.
+    export = exports.find_result_export(export_id)
+    if export is None:
+        export = exports.find_result_export(export_id, [m.dataset_id for m in list_datasets(user_id)])
+    if export is None:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    try:
+        _owned_dataset(user_id, export.dataset_id)
+    except HTTPException:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    return export
+
+
+@router.get("/users/{user_id}/exports/{export_id}")
+async def get_user_export(user_id: str, export_id: str, wait: float = 0.0) -> Response:
+    """
+    Download a run's result file, or report its status while it is written.
+
+    ``wait`` (seconds, capped) holds the request until the file is ready, so a
+    client can fetch it as soon as it exists without polling in a tight loop.
+    """
+    async with limits.READ.slot():
+        export = await run_in("io", _find_user_export, user_id, export_id)
+        if export.status == "pending" and export.future is not None and wait > 0:
+            await asyncio.wait([asyncio.wrap_future(export.future)], timeout=min(wait, _MAX_EXPORT_WAIT))
+    if export.status == "ready":
+        return FileResponse(
+            export.path,
+            media_type=exports.RESULT_FORMATS[export.format],
+            filename=export.path.name,
+        )
+    status_code = 202 if export.status == "pending" else 500
+    return _json_response({"ok": export.status == "pending", **export.file_ref()}, status_code=status_code)
+
+
+@router.get("/query-cache/stats")
+async def get_query_cache_stats() -> Dict[str, Any]:
+    return {"ok": True, **query_cache.stats()}
+
+
+@router.get("/agent-cache/stats")
+async def get_agent_cache_stats() -> Dict[str, Any]:
+    return {"ok": True, **agent_cache_stats()}
+
+
+@router.get("/duckdb/pool/stats")
+async def get_duckdb_pool_stats() -> Dict[str, Any]:
+    return {"ok": True, **duckdb_init.pool_stats()}
+
+
+@router.get("/user-map/stats")
+async def get_user_map_stats() -> Dict[str, Any]:
+    return {"ok": True, **user_map.stats()}
+
+
+@router.get("/limits/stats")
+async def get_limit_stats() -> Dict[str, Any]:
+    return {"ok": True, **limits.stats()}
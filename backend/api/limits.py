@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import HTTPException
+
+
+class RouteLimit:
+    """
+    Non-blocking concurrency cap for one route.
+
+    Requests over the cap are rejected with 429 instead of queueing, so a burst
+    against one route cannot pile up work behind the bounded executor pools.
+    Counters are only touched from the event loop thread, so no lock is needed.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, retry_after: int = 1) -> None:
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self) -> None:
+        if self.active >= self.max_concurrent:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many concurrent {self.name} requests",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self.active, "max_concurrent": self.max_concurrent, "rejected": self.rejected}
+
+
+PREVIEW = RouteLimit("preview", 4)
+FILTERS = RouteLimit("filters", 32)
+AGENT = RouteLimit("agent", 8, retry_after=5)
+READ = RouteLimit("read", 64)
+# Streaming exports hold a DuckDB cursor for the whole transfer.
+EXPORT = RouteLimit("export", 4, retry_after=10)
+
+ALL = [PREVIEW, FILTERS, AGENT, READ, EXPORT]
+
+
+def stats() -> Dict[str, Any]:
+    return {limit.name: limit.stats() for limit in ALL}
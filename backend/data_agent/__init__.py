@@ -1,5 +1,20 @@
 from .dataset_registry import DatasetMetadata, get_dataset, save_dataset, list_datasets
-from . import taxonomy_builder, duckdb_init, duckdb_query, agent_state
+from . import (
+    agent_state,
+    aggregates,
+    duckdb_init,
+    duckdb_query,
+    etl_jobs,
+    executors,
+    exports,
+    leaf_index,
+    query_cache,
+    rollup,
+    routing_map,
+    taxonomy_builder,
+    user_map,
+    validation,
+)
 
 __all__ = [
     "DatasetMetadata",
@@ -10,5 +25,15 @@ __all__ = [
     "duckdb_init",
     "duckdb_query",
     "agent_state",
+    "leaf_index",
+    "validation",
+    "query_cache",
+    "executors",
+    "etl_jobs",
+    "exports",
+    "routing_map",
+    "aggregates",
+    "rollup",
+    "user_map",
 ]
 
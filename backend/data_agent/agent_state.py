@@ -1,6 +1,18 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import hashlib
+import json
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .dataset_registry import datasets_root
 
 
 def ensure_state(ctx: Any) -> Dict[str, Any]:
@@ -19,11 +31,149 @@ def ensure_state(ctx: Any) -> Dict[str, Any]:
     return st
 
 
-_TOOL_RUNS: List[Dict[str, Any]] = []
+_RUNS_DIRNAME = "runs"
+# Rows kept in memory per run before the buffer spills to an NDJSON file.
+_SPILL_ROWS = 20_000
+# Row digests remembered for dedup; older ones are forgotten first, so a repeat
+# of rows fetched long ago may be kept twice rather than memory growing unbounded.
+_MAX_SEEN = 200_000
+
+
+def _runs_dir() -> Path:
+    return datasets_root().parent / _RUNS_DIRNAME
+
+
+def _row_digest(row: Dict[str, Any]) -> bytes:
+    raw = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=12).digest()
+
+
+class RowBuffer:
+    """
+    Append-only row store for one run.
+
+    Rows stay in memory until ``spill_rows`` is exceeded; from then on the
+    in-memory tail is flushed to ``path`` as NDJSON whenever it fills up, so a
+    run holds at most ``spill_rows`` rows and ``max_seen`` dedup digests in
+    memory however much it queries.
+    """
+
+    def __init__(self, path: Path, spill_rows: int = _SPILL_ROWS, max_seen: int = _MAX_SEEN) -> None:
+        self.path = path
+        self.spill_rows = spill_rows
+        self.max_seen = max_seen
+        self._rows: List[Dict[str, Any]] = []
+        self._seen: "OrderedDict[bytes, int]" = OrderedDict()
+        self.spilled = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.spilled + len(self._rows)
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        # Overlapping queries return the same rows again. A row is kept only as
+        # many times as the largest single batch contained it, so repeats across
+        # queries drop out while genuinely identical source rows survive.
+        batch: Dict[bytes, List[Dict[str, Any]]] = {}
+        for r in rows:
+            if isinstance(r, dict):
+                batch.setdefault(_row_digest(r), []).append(r)
+        with self._lock:
+            for digest, same in batch.items():
+                seen = self._seen.get(digest, 0)
+                if len(same) > seen:
+                    self._rows.extend(same[seen:])
+                    self._seen[digest] = len(same)
+                self._seen.move_to_end(digest)
+                self.duplicates += min(seen, len(same))
+            while len(self._seen) > self.max_seen:
+                self._seen.popitem(last=False)
+            if len(self._rows) > self.spill_rows:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            for r in self._rows:
+                f.write(json.dumps(r, ensure_ascii=False, default=str))
+                f.write("\n")
+        self.spilled += len(self._rows)
+        self._rows = []
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._rows:
+                self._flush_locked()
+
+    def detach(self) -> "RowBuffer":
+        # Moves the rows to a new buffer owned by the caller (e.g. a background
+        # export), so closing this one at the end of the run no longer drops them.
+        with self._lock:
+            out = RowBuffer(self.path, self.spill_rows, self.max_seen)
+            out._rows, out.spilled, out.duplicates = self._rows, self.spilled, self.duplicates
+            self._rows, self._seen, self.spilled = [], OrderedDict(), 0
+        return out
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            tail = list(self._rows)
+            spilled = self.spilled
+        if spilled:
+            with self.path.open("r", encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if i >= spilled:
+                        break
+                    yield json.loads(line)
+        yield from tail
+
+    def close(self) -> None:
+        with self._lock:
+            self._rows = []
+            self._seen = OrderedDict()
+        if self.spilled:
+            shutil.rmtree(self.path.parent, ignore_errors=True)
+
+
+@dataclass
+class RunState:
+    run_id: str
+    rows: RowBuffer
+    # Summaries only: the rows go to the buffer, not into the per-tool entries.
+    entries: List[Dict[str, Any]] = field(default_factory=list)
+    # Canonical query key -> summary of the call that first fetched it.
+    queries: Dict[Tuple[Any, ...], Dict[str, Any]] = field(default_factory=dict)
 
 
-def reset_tool_runs() -> None:
-    _TOOL_RUNS.clear()
+_CURRENT_RUN: ContextVar[Optional[RunState]] = ContextVar("data_agent_run", default=None)
+
+
+@contextmanager
+def agent_run(spill_rows: int = _SPILL_ROWS) -> Iterator[RunState]:
+    # Tool calls made by the agents SDK run in tasks (or worker threads via
+    # executors.run_in) that copy this context, so they all see the same run.
+    run_id = uuid.uuid4().hex
+    run = RunState(run_id=run_id, rows=RowBuffer(_runs_dir() / run_id / "rows.ndjson", spill_rows))
+    token = _CURRENT_RUN.set(run)
+    try:
+        yield run
+    finally:
+        _CURRENT_RUN.reset(token)
+        run.rows.close()
+
+
+def current_run() -> Optional[RunState]:
+    return _CURRENT_RUN.get()
+
+
+def _note(output: Dict[str, Any]) -> str:
+    if "row_count" in output:
+        note = f"rows={output.get('row_count')}"
+        reason = (output.get("diag") or {}).get("reason")
+        return f"{note}, reason={reason}" if reason else note
+    if output.get("reason"):
+        return str(output["reason"])
+    return ", ".join(sorted(output))[:200]
 
 
 def record_tool_run(
@@ -32,36 +182,57 @@ def record_tool_run(
     output: Dict[str, Any],
     ok: bool = True,
 ) -> None:
-    entry = {
-        "tool": tool,
-        "ok": bool(ok),
-        "inputs": inputs,
-        "output": output,
-    }
-    _TOOL_RUNS.append(entry)
+    run = _CURRENT_RUN.get()
+    if run is None:
+        return
+    rows = output.get("rows") or []
+    run.entries.append(
+        {
+            "tool": tool,
+            "ok": bool(ok),
+            "inputs": inputs,
+            "row_count": len(rows),
+            "notes": _note(output),
+        }
+    )
+    if rows:
+        run.rows.extend(rows)
 
 
-def collect_rows_from_runs() -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    for entry in _TOOL_RUNS:
-        out = entry.get("output") or {}
-        rs = out.get("rows") or []
-        for r in rs:
-            if isinstance(r, dict):
-                rows.append(r)
-    return rows
+def query_key(dataset_id: str, filters: Dict[str, List[str]], *extra: Any) -> Tuple[Any, ...]:
+    # Value order and duplicates do not change the result set.
+    canon = tuple(sorted((dim, tuple(sorted({str(v) for v in vals}))) for dim, vals in filters.items()))
+    return (dataset_id, canon) + tuple(extra)
 
 
-def tool_run_notes() -> List[Dict[str, Any]]:
-    notes: List[Dict[str, Any]] = []
-    for entry in _TOOL_RUNS:
-        out = entry.get("output") or {}
-        note = {
-            "name": entry.get("tool", "unknown"),
-            "ok": bool(entry.get("ok", False)),
-            "notes": str(out)[:200],
-        }
-        notes.append(note)
-    return notes
+def lookup_query(key: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+    run = _CURRENT_RUN.get()
+    if run is None:
+        return None
+    return run.queries.get(key)
+
+
+def remember_query(key: Tuple[Any, ...], summary: Dict[str, Any]) -> str:
+    run = _CURRENT_RUN.get()
+    if run is None:
+        return ""
+    entry = run.queries.setdefault(key, {**summary, "ref": f"q{len(run.queries) + 1}"})
+    return entry["ref"]
+
+
+def iter_rows_from_runs() -> Iterator[Dict[str, Any]]:
+    run = _CURRENT_RUN.get()
+    if run is None:
+        return iter(())
+    return iter(run.rows)
 
 
+def collect_rows_from_runs() -> List[Dict[str, Any]]:
+    return list(iter_rows_from_runs())
+
+
+def tool_run_notes() -> List[Dict[str, Any]]:
+    run = _CURRENT_RUN.get()
+    if run is None:
+        return []
+    return [{"name": e["tool"], "ok": e["ok"], "notes": e["notes"]} for e in run.entries]
@@ -1,14 +1,27 @@
 from __future__ import annotations
 
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from agents import Agent, Runner, RunContextWrapper, function_tool  # type: ignore[import]
+from agents import Agent, RunContextWrapper, function_tool  # type: ignore[import]
 
-from .agent_state import collect_rows_from_runs, ensure_state, record_tool_run
+from .agent_state import ensure_state, lookup_query, query_key, record_tool_run, remember_query
+from .aggregates import aggregate
 from .dataset_registry import DatasetMetadata, get_dataset
-from .duckdb_query import run_query
+from .duckdb_query import run_query, run_query_page, run_query_slices
+from .executors import run_in
+from .leaf_index import get_leaf_index
+from .routing_map import DEFAULT_TOKEN_BUDGET, compile_routing_map
+from .validation import validate_and_backoff
+
+
+_DEFAULT_PAGE_SIZE = 200
+_SUBTREE_TOKEN_BUDGET = 2000
+_AGENT_CACHE_SIZE = 64
+_MAX_SLICES = 50
 
 
 def _load_text(path: Optional[str]) -> str:
@@ -26,8 +39,16 @@ def _load_taxonomy_yaml(meta: DatasetMetadata) -> str:
     return _load_text(meta.taxonomy_yaml_path)
 
 
-def _build_system_prompt(meta: DatasetMetadata) -> str:
-    yaml_str = _load_taxonomy_yaml(meta)
+def _routing_map(meta: DatasetMetadata, token_budget: int) -> str:
+    index = get_leaf_index(meta)
+    if index is not None:
+        return compile_routing_map(index, meta.dataset_id, token_budget=token_budget) or ""
+    # Datasets without any leaf index only have the full YAML to offer.
+    return _load_taxonomy_yaml(meta)
+
+
+def _build_system_prompt(meta: DatasetMetadata, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    yaml_str = _routing_map(meta, token_budget)
     dims = ", ".join(meta.dims)
     metrics = ", ".join(meta.metrics) or "none"
     header = (
@@ -41,17 +62,16 @@ def _build_system_prompt(meta: DatasetMetadata) -> str:
     return header
 
 
-@function_tool(strict_mode=False)  # type: ignore[misc]
-def DatasetQuery(
-    ctx: RunContextWrapper[Any],
-    dataset_id: str,
+def _canonical_query_filters(
+    meta: DatasetMetadata,
     filters: Dict[str, List[str]],
-    limit: Optional[int] = None,
-) -> Dict[str, Any]:
-    st = ensure_state(ctx)
-    meta = get_dataset(dataset_id)
+) -> Tuple[Dict[str, List[str]], Dict[str, Any]]:
+    index = get_leaf_index(meta)
+    if index is not None:
+        _, filt_norm, diag = validate_and_backoff(filters or {}, index, meta.dims)
+        return filt_norm, diag
 
-    filt_norm: Dict[str, List[str]] = {}
+    filt_norm = {}
     for dim, vals in (filters or {}).items():
         if dim not in meta.dims:
             continue
@@ -64,10 +84,25 @@ def DatasetQuery(
                 cleaned.append(s)
         if cleaned:
             filt_norm[dim] = cleaned
-
-    diag: Dict[str, Any] = {"requested": filters, "used": filt_norm}
+    diag = {"requested": filters, "used": filt_norm}
     if not filt_norm:
         diag["reason"] = "no_valid_filters"
+    return filt_norm, diag
+
+
+def _dataset_query(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    st = ensure_state(ctx)
+    meta = get_dataset(dataset_id)
+    filt_norm, diag = _canonical_query_filters(meta, filters)
+
+    if not filt_norm:
+        reason = diag.get("reason") or "no_valid_filters"
         out = {
             "ok": False,
             "filters": filters,
@@ -76,11 +111,57 @@ def DatasetQuery(
             "row_count": 0,
             "diag": diag,
         }
-        st["tools_run"].append({"name": "DatasetQuery", "ok": False, "notes": "no_valid_filters"})
+        st["tools_run"].append({"name": "DatasetQuery", "ok": False, "notes": reason})
         record_tool_run("DatasetQuery", {"filters": filters}, out, ok=False)
         return out
 
-    rows, row_count = run_query(dataset_id, filt_norm, limit=limit, meta=meta)
+    # Repeats of a query already answered in this run (any casing or value order)
+    # get a short reference instead of the same rows again.
+    key = query_key(dataset_id, filt_norm, limit, cursor)
+    seen = lookup_query(key)
+    if seen is not None:
+        note = f"already fetched, {seen['row_count']} rows, ref={seen['ref']}"
+        out = {
+            "ok": True,
+            "cached": True,
+            "ref": seen["ref"],
+            "filters": filters,
+            "canonical_filters": filt_norm,
+            "rows": [],
+            "row_count": seen["row_count"],
+            **seen.get("paging", {}),
+            "note": note,
+            "diag": diag,
+        }
+        st["tools_run"].append({"name": "DatasetQuery", "ok": True, "notes": note})
+        record_tool_run("DatasetQuery", {"filters": filters}, out, ok=True)
+        return out
+
+    # A limit or cursor switches to stable keyset pages; next_cursor fetches the
+    # following page and total reports the full match count. A backed-off query
+    # can match far more than was asked for, so it is always paged.
+    paging: Dict[str, Any] = {}
+    widened = diag.get("backoff_level") not in (None, "exact")
+    if limit or cursor or widened:
+        try:
+            page = run_query_page(dataset_id, filt_norm, limit or _DEFAULT_PAGE_SIZE, cursor_token=cursor, meta=meta)
+        except ValueError as e:
+            out = {
+                "ok": False,
+                "filters": filters,
+                "canonical_filters": filt_norm,
+                "rows": [],
+                "row_count": 0,
+                "diag": {**diag, "reason": str(e)},
+            }
+            st["tools_run"].append({"name": "DatasetQuery", "ok": False, "notes": str(e)})
+            record_tool_run("DatasetQuery", {"filters": filters}, out, ok=False)
+            return out
+        rows = page.result.rows()
+        row_count = len(rows)
+        paging = {"next_cursor": page.next_cursor, "total": page.total, "total_exact": page.total_exact}
+    else:
+        rows, row_count = run_query(dataset_id, filt_norm, meta=meta)
 
     for r in rows:
         r.setdefault("source", "dataset")
@@ -104,16 +185,193 @@ def DatasetQuery(
 
     out = {
         "ok": True,
+        "ref": remember_query(key, {"row_count": row_count, "paging": paging}),
         "filters": filters,
         "canonical_filters": filt_norm,
         "rows": rows,
         "row_count": row_count,
+        **paging,
         "diag": diag,
     }
     record_tool_run("DatasetQuery", {"filters": filters}, out, ok=True)
     return out
 
 
+@function_tool(strict_mode=False)  # type: ignore[misc]
+async def DatasetQuery(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    # The agent loop runs on the event loop; DuckDB work goes to the query pool.
+    return await run_in("query", _dataset_query, ctx, dataset_id, filters, limit, cursor)
+
+
+def _record_slice(
+    st: Dict[str, Any],
+    dataset_id: str,
+    answer: Dict[str, Any],
+    key: Tuple[Any, ...],
+    rows: List[Dict[str, Any]],
+    paging: Dict[str, Any],
+) -> None:
+    for r in rows:
+        r.setdefault("source", "dataset")
+        r.setdefault("slice", answer["name"])
+    answer.update(rows=rows, row_count=len(rows), **paging)
+    answer["ref"] = remember_query(key, {"row_count": len(rows), "paging": paging})
+    filters_json = json.dumps(answer["canonical_filters"], ensure_ascii=False)
+    st["query_log"].append(f"DatasetQueryBatch slice={answer['name']} filters={filters_json}")
+    st["results"].append({"tool": "DatasetQueryBatch", "dataset_id": dataset_id, **answer})
+    record_tool_run("DatasetQueryBatch", {"slice": answer["name"]}, answer, ok=True)
+
+
+def _dataset_query_batch(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    slices: List[Dict[str, Any]],
+    limit_per_slice: Optional[int] = None,
+) -> Dict[str, Any]:
+    st = ensure_state(ctx)
+    meta = get_dataset(dataset_id)
+    if len(slices or []) > _MAX_SLICES:
+        out = {"ok": False, "slices": [], "row_count": 0, "reason": f"at most {_MAX_SLICES} slices per call"}
+        st["tools_run"].append({"name": "DatasetQueryBatch", "ok": False, "notes": out["reason"]})
+        return out
+
+    answers: List[Dict[str, Any]] = []
+    pending: List[Tuple[Dict[str, Any], Tuple[Any, ...]]] = []
+    widened: List[Tuple[Dict[str, Any], Tuple[Any, ...]]] = []
+    for i, sl in enumerate(slices or []):
+        name = str(sl.get("name") or f"slice_{i + 1}")
+        filters = sl.get("filters") or {}
+        filt_norm, diag = _canonical_query_filters(meta, filters)
+        answer: Dict[str, Any] = {
+            "name": name,
+            "ok": bool(filt_norm),
+            "filters": filters,
+            "canonical_filters": filt_norm,
+            "rows": [],
+            "row_count": 0,
+            "diag": diag,
+        }
+        answers.append(answer)
+        if not filt_norm:
+            continue
+        key = query_key(dataset_id, filt_norm, limit_per_slice, None)
+        seen = lookup_query(key)
+        if seen is not None:
+            answer.update(cached=True, ref=seen["ref"], row_count=seen["row_count"], **seen.get("paging", {}))
+            answer["note"] = f"already fetched, {seen['row_count']} rows, ref={seen['ref']}"
+            continue
+        if diag.get("backoff_level") not in (None, "exact"):
+            widened.append((answer, key))
+        else:
+            pending.append((answer, key))
+
+    # All slices that still need data go to DuckDB as a single UNION ALL.
+    if pending:
+        results = run_query_slices(
+            dataset_id, [a["canonical_filters"] for a, _ in pending], limit_per_slice=limit_per_slice, meta=meta
+        )
+        for (answer, key), result in zip(pending, results):
+            _record_slice(st, dataset_id, answer, key, result.rows(), {})
+    # A backed-off slice can match far more than was asked for, so as in
+    # DatasetQuery it is paged; DatasetQuery(cursor=next_cursor) continues it.
+    for answer, key in widened:
+        page = run_query_page(dataset_id, answer["canonical_filters"], limit_per_slice or _DEFAULT_PAGE_SIZE, meta=meta)
+        paging = {
+            "truncated": page.next_cursor is not None,
+            "next_cursor": page.next_cursor,
+            "total": page.total,
+            "total_exact": page.total_exact,
+        }
+        _record_slice(st, dataset_id, answer, key, page.result.rows(), paging)
+
+    row_count = sum(a["row_count"] for a in answers if not a.get("cached"))
+    st["diag"]["counts"]["rows_total"] = st["diag"]["counts"].get("rows_total", 0) + row_count
+    st["tools_run"].append(
+        {
+            "name": "DatasetQueryBatch",
+            "ok": any(a["ok"] for a in answers),
+            "notes": f"slices={len(answers)}, queried={len(pending) + len(widened)}, rows={row_count}",
+        }
+    )
+    return {"ok": any(a["ok"] for a in answers), "slices": answers, "row_count": row_count}
+
+
+@function_tool(strict_mode=False)  # type: ignore[misc]
+async def DatasetQueryBatch(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    slices: List[Dict[str, Any]],
+    limit_per_slice: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Run several named filter sets at once; slices is a list of {"name": ..., "filters": {dim: [values]}}."""
+    return await run_in("query", _dataset_query_batch, ctx, dataset_id, slices, limit_per_slice)
+
+
+@function_tool(strict_mode=False)  # type: ignore[misc]
+def DatasetAggregate(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    filters: Optional[Dict[str, List[str]]] = None,
+    group_by: Optional[str] = None,
+    order_by: Optional[str] = None,
+    top_k: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Row counts and metric sums under filters, optionally grouped by one dim and
+    ranked (top_k) by rows or a metric.
+    """
+    st = ensure_state(ctx)
+    meta = get_dataset(dataset_id)
+    try:
+        out = {"ok": True, **aggregate(meta, filters or {}, group_by, order_by, top_k)}
+    except (LookupError, ValueError) as e:
+        out = {"ok": False, "reason": str(e)}
+    notes = f"rows={out['total']['rows']}, group_by={group_by}" if out["ok"] else out["reason"]
+    st["tools_run"].append({"name": "DatasetAggregate", "ok": out["ok"], "notes": notes})
+    record_tool_run("DatasetAggregate", {"filters": filters, "group_by": group_by}, out, ok=out["ok"])
+    return out
+
+
+def _routing_subtree(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    prefix: List[str],
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    st = ensure_state(ctx)
+    meta = get_dataset(dataset_id)
+    index = get_leaf_index(meta)
+    path = [None if v is None else str(v).strip().lower() for v in (prefix or [])]
+    text = None
+    if index is not None and len(path) <= len(index.dims):
+        budget = min(int(token_budget or _SUBTREE_TOKEN_BUDGET), _SUBTREE_TOKEN_BUDGET)
+        text = compile_routing_map(index, dataset_id, token_budget=budget, prefix=path)
+    ok = text is not None
+    notes = f"prefix={path}" if ok else f"no leaves under prefix={path}"
+    st["tools_run"].append({"name": "RoutingSubtree", "ok": ok, "notes": notes})
+    out = {"ok": ok, "prefix": path, "routing": text or ""}
+    if not ok:
+        out["reason"] = "unknown_prefix" if index is not None else "no_leaf_index"
+    return out
+
+
+@function_tool(strict_mode=False)  # type: ignore[misc]
+async def RoutingSubtree(
+    ctx: RunContextWrapper[Any],
+    dataset_id: str,
+    prefix: List[str],
+    token_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """List the taxonomy values under a path of dim values, given in dim order."""
+    return await run_in("query", _routing_subtree, ctx, dataset_id, prefix, token_budget)
+
+
 @function_tool(strict_mode=False)  # type: ignore[misc]
 def SetSummary(
     ctx: RunContextWrapper[Any],
@@ -157,9 +415,9 @@ def ReturnState(ctx: RunContextWrapper[Any]) -> Dict[str, Any]:
     return {"summary": summary, "payload": payload}
 
 
-def build_agent(dataset_id: str) -> Agent:
+def build_agent(dataset_id: str, routing_token_budget: int = DEFAULT_TOKEN_BUDGET) -> Agent:
     meta = get_dataset(dataset_id)
-    system_prompt = _build_system_prompt(meta)
+    system_prompt = _build_system_prompt(meta, routing_token_budget)
     dev_prompt = _load_text(meta.prompt_dev_path)
     instructions = system_prompt
     if dev_prompt:
@@ -168,7 +426,105 @@ def build_agent(dataset_id: str) -> Agent:
         name=f"DatasetAgent_{dataset_id}",
         model="gpt-5.1",
         instructions=instructions,
-        tools=[DatasetQuery, SetSummary, ReturnState],
+        tools=[
+            DatasetQuery,
+            DatasetQueryBatch,
+            DatasetAggregate,
+            RoutingSubtree,
+            SetSummary,
+            ReturnState,
+        ],
     )
 
 
+def _mtime(path: Optional[str]) -> Optional[int]:
+    if not path:
+        return None
+    try:
+        return Path(path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _agent_stamp(meta: DatasetMetadata) -> Tuple[Any, ...]:
+    # Everything the instructions are built from; a rebuild bumps routing_version
+    # and rewrites the index, and prompt edits change the prompt file mtimes.
+    index_dict = str(Path(meta.leaf_index_path) / "dictionary.json") if meta.leaf_index_path else None
+    return (
+        meta.routing_version,
+        _mtime(index_dict),
+        _mtime(meta.valid_sets_path),
+        _mtime(meta.taxonomy_yaml_path),
+        _mtime(meta.prompt_system_path),
+        _mtime(meta.prompt_dev_path),
+        tuple(meta.dims),
+        tuple(meta.metrics),
+    )
+
+
+class AgentCache:
+    def __init__(self, max_entries: int = _AGENT_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[Tuple[Any, ...], Agent]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, dataset_id: str, routing_token_budget: int = DEFAULT_TOKEN_BUDGET) -> Agent:
+        meta = get_dataset(dataset_id)
+        stamp = _agent_stamp(meta)
+        key = (dataset_id, routing_token_budget)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self.stale += 1
+
+        # Built outside the lock; a racing build for the same key just wins last.
+        agent = build_agent(dataset_id, routing_token_budget)
+        with self._lock:
+            self._entries[key] = (stamp, agent)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return agent
+
+    def invalidate(self, dataset_id: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if dataset_id is None or k[0] == dataset_id]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+            }
+
+
+_AGENTS = AgentCache()
+
+
+def get_agent(dataset_id: str, routing_token_budget: int = DEFAULT_TOKEN_BUDGET) -> Agent:
+    return _AGENTS.get(dataset_id, routing_token_budget)
+
+
+def invalidate_agents(dataset_id: Optional[str] = None) -> int:
+    return _AGENTS.invalidate(dataset_id)
+
+
+def agent_cache_stats() -> Dict[str, Any]:
+    return _AGENTS.stats()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .dataset_registry import DatasetMetadata
+from .leaf_index import NULL_CODE, LeafIndex, get_leaf_index, sample_scale
+from .validation import canonicalize
+
+
+_DEFAULT_TOP_K = 20
+_MAX_TOP_K = 500
+
+
+def _sums(index: LeafIndex, values: np.ndarray, scale: float) -> Dict[str, float]:
+    return {m: float(values[i]) * scale for i, m in enumerate(index.metrics)}
+
+
+def aggregate_index(
+    index: LeafIndex,
+    filters: Dict[str, List[Any]],
+    group_by: Optional[str] = None,
+    order_by: Optional[str] = None,
+    top_k: Optional[int] = None,
+    scale: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    Answer count / sum / top-k questions from the leaf index alone.
+
+    ``filters`` select leaves exactly (no backoff); ``group_by`` rolls the
+    selected leaves up to one dim and ``order_by`` ("rows" or a metric) ranks
+    the groups, keeping ``top_k``. Row counts and sums from a sample-built
+    index are multiplied by ``scale``.
+    """
+    canonical, notes = canonicalize(filters, index)
+    if notes["unknown_dims"]:
+        raise ValueError(f"Unknown filter dims: {', '.join(notes['unknown_dims'])}")
+    constraints = index.constraints(canonical)
+    # A dim whose requested values all failed to resolve matches nothing; it must
+    # not silently drop out of the filter and widen the selection.
+    if any(d not in canonical for d in notes["dropped_values"]):
+        constraints = {0: []}
+    leaves, rows, totals = index.totals(constraints)
+
+    out: Dict[str, Any] = {
+        "canonical_filters": canonical,
+        "total": {"leaves": leaves, "rows": int(round(rows * scale)), "sums": _sums(index, totals, scale)},
+        **notes,
+    }
+    if group_by is None:
+        return out
+    group_by = group_by.strip().lower()
+    if group_by not in index.dims:
+        raise ValueError(f"Unknown group_by dim: {group_by}")
+    order_by = (order_by or "rows").strip().lower()
+    if order_by != "rows" and order_by not in index.metrics:
+        raise ValueError(f"order_by must be 'rows' or one of the metrics: {', '.join(index.metrics)}")
+
+    # Codes per dim are dense (0 = null, 1..n = values), so grouping the selected
+    # leaves is a weighted bincount rather than a hash aggregation.
+    depth = index.dims.index(group_by)
+    pos = index.positions(index.select(constraints))
+    codes = np.asarray(index.codes[pos, depth])
+    n_codes = len(index.per_dim.get(group_by, [])) + 1
+    group_rows = np.bincount(codes, weights=np.asarray(index.rows[pos], dtype=np.float64), minlength=n_codes)
+    group_sums = np.zeros((n_codes, len(index.metrics)), dtype=np.float64)
+    if index.metrics:
+        metric_vals = np.nan_to_num(np.asarray(index.metric_sums[pos], dtype=np.float64))
+        for i in range(len(index.metrics)):
+            group_sums[:, i] = np.bincount(codes, weights=metric_vals[:, i], minlength=n_codes)
+
+    present = np.flatnonzero(np.bincount(codes, minlength=n_codes))
+    key = group_rows if order_by == "rows" else group_sums[:, index.metrics.index(order_by)]
+    ranked = present[np.argsort(-key[present], kind="stable")]
+    k = min(int(top_k or _DEFAULT_TOP_K), _MAX_TOP_K)
+    groups = [
+        {
+            "value": None if int(c) == NULL_CODE else index.value(group_by, int(c)),
+            "rows": int(round(group_rows[c] * scale)),
+            "sums": _sums(index, group_sums[c], scale),
+        }
+        for c in ranked[:k]
+    ]
+    out.update(group_by=group_by, order_by=order_by, groups=groups, groups_total=int(present.size))
+    return out
+
+
+def aggregate(
+    meta: DatasetMetadata,
+    filters: Dict[str, List[Any]],
+    group_by: Optional[str] = None,
+    order_by: Optional[str] = None,
+    top_k: Optional[int] = None,
+) -> Dict[str, Any]:
+    index = get_leaf_index(meta)
+    if index is None:
+        raise LookupError(f"Dataset {meta.dataset_id} has no leaf index")
+    scale = sample_scale(meta, index)
+    out = aggregate_index(index, filters, group_by, order_by, top_k, scale=scale or 1.0)
+    out["exact"] = not index.sampled
+    if scale is None and not index.counted:
+        out["note"] = "index predates row counts; counts are distinct value combinations"
+    elif scale is None:
+        out["note"] = "index was built from a sample of unknown size; counts cover the sample only"
+    return out
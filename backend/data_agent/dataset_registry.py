@@ -1,23 +1,30 @@
 from __future__ import annotations
 
 import json
+import sqlite3
+import threading
+import time
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 
 _DATASET_ROOT_DIRNAME = "data_agent"
 _DATASET_SUBDIR = "datasets"
+_REGISTRY_FILENAME = "registry.sqlite3"
+_BUSY_TIMEOUT_MS = 5000
 
 
 @dataclass
 class DatasetMetadata:
     dataset_id: str
     display_name: Optional[str] = None
+    user_id: Optional[str] = None
     raw_path: Optional[str] = None
     normalized_path: Optional[str] = None
     taxonomy_yaml_path: Optional[str] = None
     valid_sets_path: Optional[str] = None
+    leaf_index_path: Optional[str] = None
     dims: List[str] = field(default_factory=list)
     metrics: List[str] = field(default_factory=list)
     retrievable_columns: List[str] = field(default_factory=list)
@@ -26,10 +33,16 @@ class DatasetMetadata:
     prompt_dev_path: Optional[str] = None
     created_at: Optional[str] = None
     routing_version: Optional[str] = None
+    storage_format: Optional[str] = None
+    duckdb_path: Optional[str] = None
+    # Normalized Parquet parts appended after the initial build, oldest first.
+    delta_paths: List[str] = field(default_factory=list)
     extra: Dict[str, Any] = field(default_factory=dict)
 
 
-_CACHE: Dict[str, DatasetMetadata] = {}
+# Keyed by dataset_id; the metadata.json mtime catches rewrites from another
+# worker process or a finished ETL job.
+_CACHE: Dict[str, Tuple[int, DatasetMetadata]] = {}
 
 
 def _project_root() -> Path:
@@ -52,45 +65,156 @@ def _metadata_path(dataset_id: str) -> Path:
     return dataset_dir(dataset_id) / "metadata.json"
 
 
+def _load_metadata(path: Path) -> Tuple[int, DatasetMetadata]:
+    stamp = path.stat().st_mtime_ns
+    with path.open("r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return stamp, DatasetMetadata(**raw)
+
+
 def get_dataset(dataset_id: str) -> DatasetMetadata:
-    if dataset_id in _CACHE:
-        return _CACHE[dataset_id]
     path = _metadata_path(dataset_id)
-    if not path.exists():
+    try:
+        stamp = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        _CACHE.pop(dataset_id, None)
         raise KeyError(f"Unknown dataset_id: {dataset_id}")
-    with path.open("r", encoding="utf-8") as f:
-        raw = json.load(f)
-    meta = DatasetMetadata(**raw)
-    _CACHE[dataset_id] = meta
-    return meta
+    cached = _CACHE.get(dataset_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    entry = _load_metadata(path)
+    _CACHE[dataset_id] = entry
+    return entry[1]
 
 
 def save_dataset(meta: DatasetMetadata) -> None:
     data = asdict(meta)
     path = _metadata_path(meta.dataset_id)
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
+    # Written to a temp file and swapped in so readers never see a partial file.
+    tmp = path.with_suffix(".json.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
-    _CACHE[meta.dataset_id] = meta
-
-
-def list_datasets() -> List[DatasetMetadata]:
+    tmp.replace(path)
+    stamp = path.stat().st_mtime_ns
+    _CACHE[meta.dataset_id] = (stamp, meta)
+    conn = _registry()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _upsert(conn, meta, data, stamp)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# metadata.json stays the source of truth for a dataset; the SQLite registry is
+# an index over all of them so listing never walks the datasets directory.
+_REGISTRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    display_name TEXT,
+    routing_version TEXT,
+    meta_mtime_ns INTEGER NOT NULL,
+    meta_json TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS datasets_by_user ON datasets (user_id, dataset_id);
+CREATE TABLE IF NOT EXISTS registry_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_LOCAL = threading.local()
+
+
+def _registry_path() -> Path:
+    return datasets_root().parent / _REGISTRY_FILENAME
+
+
+def dataset_owner(meta: DatasetMetadata) -> Optional[str]:
+    if meta.user_id:
+        return meta.user_id
+    # Datasets created before user_id was stored are named "<user_id>_<unix time>".
+    head, sep, tail = meta.dataset_id.rpartition("_")
+    return head if sep and tail.isdigit() else None
+
+
+def _upsert(conn: sqlite3.Connection, meta: DatasetMetadata, data: Dict[str, Any], stamp: int) -> None:
+    conn.execute(
+        "INSERT INTO datasets (dataset_id, user_id, display_name, routing_version, "
+        "meta_mtime_ns, meta_json, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (dataset_id) DO UPDATE SET user_id = excluded.user_id, "
+        "display_name = excluded.display_name, routing_version = excluded.routing_version, "
+        "meta_mtime_ns = excluded.meta_mtime_ns, meta_json = excluded.meta_json, "
+        "updated_at = excluded.updated_at",
+        (
+            meta.dataset_id,
+            dataset_owner(meta),
+            meta.display_name,
+            meta.routing_version,
+            stamp,
+            json.dumps(data, ensure_ascii=False),
+            time.time(),
+        ),
+    )
+
+
+def _backfill(conn: sqlite3.Connection) -> None:
+    # One-time import of datasets written before the registry existed.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM registry_state WHERE key = 'backfilled'").fetchone() is None:
+            for child in datasets_root().iterdir():
+                meta_path = child / "metadata.json"
+                if not meta_path.is_file():
+                    continue
+                try:
+                    stamp, meta = _load_metadata(meta_path)
+                except Exception:
+                    continue
+                _upsert(conn, meta, asdict(meta), stamp)
+            conn.execute("INSERT INTO registry_state (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _registry() -> sqlite3.Connection:
+    # One connection per thread; WAL lets readers in other workers proceed while
+    # one of them writes.
+    path = _registry_path()
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None and getattr(_LOCAL, "path", None) == path:
+        return conn
+    conn = sqlite3.connect(str(path), isolation_level=None, timeout=_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+    conn.executescript(_REGISTRY_SCHEMA)
+    _backfill(conn)
+    _LOCAL.conn, _LOCAL.path = conn, path
+    return conn
+
+
+def list_datasets(user_id: Optional[str] = None) -> List[DatasetMetadata]:
+    conn = _registry()
+    if user_id is None:
+        cur = conn.execute("SELECT meta_mtime_ns, meta_json FROM datasets ORDER BY dataset_id")
+    else:
+        cur = conn.execute(
+            "SELECT meta_mtime_ns, meta_json FROM datasets WHERE user_id = ? ORDER BY dataset_id", (user_id,)
+        )
     out: List[DatasetMetadata] = []
-    root = datasets_root()
-    for child in root.iterdir():
-        if not child.is_dir():
-            continue
-        meta_path = child / "metadata.json"
-        if not meta_path.exists():
-            continue
+    for stamp, raw in cur.fetchall():
         try:
-            with meta_path.open("r", encoding="utf-8") as f:
-                raw = json.load(f)
-            meta = DatasetMetadata(**raw)
-            _CACHE[meta.dataset_id] = meta
-            out.append(meta)
+            meta = DatasetMetadata(**json.loads(raw))
         except Exception:
             continue
+        cached = _CACHE.get(meta.dataset_id)
+        if cached is None or cached[0] < stamp:
+            _CACHE[meta.dataset_id] = (stamp, meta)
+        out.append(meta)
     return out
 
 
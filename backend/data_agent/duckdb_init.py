@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, List
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import duckdb
 
@@ -16,9 +21,24 @@ class DuckdbHandle:
     table_name: str
     dims: List[str]
     retrievable_columns: List[str]
+    size_bytes: int = 0
+    last_used: float = 0.0
+    in_use: int = 0
+    retired: bool = False
+    # Stable, file-order row id used as the keyset for pagination; "rowid" for
+    # datasets built before _row_id_ was materialized.
+    row_id: str = "rowid"
+    # The dataset version the connection was opened for; appends and rebuilds
+    # bump it, and a stale handle is reopened on its next checkout.
+    routing_version: Optional[str] = None
 
 
-_HANDLES: Dict[str, DuckdbHandle] = {}
+_DEFAULT_THREADS = 4
+_DEFAULT_MEMORY_LIMIT = "512MB"
+_DEFAULT_POOL_MAX_BYTES = 4 * 1024 * 1024 * 1024
+_DEFAULT_IDLE_SECONDS = 15 * 60
+
+ROW_ID_COLUMN = "_row_id_"
 
 
 def _safe_table_name(dataset_id: str) -> str:
@@ -28,38 +48,285 @@ def _safe_table_name(dataset_id: str) -> str:
     return s or "dataset"
 
 
-def get_handle(meta: DatasetMetadata) -> DuckdbHandle:
-    if meta.dataset_id in _HANDLES:
-        return _HANDLES[meta.dataset_id]
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def storage_format(meta: DatasetMetadata) -> str:
+    return meta.storage_format or "csv"
+
+
+def _source_sql(meta: DatasetMetadata, with_row_id: bool = False) -> str:
     if not meta.normalized_path:
         raise ValueError("DatasetMetadata.normalized_path is required for DuckDB init")
+    path = sql_string(meta.normalized_path)
+    fmt = storage_format(meta)
+    if fmt == "parquet":
+        if with_row_id:
+            base = (
+                f"SELECT * EXCLUDE (file_row_number), file_row_number AS {ROW_ID_COLUMN} "
+                f"FROM read_parquet({path}, file_row_number = true)"
+            )
+        else:
+            base = f"SELECT * FROM read_parquet({path})"
+        if not meta.delta_paths:
+            return f"({base})" if with_row_id else f"read_parquet({path})"
+        delta = _delta_source(meta)
+        delta_sql = f"SELECT * FROM {delta}" if with_row_id else f"SELECT * EXCLUDE ({ROW_ID_COLUMN}) FROM {delta}"
+        return f"({base} UNION ALL BY NAME {delta_sql})"
+    if fmt == "csv":
+        return f"read_csv_auto({path}, header=True)"
+    raise ValueError(f"Unsupported storage_format: {fmt}")
+
+
+def _delta_source(meta: DatasetMetadata) -> str:
+    # Appended parts carry their own _row_id_, numbered on after the main file.
+    parts = "[" + ", ".join(sql_string(p) for p in meta.delta_paths) + "]"
+    return f"read_parquet({parts}, union_by_name = true)"
+
+
+def _open_connection(meta: DatasetMetadata, table_name: str) -> duckdb.DuckDBPyConnection:
+    if meta.duckdb_path and Path(meta.duckdb_path).exists():
+        if not meta.delta_paths:
+            return duckdb.connect(database=meta.duckdb_path, read_only=True)
+        # Appended parts are layered over the file rather than written into it, so
+        # the file is only ever opened read-only, by any number of processes.
+        conn = duckdb.connect(database=":memory:")
+        try:
+            conn.execute(f"ATTACH {sql_string(meta.duckdb_path)} AS base (READ_ONLY)")
+            base = f"base.{table_name}"
+            delta = _delta_source(meta)
+            columns = [d[0] for d in conn.execute(f"SELECT * FROM {base} LIMIT 0").description]
+            delta_columns = {d[0] for d in conn.execute(f"SELECT * FROM {delta} LIMIT 0").description}
+            select = ", ".join(quote_ident(c) for c in columns if c in delta_columns)
+            conn.execute(
+                f"CREATE VIEW {table_name} AS SELECT * FROM {base} UNION ALL BY NAME SELECT {select} FROM {delta}"
+            )
+        except Exception:
+            conn.close()
+            raise
+        return conn
 
+    source = _source_sql(meta, with_row_id=True)
     conn = duckdb.connect(database=":memory:")
+    if storage_format(meta) == "parquet":
+        # Views cannot take bound parameters, so the path is inlined as a literal.
+        conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM {source}")
+    else:
+        conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {source}")
+    return conn
+
+
+def _row_id_column(conn: duckdb.DuckDBPyConnection, table_name: str) -> str:
+    columns = {d[0] for d in conn.execute(f"SELECT * FROM {table_name} LIMIT 0").description}
+    return ROW_ID_COLUMN if ROW_ID_COLUMN in columns else "rowid"
+
+
+def build_database(meta: DatasetMetadata, path: Path) -> None:
+    source = _source_sql(meta, with_row_id=True)
     table_name = _safe_table_name(meta.dataset_id)
-    conn.execute(
-        f"CREATE TABLE {table_name} AS SELECT * FROM read_csv_auto(?, header=True)",
-        [meta.normalized_path],
-    )
-
-    dims = list(meta.dims)
-    retr = list(meta.retrievable_columns or (meta.dims + meta.metrics))
-    handle = DuckdbHandle(
-        dataset_id=meta.dataset_id,
-        conn=conn,
-        table_name=table_name,
-        dims=dims,
-        retrievable_columns=retr,
-    )
-    _HANDLES[meta.dataset_id] = handle
-    return handle
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
 
+    conn = duckdb.connect(database=str(tmp_path))
+    try:
+        # The normalized file is already sorted by dims, so inserting in file order
+        # keeps the per-row-group zone maps tight for dim filters, and _row_id_
+        # (the file row number) increases monotonically for keyset pagination.
+        conn.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {source}")
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
 
-def close_dataset(dataset_id: str) -> None:
-    handle = _HANDLES.pop(dataset_id, None)
-    if handle is not None:
+    close_dataset(meta.dataset_id)
+    tmp_path.replace(path)
+
+
+def _artifact_size(meta: DatasetMetadata) -> int:
+    # The on-disk artifact is the proxy for what a handle can pull into memory:
+    # the buffer pool for file-backed datasets, the whole table for legacy CSVs.
+    for path in (meta.duckdb_path, meta.normalized_path):
+        if path and Path(path).exists():
+            return Path(path).stat().st_size
+    return 0
+
+
+class HandlePool:
+    def __init__(
+        self,
+        max_bytes: int = _DEFAULT_POOL_MAX_BYTES,
+        idle_seconds: float = _DEFAULT_IDLE_SECONDS,
+        threads: int = _DEFAULT_THREADS,
+        memory_limit: str = _DEFAULT_MEMORY_LIMIT,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self._handles: "OrderedDict[str, DuckdbHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.evictions = 0
+
+    def _open(self, meta: DatasetMetadata) -> DuckdbHandle:
+        table_name = _safe_table_name(meta.dataset_id)
+        conn = _open_connection(meta, table_name)
+        conn.execute(f"SET threads = {int(self.threads)}")
+        conn.execute(f"SET memory_limit = {sql_string(self.memory_limit)}")
+        row_id = _row_id_column(conn, table_name)
+        return DuckdbHandle(
+            dataset_id=meta.dataset_id,
+            conn=conn,
+            table_name=table_name,
+            dims=list(meta.dims),
+            retrievable_columns=list(meta.retrievable_columns or (meta.dims + meta.metrics)),
+            size_bytes=_artifact_size(meta),
+            last_used=time.monotonic(),
+            row_id=row_id,
+            routing_version=meta.routing_version,
+        )
+
+    def _checkout(self, meta: DatasetMetadata) -> DuckdbHandle:
+        with self._lock:
+            handle = self._handles.get(meta.dataset_id)
+            if handle is not None and handle.routing_version != meta.routing_version:
+                # In-flight queries keep the retired handle until they release it.
+                self._drop_locked(meta.dataset_id)
+                handle = None
+            if handle is not None:
+                self._handles.move_to_end(meta.dataset_id)
+                handle.last_used = time.monotonic()
+                handle.in_use += 1
+                return handle
+
+        # Opening can take a while for legacy CSV datasets, so it happens outside
+        # the pool lock; a racing open of the same dataset is simply discarded.
+        fresh = self._open(meta)
+        with self._lock:
+            handle = self._handles.get(meta.dataset_id)
+            if handle is None or handle.routing_version != fresh.routing_version:
+                if handle is not None:
+                    self._drop_locked(meta.dataset_id)
+                handle = fresh
+                self._handles[meta.dataset_id] = handle
+                self.opens += 1
+                fresh = None
+            handle.in_use += 1
+            self._evict_locked(keep=meta.dataset_id)
+        if fresh is not None:
+            _close_quietly(fresh)
+        return handle
+
+    def _release(self, handle: DuckdbHandle) -> None:
+        with self._lock:
+            handle.in_use -= 1
+            handle.last_used = time.monotonic()
+            close_now = handle.retired and handle.in_use <= 0
+            self._evict_locked()
+        if close_now:
+            _close_quietly(handle)
+
+    def _evict_locked(self, keep: Optional[str] = None) -> None:
+        now = time.monotonic()
+        for dataset_id, handle in list(self._handles.items()):
+            if dataset_id != keep and handle.in_use <= 0 and now - handle.last_used > self.idle_seconds:
+                self._drop_locked(dataset_id)
+                self.evictions += 1
+        total = sum(h.size_bytes for h in self._handles.values())
+        for dataset_id, handle in list(self._handles.items()):
+            if total <= self.max_bytes:
+                break
+            if dataset_id == keep or handle.in_use > 0:
+                continue
+            total -= handle.size_bytes
+            self._drop_locked(dataset_id)
+            self.evictions += 1
+
+    def _drop_locked(self, dataset_id: str) -> None:
+        handle = self._handles.pop(dataset_id, None)
+        if handle is None:
+            return
+        handle.retired = True
+        if handle.in_use <= 0:
+            _close_quietly(handle)
+
+    @contextmanager
+    def cursor(self, meta: DatasetMetadata) -> Iterator[Tuple[DuckdbHandle, duckdb.DuckDBPyConnection]]:
+        handle = self._checkout(meta)
         try:
-            handle.conn.close()
+            cur = handle.conn.cursor()
         except Exception:
-            pass
+            self._release(handle)
+            raise
+        try:
+            yield handle, cur
+        finally:
+            try:
+                cur.close()
+            finally:
+                self._release(handle)
+
+    def close(self, dataset_id: str) -> None:
+        with self._lock:
+            self._drop_locked(dataset_id)
+
+    def configure(
+        self,
+        max_bytes: Optional[int] = None,
+        idle_seconds: Optional[float] = None,
+        threads: Optional[int] = None,
+        memory_limit: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if idle_seconds is not None:
+                self.idle_seconds = idle_seconds
+            if threads is not None:
+                self.threads = threads
+            if memory_limit is not None:
+                self.memory_limit = memory_limit
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_handles": len(self._handles),
+                "in_use": sum(1 for h in self._handles.values() if h.in_use > 0),
+                "bytes": sum(h.size_bytes for h in self._handles.values()),
+                "max_bytes": self.max_bytes,
+                "opens": self.opens,
+                "evictions": self.evictions,
+            }
+
+
+def _close_quietly(handle: DuckdbHandle) -> None:
+    try:
+        handle.conn.close()
+    except Exception:
+        pass
+
+
+_POOL = HandlePool()
+
+
+@contextmanager
+def cursor(meta: DatasetMetadata) -> Iterator[Tuple[DuckdbHandle, duckdb.DuckDBPyConnection]]:
+    with _POOL.cursor(meta) as pair:
+        yield pair
+
+
+def close_dataset(dataset_id: str) -> None:
+    _POOL.close(dataset_id)
+
+
+def configure_pool(**kwargs: Any) -> None:
+    _POOL.configure(**kwargs)
 
 
+def pool_stats() -> Dict[str, Any]:
+    return _POOL.stats()
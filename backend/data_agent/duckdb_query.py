@@ -1,9 +1,45 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, List, Optional, Tuple
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import duckdb
+import numpy as np
+
+from . import query_cache
 from .dataset_registry import DatasetMetadata, get_dataset
-from .duckdb_init import get_handle
+from .duckdb_init import ROW_ID_COLUMN, DuckdbHandle, cursor
+from .leaf_index import get_leaf_index, sample_scale
+
+try:  # optional: only needed for Arrow IPC responses
+    import pyarrow  # type: ignore[import]
+except ImportError:  # pragma: no cover - depends on environment
+    pyarrow = None  # type: ignore[assignment]
+
+
+@dataclass
+class QueryResult:
+    columns: List[str]
+    data: Dict[str, List[Any]]
+    row_count: int
+
+    def rows(self) -> List[Dict[str, object]]:
+        cols = [self.data[c] for c in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*cols)]
+
+    def to_columns(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "data": self.data, "row_count": self.row_count}
+
+
+@dataclass
+class QueryPage:
+    result: QueryResult
+    next_cursor: Optional[str]
+    total: Optional[int]
+    total_exact: bool
 
 
 def _clean_filters(filters: Dict[str, List[str]]) -> Dict[str, List[str]]:
@@ -15,48 +51,347 @@ def _clean_filters(filters: Dict[str, List[str]]) -> Dict[str, List[str]]:
     return out
 
 
-def _where_clause(filters: Dict[str, List[str]]) -> Tuple[str, List[str]]:
+def _where_clause(filters: Dict[str, List[str]], extra: Optional[str] = None) -> Tuple[str, List[Any]]:
     clauses: List[str] = []
-    params: List[str] = []
+    params: List[Any] = []
     for col, values in filters.items():
         if not values:
             continue
         placeholders = ", ".join(["?"] * len(values))
         clauses.append(f"{col} IN ({placeholders})")
         params.extend(values)
+    if extra:
+        clauses.append(extra)
     if not clauses:
         return "", params
     return " WHERE " + " AND ".join(clauses), params
 
 
-def run_query(
+# Types whose numpy arrays tolist() to the same Python values fetchall() returns.
+_NUMPY_EXACT_TYPES = {
+    "BOOLEAN", "TINYINT", "SMALLINT", "INTEGER", "BIGINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "VARCHAR",
+}
+
+
+def _fetch_columns(rel: duckdb.DuckDBPyRelation) -> QueryResult:
+    columns = list(rel.columns)
+    if all(str(t) in _NUMPY_EXACT_TYPES for t in rel.types):
+        # fetchnumpy hands back one array per column, so converting to Python
+        # values is a single C-level tolist() per column instead of a dict per row.
+        arrays = rel.fetchnumpy()
+        data = {c: arrays[c].tolist() for c in columns}
+    else:
+        # Dates, decimals, hugeints and the like would come back as datetimes and
+        # floats from numpy; fetchall keeps the values the row API always had.
+        records = rel.fetchall()
+        data = {c: list(values) for c, values in zip(columns, zip(*records))} if records else {c: [] for c in columns}
+    n = len(data[columns[0]]) if columns else 0
+    return QueryResult(columns=columns, data=data, row_count=n)
+
+
+def _fetch_arrow(rel: duckdb.DuckDBPyRelation) -> Any:
+    return rel.arrow()
+
+
+def _select_list(handle: DuckdbHandle, cols: List[str]) -> str:
+    if cols == ["*"] and handle.row_id == ROW_ID_COLUMN:
+        return f"* EXCLUDE ({ROW_ID_COLUMN})"
+    return ", ".join(cols)
+
+
+def _query_columns(meta: DatasetMetadata) -> List[str]:
+    return list(meta.retrievable_columns or (meta.dims + meta.metrics)) or ["*"]
+
+
+def _query(
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    limit: Optional[int],
+    meta: Optional[DatasetMetadata],
+    use_cache: bool,
+    fmt: str,
+    fetch: Callable[[duckdb.DuckDBPyRelation], Any],
+    size_of: Callable[[Any], Optional[int]],
+) -> Any:
+    if meta is None:
+        meta = get_dataset(dataset_id)
+
+    filters = _clean_filters(filters)
+    cols = _query_columns(meta)
+
+    key = query_cache.make_key(meta.dataset_id, meta.routing_version, filters, limit, cols, fmt=fmt)
+    result = query_cache.get(key) if use_cache else None
+    if result is None:
+        where_sql, params = _where_clause(filters)
+        with cursor(meta) as (handle, cur):
+            sql = f"SELECT {_select_list(handle, cols)} FROM {handle.table_name}{where_sql}"
+            if limit is not None:
+                sql += " LIMIT ?"
+                params.append(int(limit))
+            result = fetch(cur.sql(sql, params=params))
+        if use_cache:
+            query_cache.put(key, result, size_of(result))
+    return result
+
+
+def run_query_columnar(
     dataset_id: str,
     filters: Dict[str, List[str]],
     limit: Optional[int] = None,
     meta: Optional[DatasetMetadata] = None,
-) -> Tuple[List[Dict[str, object]], int]:
+    use_cache: bool = True,
+) -> QueryResult:
+    return _query(
+        dataset_id, filters, limit, meta, use_cache, "columns", _fetch_columns,
+        lambda r: query_cache.estimate_size(list(r.data.values())),
+    )
+
+
+def run_query_arrow(
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    limit: Optional[int] = None,
+    meta: Optional[DatasetMetadata] = None,
+    use_cache: bool = True,
+) -> Any:
+    if pyarrow is None:
+        raise RuntimeError("Arrow results require the 'pyarrow' package")
+    return _query(dataset_id, filters, limit, meta, use_cache, "arrow", _fetch_arrow, lambda t: int(t.nbytes))
+
+
+def arrow_ipc_bytes(table: Any) -> bytes:
+    if pyarrow is None:
+        raise RuntimeError("Arrow results require the 'pyarrow' package")
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+_SLICE_COLUMN = "_slice_"
+
+
+def run_query_slices(
+    dataset_id: str,
+    slices: List[Dict[str, List[str]]],
+    limit_per_slice: Optional[int] = None,
+    meta: Optional[DatasetMetadata] = None,
+) -> List[QueryResult]:
+    """
+    Run several filter sets as one UNION ALL statement and split the rows back out.
+
+    Each branch is tagged with its position in ``slices`` and limited on its
+    own, so one large slice cannot crowd out the others. Results come back in
+    the order of ``slices``.
+    """
     if meta is None:
         meta = get_dataset(dataset_id)
-    handle = get_handle(meta)
+    if not slices:
+        return []
+    cols = _query_columns(meta)
+    with cursor(meta) as (handle, cur):
+        select_list = _select_list(handle, cols)
+        branches: List[str] = []
+        params: List[Any] = []
+        for i, filters in enumerate(slices):
+            where_sql, where_params = _where_clause(_clean_filters(filters))
+            branch = f"SELECT {i} AS {_SLICE_COLUMN}, {select_list} FROM {handle.table_name}{where_sql}"
+            params.extend(where_params)
+            if limit_per_slice is not None:
+                branch += " LIMIT ?"
+                params.append(int(limit_per_slice))
+            branches.append(f"({branch})")
+        combined = _fetch_columns(cur.sql(" UNION ALL ".join(branches), params=params))
+
+    tags = np.asarray(combined.data[_SLICE_COLUMN], dtype=np.int64)
+    columns = [c for c in combined.columns if c != _SLICE_COLUMN]
+    out: List[QueryResult] = []
+    for i in range(len(slices)):
+        picks = np.flatnonzero(tags == i).tolist()
+        data = {c: [combined.data[c][j] for j in picks] for c in columns}
+        out.append(QueryResult(columns=columns, data=data, row_count=len(picks)))
+    return out
 
+
+def iter_query_batches(
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    batch_size: int = 10_000,
+    limit: Optional[int] = None,
+    meta: Optional[DatasetMetadata] = None,
+) -> Iterator[Tuple[List[str], List[Tuple[Any, ...]]]]:
+    """
+    Stream matching rows as ``(columns, rows)`` batches of at most ``batch_size``.
+
+    The first item is an empty batch yielded as soon as the query has started,
+    so callers can emit headers before any rows arrive. The pool cursor is held
+    until the generator is exhausted or closed. Nothing is cached.
+    """
+    if meta is None:
+        meta = get_dataset(dataset_id)
     filters = _clean_filters(filters)
+    cols = _query_columns(meta)
     where_sql, params = _where_clause(filters)
+    with cursor(meta) as (handle, cur):
+        # No ORDER BY: the table is stored in row-id order and a sort would force
+        # the whole result to materialize before the first batch.
+        sql = f"SELECT {_select_list(handle, cols)} FROM {handle.table_name}{where_sql}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        yield columns, []
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield columns, batch
 
-    cols = list(meta.retrievable_columns or (meta.dims + meta.metrics))
-    if not cols:
-        cols = ["*"]
-    select_list = ", ".join(cols)
-    sql = f"SELECT {select_list} FROM {handle.table_name}{where_sql}"
-    if limit is not None:
-        sql += " LIMIT ?"
-        params.append(str(int(limit)))
-
-    cur = handle.conn.execute(sql, params)
-    col_names = [d[0] for d in cur.description]
-    rows_raw = cur.fetchall()
-    rows: List[Dict[str, object]] = [
-        {col_names[i]: value for i, value in enumerate(rec)} for rec in rows_raw
-    ]
+
+def run_query(
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    limit: Optional[int] = None,
+    meta: Optional[DatasetMetadata] = None,
+    use_cache: bool = True,
+) -> Tuple[List[Dict[str, object]], int]:
+    # Row dicts are built on demand from the (cached) columnar result, so every
+    # caller gets fresh dicts it may mutate.
+    result = run_query_columnar(dataset_id, filters, limit=limit, meta=meta, use_cache=use_cache)
+    rows = result.rows()
     return rows, len(rows)
 
 
+def estimate_total(meta: DatasetMetadata, filters: Dict[str, List[str]]) -> Optional[Tuple[int, bool]]:
+    """
+    Count the rows matching ``filters`` from the leaf index, without touching DuckDB.
+
+    Returns ``(total, exact)``, or None when the filters reference columns the
+    index does not cover or the index has no real row counts. Indexes built from
+    a sample are scaled up to the full row count and reported as approximate.
+    """
+    index = get_leaf_index(meta)
+    filters = _clean_filters(filters)
+    if index is None or any(d not in index.dims for d in filters):
+        return None
+    _, rows, _ = index.totals(index.constraints(filters))
+    scale = sample_scale(meta, index)
+    if scale is None:
+        return None
+    return int(round(rows * scale)), not index.sampled
+
+
+def _count_sql(meta: DatasetMetadata, filters: Dict[str, List[str]]) -> int:
+    where_sql, params = _where_clause(filters)
+    with cursor(meta) as (handle, cur):
+        cur.execute(f"SELECT count(*) FROM {handle.table_name}{where_sql}", params)
+        return int(cur.fetchone()[0])
+
+
+def _filters_digest(filters: Dict[str, List[str]]) -> str:
+    canon = sorted((dim, sorted({str(v) for v in vals})) for dim, vals in filters.items())
+    return hashlib.sha1(json.dumps(canon, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(
+    meta: DatasetMetadata,
+    filters: Dict[str, List[str]],
+    after: int,
+    total: Optional[int],
+    total_exact: bool,
+) -> str:
+    # The total rides along in the token so later pages report it for free.
+    payload = {
+        "v": meta.routing_version or "",
+        "f": _filters_digest(filters),
+        "k": int(after),
+        "t": total,
+        "x": bool(total_exact),
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, meta: DatasetMetadata, filters: Dict[str, List[str]]) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        int(payload["k"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get("v") != (meta.routing_version or ""):
+        raise ValueError("Cursor is stale: the dataset was rebuilt since it was issued")
+    if payload.get("f") != _filters_digest(filters):
+        raise ValueError("Cursor was issued for different filters")
+    return payload
+
+
+def run_query_page(
+    dataset_id: str,
+    filters: Dict[str, List[str]],
+    page_size: int,
+    cursor_token: Optional[str] = None,
+    meta: Optional[DatasetMetadata] = None,
+    use_cache: bool = True,
+) -> QueryPage:
+    """
+    Fetch one page of matching rows in row-id order.
+
+    Pages are keyset-based (``row_id > last seen``), so with the table stored in
+    row-id order a deep page prunes row groups through the zone maps instead of
+    scanning and discarding an OFFSET.
+    """
+    if meta is None:
+        meta = get_dataset(dataset_id)
+    if page_size <= 0:
+        raise ValueError("page_size must be positive")
+
+    filters = _clean_filters(filters)
+    if cursor_token:
+        state = decode_cursor(cursor_token, meta, filters)
+        after: Optional[int] = int(state["k"])
+        total, total_exact = state.get("t"), bool(state.get("x"))
+    else:
+        after = None
+        estimate = estimate_total(meta, filters)
+        if estimate is not None:
+            total, total_exact = estimate
+        else:
+            total, total_exact = _count_sql(meta, filters), True
+
+    cols = _query_columns(meta)
+    key = query_cache.make_key(
+        meta.dataset_id, meta.routing_version, filters, page_size + 1, cols, fmt=f"page:{after}"
+    )
+    result = query_cache.get(key) if use_cache else None
+    if result is None:
+        with cursor(meta) as (handle, cur):
+            row_id = handle.row_id
+            where_sql, params = _where_clause(filters, extra=f"{row_id} > ?" if after is not None else None)
+            if after is not None:
+                params.append(after)
+            params.append(page_size + 1)
+            result = _fetch_columns(
+                cur.sql(
+                    f"SELECT {row_id} AS {ROW_ID_COLUMN}, {_select_list(handle, cols)} "
+                    f"FROM {handle.table_name}{where_sql} ORDER BY {row_id} LIMIT ?",
+                    params=params,
+                )
+            )
+        if use_cache:
+            query_cache.put(key, result, query_cache.estimate_size(list(result.data.values())))
+
+    row_ids = result.data[ROW_ID_COLUMN]
+    columns = [c for c in result.columns if c != ROW_ID_COLUMN]
+    has_more = len(row_ids) > page_size
+    page = QueryResult(
+        columns=columns,
+        data={c: result.data[c][:page_size] for c in columns},
+        row_count=min(len(row_ids), page_size),
+    )
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(meta, filters, row_ids[page_size - 1], total, total_exact)
+    return QueryPage(result=page, next_cursor=next_cursor, total=total, total_exact=total_exact)
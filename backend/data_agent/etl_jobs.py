@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .dataset_registry import datasets_root
+from .executors import get_pool
+
+try:  # POSIX only: claims are not coordinated across processes without it
+    import fcntl
+except ImportError:  # pragma: no cover - depends on platform
+    fcntl = None  # type: ignore[assignment]
+
+
+_JOBS_DIRNAME = "jobs"
+_MAX_PENDING = 32
+_MAX_ATTEMPTS = 3
+
+# Rough share of wall time per stage, used to turn the current stage into a
+# fraction complete and an ETA.
+_STAGE_WEIGHTS: Dict[str, float] = {
+    "queued": 0.0,
+    "reading": 0.05,
+    "normalizing": 0.45,
+    "leaf_index": 0.2,
+    "yaml": 0.1,
+    "duckdb": 0.2,
+}
+_STAGE_ORDER = list(_STAGE_WEIGHTS)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class EtlJob:
+    job_id: str
+    kind: str
+    dataset_id: str
+    user_id: Optional[str] = None
+    spec: Dict[str, Any] = field(default_factory=dict)
+    status: str = "queued"
+    stage: str = "queued"
+    rows_processed: int = 0
+    rows_total: Optional[int] = None
+    progress: float = 0.0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+JobRunner = Callable[[EtlJob, Callable[[str, Dict[str, Any]], None]], Dict[str, Any]]
+JobListener = Callable[[EtlJob], None]
+
+
+def _jobs_dir() -> Path:
+    d = datasets_root().parent / _JOBS_DIRNAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _job_path(job_id: str) -> Path:
+    return _jobs_dir() / f"{job_id}.json"
+
+
+def _lock_path(job_id: str) -> Path:
+    return _jobs_dir() / f"{job_id}.lock"
+
+
+def _read_job(path: Path) -> Optional[EtlJob]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return EtlJob(**json.load(f))
+    except Exception:
+        return None
+
+
+def _claim(job_id: str) -> Optional[Any]:
+    # An exclusive flock held for as long as the job is active in this process.
+    # The kernel drops it when the process dies, so another worker can tell an
+    # orphaned job from one still running elsewhere. None: someone else has it.
+    f = _lock_path(job_id).open("a+b")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+
+def _stage_progress(stage: str) -> float:
+    done = 0.0
+    for name in _STAGE_ORDER:
+        if name == stage:
+            break
+        done += _STAGE_WEIGHTS[name]
+    return min(done, 1.0)
+
+
+class EtlJobManager:
+    def __init__(self) -> None:
+        self._jobs: Dict[str, EtlJob] = {}
+        self._runners: Dict[str, JobRunner] = {}
+        self._listeners: List[JobListener] = []
+        self._claims: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register_runner(self, kind: str, runner: JobRunner) -> None:
+        self._runners[kind] = runner
+
+    def add_listener(self, listener: JobListener) -> None:
+        self._listeners.append(listener)
+
+    def _save(self, job: EtlJob) -> None:
+        path = _job_path(job.job_id)
+        tmp = path.with_suffix(".json.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(asdict(job), f, ensure_ascii=False, indent=2)
+        tmp.replace(path)
+
+    def _release(self, job_id: str) -> None:
+        with self._lock:
+            claim = self._claims.pop(job_id, None)
+        if claim is not None:
+            _lock_path(job_id).unlink(missing_ok=True)
+            claim.close()
+
+    def _pending_count(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in ACTIVE_STATUSES)
+
+    def submit(
+        self,
+        kind: str,
+        dataset_id: str,
+        spec: Dict[str, Any],
+        user_id: Optional[str] = None,
+    ) -> EtlJob:
+        if kind not in self._runners:
+            raise KeyError(f"No runner registered for ETL job kind: {kind}")
+        with self._lock:
+            if self._pending_count() >= _MAX_PENDING:
+                raise QueueFullError("ETL queue is full")
+            job = EtlJob(
+                job_id=uuid.uuid4().hex,
+                kind=kind,
+                dataset_id=dataset_id,
+                user_id=user_id,
+                spec=spec,
+                created_at=time.time(),
+            )
+            # Claimed before the file exists, so no other worker resumes it.
+            self._claims[job.job_id] = _claim(job.job_id)
+            self._jobs[job.job_id] = job
+            self._save(job)
+        get_pool("etl").submit(self._run, job.job_id)
+        return job
+
+    def _update(self, job: EtlJob, **changes: Any) -> None:
+        with self._lock:
+            for k, v in changes.items():
+                setattr(job, k, v)
+            job.updated_at = time.time()
+            if job.started_at and job.status == "running":
+                elapsed = job.updated_at - job.started_at
+                if 0.0 < job.progress < 1.0:
+                    job.eta_seconds = elapsed / job.progress * (1.0 - job.progress)
+            self._save(job)
+
+    def _run(self, job_id: str) -> None:
+        try:
+            self._run_claimed(job_id)
+        finally:
+            self._release(job_id)
+
+    def _run_claimed(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+        self._update(job, status="running", stage="reading", started_at=time.time(), attempts=job.attempts + 1)
+
+        def report(stage: str, info: Dict[str, Any]) -> None:
+            changes: Dict[str, Any] = {"stage": stage, "progress": _stage_progress(stage)}
+            if "rows_processed" in info:
+                changes["rows_processed"] = int(info["rows_processed"])
+            if "rows_total" in info:
+                changes["rows_total"] = int(info["rows_total"])
+            self._update(job, **changes)
+
+        try:
+            result = self._runners[job.kind](job, report)
+        except Exception as e:
+            self._update(
+                job,
+                status="failed",
+                error=f"{e}\n{traceback.format_exc(limit=5)}",
+                finished_at=time.time(),
+                eta_seconds=None,
+            )
+            return
+
+        self._update(
+            job,
+            status="succeeded",
+            stage="done",
+            progress=1.0,
+            eta_seconds=0.0,
+            finished_at=time.time(),
+            rows_processed=int(result.get("rows_processed", job.rows_processed)),
+        )
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception:
+                continue
+
+    def get(self, job_id: str) -> EtlJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            path = _job_path(job_id)
+            if not path.exists():
+                raise KeyError(f"Unknown job_id: {job_id}")
+            job = _read_job(path)
+            if job is None:
+                raise KeyError(f"Unknown job_id: {job_id}")
+        return job
+
+    def list(self, user_id: Optional[str] = None) -> List[EtlJob]:
+        # Every worker persists its jobs, so the files are the full list; this
+        # process's in-memory copies are at least as fresh as its own files.
+        jobs: Dict[str, EtlJob] = {}
+        for path in _jobs_dir().glob("*.json"):
+            job = _read_job(path)
+            if job is not None:
+                jobs[job.job_id] = job
+        with self._lock:
+            jobs.update(self._jobs)
+        out = [j for j in jobs.values() if user_id is None or j.user_id == user_id]
+        return sorted(out, key=lambda j: j.created_at, reverse=True)
+
+    def resume_pending(self) -> List[EtlJob]:
+        # Jobs interrupted by a restart are re-run from the start; every ETL stage
+        # writes to temp files and swaps them in, so a rerun is safe. Every worker
+        # calls this on startup; the claim lock lets exactly one take each job.
+        resumed: List[EtlJob] = []
+        for path in _jobs_dir().glob("*.json"):
+            job = _read_job(path)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                continue
+            with self._lock:
+                if job.job_id in self._jobs:
+                    continue
+            claim = _claim(job.job_id)
+            if claim is None:
+                continue
+            with self._lock:
+                self._claims[job.job_id] = claim
+            # Re-read under the claim: the previous owner may have finished it.
+            job = _read_job(path)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                self._release(path.stem)
+                continue
+            with self._lock:
+                self._jobs[job.job_id] = job
+            if job.attempts >= _MAX_ATTEMPTS or job.kind not in self._runners:
+                self._update(job, status="failed", error="Gave up after restart", finished_at=time.time())
+                self._release(job.job_id)
+                continue
+            self._update(job, status="queued", stage="queued", progress=0.0, eta_seconds=None)
+            get_pool("etl").submit(self._run, job.job_id)
+            resumed.append(job)
+        return resumed
+
+
+_MANAGER = EtlJobManager()
+
+
+def register_runner(kind: str, runner: JobRunner) -> None:
+    _MANAGER.register_runner(kind, runner)
+
+
+def add_listener(listener: JobListener) -> None:
+    _MANAGER.add_listener(listener)
+
+
+def submit(kind: str, dataset_id: str, spec: Dict[str, Any], user_id: Optional[str] = None) -> EtlJob:
+    return _MANAGER.submit(kind, dataset_id, spec, user_id=user_id)
+
+
+def get_job(job_id: str) -> EtlJob:
+    return _MANAGER.get(job_id)
+
+
+def list_jobs(user_id: Optional[str] = None) -> List[EtlJob]:
+    return _MANAGER.list(user_id)
+
+
+def resume_pending() -> List[EtlJob]:
+    return _MANAGER.resume_pending()
+
+
+def job_to_dict(job: EtlJob) -> Dict[str, Any]:
+    out = asdict(job)
+    out.pop("spec", None)
+    return out
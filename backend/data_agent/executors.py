@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+
+T = TypeVar("T")
+
+# ETL and DuckDB release the GIL for most of their work, so bounded thread pools
+# are enough to keep blocking calls off the event loop without process fan-out.
+_POOL_SIZES: Dict[str, int] = {
+    "etl": 2,
+    "query": 8,
+    "io": 4,
+    # Result files written after an agent run, kept apart from request-path I/O.
+    "export": 2,
+}
+
+_POOLS: Dict[str, ThreadPoolExecutor] = {}
+_LOCK = threading.Lock()
+
+
+def get_pool(name: str) -> ThreadPoolExecutor:
+    with _LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            if name not in _POOL_SIZES:
+                raise KeyError(f"Unknown executor pool: {name}")
+            pool = ThreadPoolExecutor(max_workers=_POOL_SIZES[name], thread_name_prefix=f"data_agent_{name}")
+            _POOLS[name] = pool
+        return pool
+
+
+def configure(name: str, max_workers: int) -> None:
+    with _LOCK:
+        _POOL_SIZES[name] = max_workers
+        old = _POOLS.pop(name, None)
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+async def run_in(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Copy the caller's context so context variables (e.g. the current agent run)
+    # are visible inside the worker thread.
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_pool(name), call)
+
+
+def shutdown() -> None:
+    with _LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.shutdown(wait=False)
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import math
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import duckdb
+
+from .agent_state import RowBuffer
+from .dataset_registry import dataset_dir, datasets_root
+from .duckdb_init import sql_string
+from .executors import get_pool
+
+
+Batch = Tuple[List[str], List[Tuple[Any, ...]]]
+
+
+def ndjson_chunks(batches: Iterable[Batch]) -> Iterator[bytes]:
+    for columns, rows in batches:
+        if not rows:
+            yield b""
+            continue
+        lines = [json.dumps(dict(zip(columns, r)), ensure_ascii=False, default=str) for r in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def csv_chunks(batches: Iterable[Batch]) -> Iterator[bytes]:
+    header_done = False
+    for columns, rows in batches:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if not header_done:
+            writer.writerow(columns)
+            header_done = True
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+STREAM_FORMATS: Dict[str, Tuple[Callable[[Iterable[Batch]], Iterator[bytes]], str]] = {
+    "ndjson": (ndjson_chunks, "application/x-ndjson"),
+    "csv": (csv_chunks, "text/csv; charset=utf-8"),
+}
+
+
+# Per-run result files written after an agent run finishes.
+RESULT_FORMATS: Dict[str, str] = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+DEFAULT_RESULT_FORMAT = "xlsx"
+
+_EXPORTS_DIRNAME = "exports"
+# One worksheet holds 1,048,576 rows including the header.
+_XLSX_MAX_ROWS = 1_048_575
+# Finished exports remembered in memory; older ones are still found on disk.
+_MAX_TRACKED = 256
+
+
+@dataclass
+class ResultExport:
+    export_id: str
+    dataset_id: str
+    format: str
+    path: Path
+    status: str = "pending"
+    row_count: int = 0
+    truncated: bool = False
+    error: Optional[str] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    def file_ref(self) -> Dict[str, Any]:
+        return {
+            "type": "excel" if self.format == "xlsx" else self.format,
+            "format": self.format,
+            "export_id": self.export_id,
+            "dataset_id": self.dataset_id,
+            "path": str(self.path),
+            "status": self.status,
+            "row_count": self.row_count,
+            "truncated": self.truncated,
+            "error": self.error,
+            "schema": {},
+        }
+
+
+_EXPORTS: "OrderedDict[str, ResultExport]" = OrderedDict()
+_EXPORTS_LOCK = threading.Lock()
+
+
+def _columns(rows: Iterable[Dict[str, Any]]) -> List[str]:
+    # Rows from different tool calls may not share every key; the header is the
+    # union in first-seen order. This is a cheap pass over the spilled buffer.
+    seen: Dict[str, None] = {}
+    for r in rows:
+        for k in r:
+            if k not in seen:
+                seen[k] = None
+    return list(seen)
+
+
+def _write_csv(path: Path, rows: RowBuffer) -> Tuple[int, bool]:
+    columns = _columns(rows)
+    n = 0
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval="", extrasaction="ignore")
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(r)
+            n += 1
+    return n, False
+
+
+def _xlsx_cell(v: Any) -> Any:
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False, default=str)
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    return v
+
+
+def _write_xlsx(path: Path, rows: RowBuffer) -> Tuple[int, bool]:
+    import xlsxwriter  # type: ignore[import]
+
+    columns = _columns(rows)
+    # constant_memory flushes each row to disk as soon as the next one starts,
+    # so memory stays flat however many rows the run collected.
+    workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True, "strings_to_urls": False})
+    try:
+        sheet = workbook.add_worksheet("Results")
+        sheet.write_row(0, 0, columns)
+        n = 0
+        for r in rows:
+            if n >= _XLSX_MAX_ROWS:
+                return n, True
+            n += 1
+            sheet.write_row(n, 0, [_xlsx_cell(r.get(c)) for c in columns])
+        return n, False
+    finally:
+        workbook.close()
+
+
+def _write_parquet(path: Path, rows: RowBuffer) -> Tuple[int, bool]:
+    # The buffer's NDJSON spill file already holds the rows; DuckDB streams it
+    # into Parquet, scanning the whole file so late columns get a type too.
+    rows.flush()
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.execute(
+            f"COPY (SELECT * FROM read_json_auto({sql_string(str(rows.path))}, "
+            f"format = 'newline_delimited', sample_size = -1)) TO {sql_string(str(path))} (FORMAT PARQUET)"
+        )
+    finally:
+        conn.close()
+    return len(rows), False
+
+
+_WRITERS: Dict[str, Callable[[Path, RowBuffer], Tuple[int, bool]]] = {
+    "xlsx": _write_xlsx,
+    "csv": _write_csv,
+    "parquet": _write_parquet,
+}
+
+
+def _run_export(export: ResultExport, rows: RowBuffer) -> None:
+    tmp_path = export.path.with_name(export.path.name + ".tmp")
+    try:
+        export.row_count, export.truncated = _WRITERS[export.format](tmp_path, rows)
+        tmp_path.replace(export.path)
+        export.status = "ready"
+    except Exception as e:
+        export.status = "failed"
+        export.error = f"{e}\n{traceback.format_exc(limit=5)}"
+        tmp_path.unlink(missing_ok=True)
+    finally:
+        rows.close()
+
+
+def _export_path(dataset_id: str, export_id: str, fmt: str) -> Path:
+    d = dataset_dir(dataset_id) / _EXPORTS_DIRNAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f"{export_id}.{fmt}"
+
+
+def _record_path(export_id: str) -> Path:
+    # export_id -> the dataset the run queried, so a download still finds the
+    # file after the user has moved on to another dataset.
+    d = datasets_root().parent / _EXPORTS_DIRNAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d / f"{export_id}.json"
+
+
+def start_result_export(
+    dataset_id: str,
+    export_id: str,
+    rows: RowBuffer,
+    fmt: str = DEFAULT_RESULT_FORMAT,
+) -> ResultExport:
+    """
+    Write ``rows`` to a per-run result file on the export pool.
+
+    Returns at once with a pending export; the caller owns nothing afterwards,
+    the buffer is closed when the file is written.
+    """
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(RESULT_FORMATS)}")
+    export = ResultExport(
+        export_id=export_id,
+        dataset_id=dataset_id,
+        format=fmt,
+        path=_export_path(dataset_id, export_id, fmt),
+        row_count=len(rows),
+    )
+    _record_path(export_id).write_text(json.dumps({"dataset_id": dataset_id, "format": fmt}), encoding="utf-8")
+    with _EXPORTS_LOCK:
+        _EXPORTS[export_id] = export
+        while len(_EXPORTS) > _MAX_TRACKED:
+            oldest = next(iter(_EXPORTS.values()))
+            if oldest.status == "pending":
+                break
+            _EXPORTS.popitem(last=False)
+    export.future = get_pool("export").submit(_run_export, export, rows)
+    return export
+
+
+def find_result_export(export_id: str, dataset_ids: Iterable[str] = ()) -> Optional[ResultExport]:
+    """
+    Find a run's result export by id, under the dataset recorded when it started.
+
+    Files written before that record was kept are looked for under each of
+    ``dataset_ids`` instead.
+    """
+    if not export_id.isalnum():
+        return None
+    with _EXPORTS_LOCK:
+        export = _EXPORTS.get(export_id)
+    if export is not None:
+        return export
+    # Forgotten or from before a restart: a finished file is all that is left.
+    try:
+        record = json.loads(_record_path(export_id).read_text(encoding="utf-8"))
+        candidates = [(str(record["dataset_id"]), str(record["format"]))]
+    except (OSError, ValueError, KeyError, TypeError):
+        candidates = [(d, fmt) for d in dataset_ids for fmt in RESULT_FORMATS]
+    for dataset_id, fmt in candidates:
+        if fmt not in RESULT_FORMATS:
+            continue
+        path = dataset_dir(dataset_id) / _EXPORTS_DIRNAME / f"{export_id}.{fmt}"
+        if path.exists():
+            return ResultExport(export_id=export_id, dataset_id=dataset_id, format=fmt, path=path, status="ready")
+    return None
@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+import itertools
+import json
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .dataset_registry import DatasetMetadata
+from .rollup import Rollup, build_rollup, load_rollup, write_rollup
+
+
+_FORMAT_VERSION = 1
+_DICTIONARY_FILE = "dictionary.json"
+_CODES_FILE = "codes.npy"
+_ROWS_FILE = "rows.npy"
+_METRICS_FILE = "metrics.npy"
+
+# Code 0 is reserved for a null dim value; real values are 1 + their position in
+# the sorted per-dim dictionary, so sorted codes follow sorted values.
+NULL_CODE = 0
+# Above this many value combinations a rollup lookup is slower than a leaf scan.
+_MAX_ROLLUP_COMBOS = 64
+
+
+@dataclass
+class LeafIndex:
+    dims: List[str]
+    metrics: List[str]
+    per_dim: Dict[str, List[str]]
+    codes: np.ndarray
+    rows: np.ndarray
+    metric_sums: np.ndarray
+    sampled: bool = False
+    # False when ``rows`` holds one per leaf rather than real row counts.
+    counted: bool = True
+    _lookup: Dict[str, Dict[str, int]] = field(default_factory=dict, repr=False)
+    _rows_cumsum: Optional[np.ndarray] = field(default=None, repr=False)
+    _metric_cumsum: Optional[np.ndarray] = field(default=None, repr=False)
+    path: Optional[Path] = field(default=None, repr=False)
+    _rollup: Optional[Rollup] = field(default=None, repr=False)
+    _rollup_loaded: bool = field(default=False, repr=False)
+
+    def __len__(self) -> int:
+        return int(self.codes.shape[0])
+
+    def code(self, dim: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return NULL_CODE
+        table = self._lookup.get(dim)
+        if table is None:
+            table = {v: i + 1 for i, v in enumerate(self.per_dim.get(dim, []))}
+            self._lookup[dim] = table
+        return table.get(value)
+
+    def value(self, dim: str, code: int) -> Optional[str]:
+        if code == NULL_CODE:
+            return None
+        return self.per_dim[dim][code - 1]
+
+    def encode(self, values: Sequence[Optional[str]]) -> Optional[Tuple[int, ...]]:
+        out: List[int] = []
+        for dim, v in zip(self.dims, values):
+            c = self.code(dim, v)
+            if c is None:
+                return None
+            out.append(c)
+        return tuple(out)
+
+    def prefix_range(self, prefix: Sequence[int], lo: int = 0, hi: Optional[int] = None) -> Tuple[int, int]:
+        # Leaves are sorted lexicographically by code, so each fixed prefix is a
+        # contiguous block and the next column is sorted within it.
+        if hi is None:
+            hi = len(self)
+        for depth, c in enumerate(prefix):
+            if lo >= hi:
+                break
+            col = self.codes[lo:hi, depth]
+            lo, hi = (
+                lo + int(np.searchsorted(col, c, side="left")),
+                lo + int(np.searchsorted(col, c, side="right")),
+            )
+        return lo, hi
+
+    def has_prefix(self, values: Sequence[Optional[str]]) -> bool:
+        codes = self.encode(values)
+        if codes is None:
+            return False
+        lo, hi = self.prefix_range(codes)
+        return hi > lo
+
+    def has_combo(self, values: Sequence[Optional[str]]) -> bool:
+        return len(values) == len(self.dims) and self.has_prefix(values)
+
+    def combo(self, i: int) -> Tuple[Optional[str], ...]:
+        return tuple(self.value(d, int(c)) for d, c in zip(self.dims, self.codes[i]))
+
+    def constraints(self, filters: Dict[str, Sequence[Optional[str]]]) -> Dict[int, List[int]]:
+        out: Dict[int, List[int]] = {}
+        for depth, dim in enumerate(self.dims):
+            if dim in filters:
+                out[depth] = [c for c in (self.code(dim, v) for v in filters[dim]) if c is not None]
+        return out
+
+    def select(self, constraints: Dict[int, Sequence[int]]) -> List[Tuple[int, int, Optional[np.ndarray]]]:
+        # Returns matching leaves as (lo, hi, mask) blocks. Constrained leading
+        # dims are resolved by binary search; once an unconstrained dim sits above
+        # a constrained one, the remaining blocks are masked in one vectorized pass
+        # instead of walking every child.
+        blocks: List[Tuple[int, int]] = [(0, len(self))]
+        deepest = max(constraints) if constraints else -1
+        depth = 0
+        while depth <= deepest and depth in constraints:
+            wanted = sorted(set(constraints[depth]))
+            narrowed: List[Tuple[int, int]] = []
+            for lo, hi in blocks:
+                col = self.codes[lo:hi, depth]
+                for c in wanted:
+                    left = int(np.searchsorted(col, c, side="left"))
+                    right = int(np.searchsorted(col, c, side="right"))
+                    if right > left:
+                        narrowed.append((lo + left, lo + right))
+            blocks = narrowed
+            if not blocks:
+                return []
+            depth += 1
+        if depth > deepest:
+            return [(lo, hi, None) for lo, hi in blocks]
+
+        out: List[Tuple[int, int, Optional[np.ndarray]]] = []
+        rest = {k: np.asarray(sorted(set(v)), dtype=np.int32) for k, v in constraints.items() if k >= depth}
+        for lo, hi in blocks:
+            mask = np.ones(hi - lo, dtype=bool)
+            for k, wanted_codes in rest.items():
+                mask &= np.isin(self.codes[lo:hi, k], wanted_codes)
+            if mask.any():
+                out.append((lo, hi, mask))
+        return out
+
+    def count(self, blocks: List[Tuple[int, int, Optional[np.ndarray]]]) -> Tuple[int, int]:
+        leaves = 0
+        rows = 0
+        for lo, hi, mask in blocks:
+            if mask is None:
+                leaves += hi - lo
+                rows += int(self.rows_cumsum[hi] - self.rows_cumsum[lo])
+            else:
+                leaves += int(mask.sum())
+                rows += int(self.rows[lo:hi][mask].sum())
+        return leaves, rows
+
+    @property
+    def rows_cumsum(self) -> np.ndarray:
+        if self._rows_cumsum is None:
+            self._rows_cumsum = np.concatenate(([0], np.cumsum(self.rows, dtype=np.int64)))
+        return self._rows_cumsum
+
+    @property
+    def metric_cumsum(self) -> np.ndarray:
+        if self._metric_cumsum is None:
+            sums = np.nan_to_num(np.asarray(self.metric_sums, dtype=np.float64))
+            zero = np.zeros((1, sums.shape[1]), dtype=np.float64)
+            self._metric_cumsum = np.concatenate((zero, np.cumsum(sums, axis=0)))
+        return self._metric_cumsum
+
+    @property
+    def rollup(self) -> Optional[Rollup]:
+        # Loaded on first use; most requests only need the leaf arrays.
+        if not self._rollup_loaded:
+            if self.path is not None:
+                self._rollup = load_rollup(self.path)
+            self._rollup_loaded = True
+        return self._rollup
+
+    def children(self, path: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Codes of the next dim under ``path`` with their leaf and row counts."""
+        depth = len(path)
+        rollup = self.rollup
+        block = rollup.block(tuple(range(depth + 1)), path) if rollup is not None else None
+        if block is not None:
+            lo, hi = block
+            return (
+                np.asarray(rollup.codes[lo:hi, depth]),
+                np.asarray(rollup.leaves[lo:hi]),
+                np.asarray(rollup.rows[lo:hi]),
+            )
+        lo, hi = self.prefix_range(path)
+        col = np.asarray(self.codes[lo:hi, depth])
+        if not col.size:
+            return col, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(col)) + 1))
+        ends = np.concatenate((starts[1:], [col.size]))
+        cumsum = self.rows_cumsum
+        return col[starts], ends - starts, cumsum[lo + ends] - cumsum[lo + starts]
+
+    def _rollup_totals(self, constraints: Dict[int, Sequence[int]]) -> Optional[Tuple[int, int, np.ndarray]]:
+        rollup = self.rollup
+        positions = tuple(sorted(constraints))
+        if rollup is None or not rollup.has_set(positions):
+            return None
+        wanted = [sorted(set(constraints[p])) for p in positions]
+        if int(np.prod([len(w) for w in wanted])) > _MAX_ROLLUP_COMBOS:
+            return None
+        leaves = 0
+        rows = 0
+        sums = np.zeros(len(self.metrics), dtype=np.float64)
+        for combo in itertools.product(*wanted):
+            lo, hi = rollup.block(positions, combo) or (0, 0)
+            if hi > lo:
+                leaves += int(rollup.leaves[lo])
+                rows += int(rollup.rows[lo])
+                sums += rollup.metric_sums[lo]
+        return leaves, rows, sums
+
+    def totals(self, constraints: Dict[int, Sequence[int]]) -> Tuple[int, int, np.ndarray]:
+        """Matched leaves, rows and metric sums; rollup lookups where a grouping set fits."""
+        if any(not v for v in constraints.values()):
+            return 0, 0, np.zeros(len(self.metrics), dtype=np.float64)
+        fast = self._rollup_totals(constraints)
+        if fast is not None:
+            return fast
+        blocks = self.select(constraints)
+        leaves, rows = self.count(blocks)
+        sums = np.zeros(len(self.metrics), dtype=np.float64)
+        if self.metrics:
+            cumsum = self.metric_cumsum
+            for lo, hi, mask in blocks:
+                if mask is None:
+                    sums += cumsum[hi] - cumsum[lo]
+                else:
+                    sums += np.nan_to_num(np.asarray(self.metric_sums[lo:hi])[mask]).sum(axis=0)
+        return leaves, rows, sums
+
+    def positions(self, blocks: List[Tuple[int, int, Optional[np.ndarray]]]) -> np.ndarray:
+        parts = [np.arange(lo, hi) if mask is None else lo + np.flatnonzero(mask) for lo, hi, mask in blocks]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+
+def sample_scale(meta: DatasetMetadata, index: LeafIndex) -> Optional[float]:
+    # Factor from an index built on a sample to the full table; None if unknown.
+    if not index.counted:
+        return None
+    if not index.sampled:
+        return 1.0
+    total_rows = (meta.stats or {}).get("total_rows")
+    indexed_rows = int(index.rows_cumsum[-1])
+    if not total_rows or not indexed_rows:
+        return None
+    return int(total_rows) / indexed_rows
+
+
+def _index_dir(meta: DatasetMetadata) -> Optional[Path]:
+    if not meta.leaf_index_path:
+        return None
+    return Path(meta.leaf_index_path)
+
+
+def build_leaf_index(
+    leaf_df: pd.DataFrame,
+    dims: List[str],
+    metrics: List[str],
+    sampled: bool = False,
+) -> LeafIndex:
+    per_dim: Dict[str, List[str]] = {}
+    code_cols: List[np.ndarray] = []
+    for d in dims:
+        values = sorted(leaf_df[d].dropna().unique().tolist())
+        per_dim[d] = values
+        cat = pd.Categorical(leaf_df[d], categories=values)
+        code_cols.append(cat.codes.astype(np.int32) + 1)
+
+    n = int(leaf_df.shape[0])
+    if code_cols:
+        codes = np.column_stack(code_cols)
+        order = np.lexsort(codes.T[::-1])
+    else:
+        codes = np.zeros((n, 0), dtype=np.int32)
+        order = np.arange(n)
+    metric_cols = [m for m in metrics if m in leaf_df.columns]
+    if metric_cols:
+        metric_sums = leaf_df[metric_cols].to_numpy(dtype=np.float64)[order]
+    else:
+        metric_sums = np.zeros((n, 0), dtype=np.float64)
+    return LeafIndex(
+        dims=list(dims),
+        metrics=metric_cols,
+        per_dim=per_dim,
+        codes=np.asfortranarray(codes[order]),
+        rows=leaf_df["_rows_"].to_numpy(dtype=np.int64)[order],
+        metric_sums=metric_sums,
+        sampled=bool(sampled),
+    )
+
+
+def merge_leaf_index(index: LeafIndex, leaf_df: pd.DataFrame) -> LeafIndex:
+    """
+    Add a delta's leaf counts and metric sums to ``index``.
+
+    Existing codes are remapped into the widened per-dim dictionaries and equal
+    leaves are summed, so the work grows with the number of leaves, never with
+    the rows behind them.
+    """
+    n_old, n_new = len(index), int(leaf_df.shape[0])
+    per_dim: Dict[str, List[str]] = {}
+    code_cols: List[np.ndarray] = []
+    for i, d in enumerate(index.dims):
+        old_values = index.per_dim.get(d, [])
+        values = sorted(set(old_values).union(leaf_df[d].dropna().unique().tolist()))
+        per_dim[d] = values
+        remap = np.concatenate([[NULL_CODE], pd.Index(values).get_indexer(old_values) + 1]).astype(np.int32)
+        new_codes = pd.Categorical(leaf_df[d], categories=values).codes.astype(np.int32) + 1
+        code_cols.append(np.concatenate([remap[np.asarray(index.codes[:, i])], new_codes]))
+
+    total = n_old + n_new
+    if code_cols:
+        codes = np.column_stack(code_cols)
+        order = np.lexsort(codes.T[::-1])
+        codes = codes[order]
+        change = np.any(codes[1:] != codes[:-1], axis=1)
+    else:
+        codes = np.zeros((total, 0), dtype=np.int32)
+        order = np.arange(total)
+        change = np.zeros(max(total - 1, 0), dtype=bool)
+    starts = np.concatenate([[0], np.flatnonzero(change) + 1]) if total else np.zeros(0, dtype=np.int64)
+
+    rows = np.concatenate([np.asarray(index.rows, dtype=np.int64), leaf_df["_rows_"].to_numpy(dtype=np.int64)])
+    new_metrics = np.zeros((n_new, len(index.metrics)), dtype=np.float64)
+    for j, m in enumerate(index.metrics):
+        if m in leaf_df.columns:
+            new_metrics[:, j] = np.nan_to_num(leaf_df[m].to_numpy(dtype=np.float64))
+    metric_sums = np.vstack([np.asarray(index.metric_sums, dtype=np.float64), new_metrics])
+    if total:
+        rows = np.add.reduceat(rows[order], starts)
+        metric_sums = np.add.reduceat(metric_sums[order], starts, axis=0)
+    return LeafIndex(
+        dims=list(index.dims),
+        metrics=list(index.metrics),
+        per_dim=per_dim,
+        codes=np.asfortranarray(codes[starts]),
+        rows=rows,
+        metric_sums=metric_sums,
+        sampled=index.sampled,
+        counted=index.counted,
+    )
+
+
+def leaf_frame(index: LeafIndex) -> pd.DataFrame:
+    # The index decoded back to one row per leaf, as build_leaf_index takes it.
+    data: Dict[str, Any] = {}
+    for i, d in enumerate(index.dims):
+        lookup = np.array([None] + list(index.per_dim.get(d, [])), dtype=object)
+        data[d] = lookup[np.asarray(index.codes[:, i])]
+    df = pd.DataFrame(data, columns=index.dims)
+    df["_rows_"] = np.asarray(index.rows, dtype=np.int64)
+    for j, m in enumerate(index.metrics):
+        df[m] = np.asarray(index.metric_sums[:, j], dtype=np.float64)
+    return df
+
+
+def from_valid_sets(valid_sets: Dict[str, Any], dims: List[str]) -> LeafIndex:
+    combos = valid_sets.get("combos_full") or []
+    data = {d: [None if row[i] == "nan" else row[i] for row in combos] for i, d in enumerate(dims)}
+    leaf_df = pd.DataFrame(data, columns=dims)
+    leaf_df["_rows_"] = 1
+    # Legacy valid_sets.json never stored row counts, so they are not exact.
+    index = build_leaf_index(leaf_df, dims, [], sampled=True)
+    index.counted = False
+    return index
+
+
+def write_leaf_index(path: Path, index: LeafIndex) -> None:
+    tmp_dir = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / _CODES_FILE, np.asfortranarray(index.codes))
+    np.save(tmp_dir / _ROWS_FILE, np.asarray(index.rows, dtype=np.int64))
+    np.save(tmp_dir / _METRICS_FILE, np.asarray(index.metric_sums, dtype=np.float64))
+    dictionary = {
+        "version": _FORMAT_VERSION,
+        "dims": index.dims,
+        "metrics": index.metrics,
+        "per_dim": index.per_dim,
+        "n_leaves": len(index),
+        "sampled": index.sampled,
+    }
+    rollup = build_rollup(np.asarray(index.codes), np.asarray(index.rows), np.asarray(index.metric_sums))
+    if rollup is not None:
+        write_rollup(tmp_dir, rollup)
+    with (tmp_dir / _DICTIONARY_FILE).open("w", encoding="utf-8") as f:
+        json.dump(dictionary, f, ensure_ascii=False)
+    shutil.rmtree(path, ignore_errors=True)
+    tmp_dir.replace(path)
+
+
+def _read_dictionary(path: Path) -> Dict[str, Any]:
+    with (path / _DICTIONARY_FILE).open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_leaf_index(path: Path) -> LeafIndex:
+    dictionary = _read_dictionary(path)
+    return LeafIndex(
+        dims=list(dictionary.get("dims", [])),
+        metrics=list(dictionary.get("metrics", [])),
+        per_dim=dictionary.get("per_dim", {}) or {},
+        codes=np.load(path / _CODES_FILE, mmap_mode="r"),
+        rows=np.load(path / _ROWS_FILE, mmap_mode="r"),
+        metric_sums=np.load(path / _METRICS_FILE, mmap_mode="r"),
+        sampled=bool(dictionary.get("sampled", False)),
+        path=path,
+    )
+
+
+# Keyed by dataset_id; an append moves the index to a new directory, so the
+# stamp is the dictionary path together with its mtime.
+_INDEXES: Dict[str, Tuple[Tuple[str, float], LeafIndex]] = {}
+
+
+def get_leaf_index(meta: DatasetMetadata) -> Optional[LeafIndex]:
+    path = _index_dir(meta)
+    if path is not None and (path / _DICTIONARY_FILE).exists():
+        source = path / _DICTIONARY_FILE
+    elif meta.valid_sets_path and Path(meta.valid_sets_path).exists():
+        source = Path(meta.valid_sets_path)
+    else:
+        return None
+    stamp = (str(source), source.stat().st_mtime)
+    cached = _INDEXES.get(meta.dataset_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if source.name == _DICTIONARY_FILE:
+        index = load_leaf_index(source.parent)
+    else:
+        with source.open("r", encoding="utf-8") as f:
+            index = from_valid_sets(json.load(f), list(meta.dims))
+    _INDEXES[meta.dataset_id] = (stamp, index)
+    return index
+
+
+def load_per_dim(meta: DatasetMetadata) -> Dict[str, List[str]]:
+    path = _index_dir(meta)
+    if path is not None and (path / _DICTIONARY_FILE).exists():
+        return _read_dictionary(path).get("per_dim", {}) or {}
+    # Datasets built before the binary index keep per_dim in valid_sets.json.
+    if meta.valid_sets_path:
+        vp = Path(meta.valid_sets_path)
+        if vp.exists():
+            try:
+                with vp.open("r", encoding="utf-8") as f:
+                    return json.load(f).get("per_dim", {}) or {}
+            except Exception:
+                return {}
+    return {}
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
-import io
 import json
+import uuid
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import pandas as pd
-
 from agents import Runner  # type: ignore[import]
 
-from .agent_state import collect_rows_from_runs, reset_tool_runs, tool_run_notes
-from .agents import build_agent
-from .dataset_registry import DatasetMetadata, dataset_dir, save_dataset
-from .taxonomy_builder import build_taxonomy
+from . import etl_jobs
+from .agent_state import agent_run, current_run, tool_run_notes
+from .agents import get_agent, invalidate_agents
+from .dataset_registry import DatasetMetadata, dataset_dir, get_dataset, save_dataset
+from .executors import run_in
+from .etl_jobs import EtlJob
+from .exports import DEFAULT_RESULT_FORMAT, RESULT_FORMATS, start_result_export
+from .taxonomy_builder import ProgressFn, append_rows, build_taxonomy, deltas_dir
 
 
 def create_dataset(
@@ -23,14 +25,21 @@ def create_dataset(
     display_name: Optional[str] = None,
     prompt_system_path: Optional[str] = None,
     prompt_dev_path: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+    user_id: Optional[str] = None,
 ) -> DatasetMetadata:
     ddir = dataset_dir(dataset_id)
     raw_dest = ddir / "raw.csv"
-    Path(raw_file_path).replace(raw_dest)
+    # A resumed job finds the upload already moved into place.
+    if Path(raw_file_path).exists():
+        Path(raw_file_path).replace(raw_dest)
+    elif not raw_dest.exists():
+        raise FileNotFoundError(raw_file_path)
 
     meta = DatasetMetadata(
         dataset_id=dataset_id,
         display_name=display_name or dataset_id,
+        user_id=user_id,
         raw_path=str(raw_dest),
         dims=dims,
         metrics=metrics,
@@ -38,27 +47,69 @@ def create_dataset(
         prompt_dev_path=prompt_dev_path,
     )
     save_dataset(meta)
-    meta = build_taxonomy(meta)
+    meta = build_taxonomy(meta, progress=progress)
+    invalidate_agents(dataset_id)
     return meta
 
 
-def _rows_to_excel(path: Path, rows: List[Dict[str, Any]]) -> None:
-    df = pd.DataFrame(rows)
-    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Results")
+def _run_create_job(job: EtlJob, progress: ProgressFn) -> Dict[str, Any]:
+    spec = job.spec
+    meta = create_dataset(
+        dataset_id=job.dataset_id,
+        raw_file_path=spec["raw_file_path"],
+        dims=list(spec.get("dims") or []),
+        metrics=list(spec.get("metrics") or []),
+        display_name=spec.get("display_name"),
+        prompt_system_path=spec.get("prompt_system_path"),
+        prompt_dev_path=spec.get("prompt_dev_path"),
+        progress=progress,
+        user_id=job.user_id,
+    )
+    return {"rows_processed": meta.stats.get("total_rows", 0)}
 
 
-def run_dataset_agent(
+etl_jobs.register_runner("create_dataset", _run_create_job)
+
+
+def append_dataset(
     dataset_id: str,
-    natural_query: str,
-    email: Optional[str] = None,
-    client_id: Optional[str] = None,
-    session_id: Optional[str] = None,
-) -> Dict[str, Any]:
-    reset_tool_runs()
-    agent = build_agent(dataset_id)
+    raw_file_path: str,
+    append_id: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+) -> DatasetMetadata:
+    meta = get_dataset(dataset_id)
+    append_id = append_id or uuid.uuid4().hex
+    raw_dest = deltas_dir(dataset_id) / f"{append_id}.csv"
+    # As with create, a resumed job finds the upload already moved into place.
+    if Path(raw_file_path).exists():
+        Path(raw_file_path).replace(raw_dest)
+    elif not raw_dest.exists():
+        raise FileNotFoundError(raw_file_path)
+
+    meta = append_rows(meta, raw_dest, append_id, progress=progress)
+    invalidate_agents(dataset_id)
+    return meta
+
+
+def _run_append_job(job: EtlJob, progress: ProgressFn) -> Dict[str, Any]:
+    # The job id names the delta part, so a resumed job recognises its own append.
+    append_id = job.job_id
+    meta = append_dataset(job.dataset_id, job.spec["raw_file_path"], append_id=append_id, progress=progress)
+    rows = [a["rows"] for a in meta.extra.get("appends", []) if a.get("append_id") == append_id]
+    return {"rows_processed": rows[-1] if rows else 0}
+
+
+etl_jobs.register_runner("append_dataset", _run_append_job)
 
-    user_msg = json.dumps(
+
+def _agent_message(
+    dataset_id: str,
+    natural_query: str,
+    email: Optional[str],
+    client_id: Optional[str],
+    session_id: Optional[str],
+) -> str:
+    return json.dumps(
         {
             "dataset_id": dataset_id,
             "natural_query": natural_query,
@@ -69,17 +120,23 @@ def run_dataset_agent(
         ensure_ascii=False,
     )
 
-    try:
-        result = Runner.run(agent, user_msg)  # type: ignore[call-arg]
-    except Exception as e:
-        return {
-            "ok": False,
-            "summary": f"Agent failed: {e}",
-            "files": [],
-            "payload": {},
-            "diag": {"errors": tool_run_notes(), "effective_query": natural_query},
-        }
 
+def _agent_failed(natural_query: str, e: Exception) -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "summary": f"Agent failed: {e}",
+        "files": [],
+        "payload": {},
+        "diag": {"errors": tool_run_notes(), "effective_query": natural_query},
+    }
+
+
+def _finish_agent_run(
+    dataset_id: str,
+    natural_query: str,
+    result: Any,
+    export_format: str = DEFAULT_RESULT_FORMAT,
+) -> Dict[str, Any]:
     txt = getattr(result, "final_output", str(result))
     try:
         parsed = json.loads(txt)
@@ -89,20 +146,14 @@ def run_dataset_agent(
     summary_block = parsed.get("summary") or {}
     payload_block = parsed.get("payload") or {}
 
-    rows = collect_rows_from_runs()
-    ddir = dataset_dir(dataset_id)
-    excel_path = ddir / "latest_results.xlsx"
-    if rows:
-        _rows_to_excel(excel_path, rows)
-        files = [
-            {
-                "type": "excel",
-                "path": str(excel_path),
-                "schema": {},
-            }
-        ]
-    else:
-        files = []
+    # The rows move to a per-run export written on the export pool; the answer
+    # goes back now and the file reference reports when it is ready.
+    run = current_run()
+    rowcount = len(run.rows) if run is not None else 0
+    files = []
+    if run is not None and rowcount:
+        export = start_result_export(dataset_id, run.run_id, run.rows.detach(), export_format)
+        files.append(export.file_ref())
 
     out = {
         "ok": True,
@@ -111,10 +162,51 @@ def run_dataset_agent(
         "payload": payload_block,
         "diag": {
             "errors": payload_block.get("state", {}).get("diag", {}).get("errors", []),
-            "rowcount": len(rows),
+            "rowcount": rowcount,
             "effective_query": natural_query,
         },
     }
     return out
 
 
+def run_dataset_agent(
+    dataset_id: str,
+    natural_query: str,
+    email: Optional[str] = None,
+    client_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    export_format: str = DEFAULT_RESULT_FORMAT,
+) -> Dict[str, Any]:
+    if export_format not in RESULT_FORMATS:
+        raise ValueError(f"export_format must be one of {', '.join(RESULT_FORMATS)}")
+    agent = get_agent(dataset_id)
+    user_msg = _agent_message(dataset_id, natural_query, email, client_id, session_id)
+
+    with agent_run():
+        try:
+            result = Runner.run_sync(agent, user_msg)  # type: ignore[call-arg]
+        except Exception as e:
+            return _agent_failed(natural_query, e)
+        return _finish_agent_run(dataset_id, natural_query, result, export_format)
+
+
+async def run_dataset_agent_async(
+    dataset_id: str,
+    natural_query: str,
+    email: Optional[str] = None,
+    client_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    export_format: str = DEFAULT_RESULT_FORMAT,
+) -> Dict[str, Any]:
+    if export_format not in RESULT_FORMATS:
+        raise ValueError(f"export_format must be one of {', '.join(RESULT_FORMATS)}")
+    agent = await run_in("io", get_agent, dataset_id)
+    user_msg = _agent_message(dataset_id, natural_query, email, client_id, session_id)
+
+    # Run-scoped state: concurrent runs on this worker each collect their own rows.
+    with agent_run():
+        try:
+            result = await Runner.run(agent, user_msg)  # type: ignore[call-arg]
+        except Exception as e:
+            return _agent_failed(natural_query, e)
+        return await run_in("io", _finish_agent_run, dataset_id, natural_query, result, export_format)
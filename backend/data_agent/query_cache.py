@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_SIZE_SAMPLE_ROWS = 64
+
+CacheKey = Tuple[Hashable, ...]
+
+
+def make_key(
+    dataset_id: str,
+    routing_version: Optional[str],
+    filters: Dict[str, List[str]],
+    limit: Optional[int],
+    columns: Sequence[str],
+    fmt: str = "rows",
+) -> CacheKey:
+    canon = tuple(sorted((dim, tuple(sorted({str(v) for v in vals}))) for dim, vals in filters.items()))
+    return (dataset_id, routing_version or "", canon, limit, tuple(columns), fmt)
+
+
+def estimate_size(value: Any) -> int:
+    if isinstance(value, (list, tuple)):
+        n = len(value)
+        size = sys.getsizeof(value)
+        if not n:
+            return size
+        sample = value[:_SIZE_SAMPLE_ROWS]
+        per_item = sum(estimate_size(v) for v in sample) / len(sample)
+        return size + int(per_item * n)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = _DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: CacheKey, value: Any, size: Optional[int] = None) -> None:
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, dataset_id: Optional[str] = None) -> int:
+        with self._lock:
+            if dataset_id is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return dropped
+            keys = [k for k in self._entries if k[0] == dataset_id]
+            for k in keys:
+                self._bytes -= self._entries.pop(k)[1]
+            return len(keys)
+
+    def configure(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_CACHE = QueryCache()
+
+
+def get(key: CacheKey) -> Optional[Any]:
+    return _CACHE.get(key)
+
+
+def put(key: CacheKey, value: Any, size: Optional[int] = None) -> None:
+    _CACHE.put(key, value, size)
+
+
+def invalidate(dataset_id: Optional[str] = None) -> int:
+    return _CACHE.invalidate(dataset_id)
+
+
+def configure(max_bytes: int) -> None:
+    _CACHE.configure(max_bytes)
+
+
+def stats() -> Dict[str, Any]:
+    return _CACHE.stats()
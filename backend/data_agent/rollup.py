@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import itertools
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+
+_SETS_FILE = "rollup.json"
+_CODES_FILE = "rollup_codes.npy"
+_LEAVES_FILE = "rollup_leaves.npy"
+_ROWS_FILE = "rollup_rows.npy"
+_METRICS_FILE = "rollup_metrics.npy"
+
+# Code stored for a dim that is rolled up in a grouping set.
+ROLLED_UP = -1
+# All dim pairs are materialized up to this many dims (15 pairs at 6).
+_MAX_PAIR_DIMS = 6
+
+GroupingSet = Tuple[int, ...]
+
+
+def default_sets(n_dims: int) -> List[GroupingSet]:
+    # Every proper prefix of the dim order (the full set is the leaf index
+    # itself), each dim on its own, and all pairs for narrow taxonomies.
+    sets: List[GroupingSet] = [tuple(range(d)) for d in range(n_dims)]
+    sets += [(i,) for i in range(1, n_dims)]
+    if n_dims <= _MAX_PAIR_DIMS:
+        sets += [p for p in itertools.combinations(range(n_dims), 2) if p != (0, 1)]
+    return list(dict.fromkeys(s for s in sets if len(s) < n_dims))
+
+
+@dataclass
+class Rollup:
+    sets: List[GroupingSet]
+    bounds: List[Tuple[int, int]]
+    codes: np.ndarray
+    leaves: np.ndarray
+    rows: np.ndarray
+    metric_sums: np.ndarray
+    _by_set: Dict[GroupingSet, int] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self) -> None:
+        self._by_set = {s: i for i, s in enumerate(self.sets)}
+
+    def has_set(self, positions: Sequence[int]) -> bool:
+        return tuple(positions) in self._by_set
+
+    def block(self, positions: Sequence[int], prefix: Sequence[int]) -> Optional[Tuple[int, int]]:
+        # Groups of one set are sorted by its dims in position order, so any
+        # leading run of fixed codes is a contiguous block.
+        s = self._by_set.get(tuple(positions))
+        if s is None:
+            return None
+        lo, hi = self.bounds[s]
+        for pos, c in zip(positions, prefix):
+            if lo >= hi:
+                break
+            col = self.codes[lo:hi, pos]
+            lo, hi = (
+                lo + int(np.searchsorted(col, c, side="left")),
+                lo + int(np.searchsorted(col, c, side="right")),
+            )
+        return lo, hi
+
+
+def _gid(positions: GroupingSet, n_dims: int) -> int:
+    # Same bit layout as DuckDB's GROUPING_ID: first column is the high bit and a
+    # set bit means the column is rolled up.
+    return sum(1 << (n_dims - 1 - i) for i in range(n_dims) if i not in positions)
+
+
+def build_rollup(
+    codes: np.ndarray,
+    rows: np.ndarray,
+    metric_sums: np.ndarray,
+    sets: Optional[List[GroupingSet]] = None,
+) -> Optional[Rollup]:
+    n_dims = int(codes.shape[1])
+    # With one dim the leaf index already is the only non-trivial level.
+    if n_dims < 2:
+        return None
+    sets = sets if sets is not None else default_sets(n_dims)
+    sets = [tuple(sorted(s)) for s in sets]
+    if not sets:
+        return None
+
+    code_cols = [f"c{i}" for i in range(n_dims)]
+    metric_cols = [f"m{i}" for i in range(metric_sums.shape[1])]
+    frame = pd.DataFrame(np.asarray(codes), columns=code_cols)
+    frame["_rows_"] = np.asarray(rows, dtype=np.int64)
+    for i, m in enumerate(metric_cols):
+        frame[m] = np.nan_to_num(np.asarray(metric_sums[:, i], dtype=np.float64))
+
+    grouping = ", ".join("(" + ", ".join(code_cols[i] for i in s) + ")" for s in sets)
+    select = (
+        code_cols
+        + [f"GROUPING_ID({', '.join(code_cols)}) AS _gid_", "COUNT(*) AS _leaves_", "SUM(_rows_) AS _rows_"]
+        + [f"SUM({m}) AS {m}" for m in metric_cols]
+    )
+    order = ", ".join(["_gid_ DESC"] + [f"{c} NULLS FIRST" for c in code_cols])
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.register("leaf_codes", frame)
+        out = conn.execute(
+            f"SELECT {', '.join(select)} FROM leaf_codes GROUP BY GROUPING SETS ({grouping}) ORDER BY {order}"
+        ).fetchdf()
+    finally:
+        conn.close()
+
+    gids = out["_gid_"].to_numpy()
+    bounds: List[Tuple[int, int]] = []
+    for s in sets:
+        g = _gid(s, n_dims)
+        # Sorted by _gid_ descending, so each set is one contiguous run.
+        lo = int(np.searchsorted(-gids, -g, side="left"))
+        hi = int(np.searchsorted(-gids, -g, side="right"))
+        bounds.append((lo, hi))
+    return Rollup(
+        sets=sets,
+        bounds=bounds,
+        codes=np.asfortranarray(out[code_cols].fillna(ROLLED_UP).to_numpy(dtype=np.int32)),
+        leaves=out["_leaves_"].to_numpy(dtype=np.int64),
+        rows=out["_rows_"].to_numpy(dtype=np.int64),
+        metric_sums=out[metric_cols].to_numpy(dtype=np.float64) if metric_cols else np.zeros((len(out), 0)),
+    )
+
+
+def write_rollup(path: Path, rollup: Rollup) -> None:
+    np.save(path / _CODES_FILE, np.asfortranarray(rollup.codes))
+    np.save(path / _LEAVES_FILE, rollup.leaves)
+    np.save(path / _ROWS_FILE, rollup.rows)
+    np.save(path / _METRICS_FILE, rollup.metric_sums)
+    with (path / _SETS_FILE).open("w", encoding="utf-8") as f:
+        json.dump({"sets": [list(s) for s in rollup.sets], "bounds": [list(b) for b in rollup.bounds]}, f)
+
+
+def load_rollup(path: Path) -> Optional[Rollup]:
+    if not (path / _SETS_FILE).exists():
+        return None
+    with (path / _SETS_FILE).open("r", encoding="utf-8") as f:
+        layout = json.load(f)
+    return Rollup(
+        sets=[tuple(s) for s in layout["sets"]],
+        bounds=[(int(lo), int(hi)) for lo, hi in layout["bounds"]],
+        codes=np.load(path / _CODES_FILE, mmap_mode="r"),
+        leaves=np.load(path / _LEAVES_FILE, mmap_mode="r"),
+        rows=np.load(path / _ROWS_FILE, mmap_mode="r"),
+        metric_sums=np.load(path / _METRICS_FILE, mmap_mode="r"),
+    )
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from .leaf_index import NULL_CODE, LeafIndex
+
+
+DEFAULT_TOKEN_BUDGET = 4000
+# Children listed under one node before the rest collapse into a tail line.
+DEFAULT_MAX_CHILDREN = 12
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English-ish YAML.
+    return len(text) // 4 + 1
+
+
+@dataclass
+class _Node:
+    depth: int
+    path: Tuple[int, ...]
+    rows: int
+    label: str
+    children: Optional[List["_Node"]] = None
+    hidden: int = 0
+    hidden_rows: int = 0
+    n_children: int = 0
+
+
+def _children(index: LeafIndex, node: _Node) -> List[_Node]:
+    # Served from the rollup cube when present, so expanding a node costs a
+    # binary search rather than a pass over every leaf beneath it.
+    codes, _, rows = index.children(node.path)
+    dim = index.dims[node.depth]
+    out: List[_Node] = []
+    for code, r in zip(codes.tolist(), rows.tolist()):
+        label = "nan" if code == NULL_CODE else index.value(dim, code)
+        out.append(_Node(depth=node.depth + 1, path=node.path + (code,), rows=int(r), label=label))
+    return out
+
+
+def _n_children(index: LeafIndex, node: _Node) -> int:
+    if node.depth >= len(index.dims):
+        return 0
+    return int(index.children(node.path)[0].size)
+
+
+def _node_line(index: LeafIndex, node: _Node, indent: str) -> str:
+    if node.depth >= len(index.dims) or node.children is not None:
+        return f"{indent}{node.label} (rows={node.rows})"
+    return f"{indent}{node.label} (rows={node.rows}, {node.n_children} values under {index.dims[node.depth]})"
+
+
+def _expand(index: LeafIndex, node: _Node, max_children: int) -> Tuple[List[_Node], int, int]:
+    kids = _children(index, node)
+    if len(kids) <= max_children:
+        return kids, 0, 0
+    keep = sorted(sorted(kids, key=lambda k: -k.rows)[:max_children], key=lambda k: k.path)
+    hidden_rows = node.rows - sum(k.rows for k in keep)
+    return keep, len(kids) - len(keep), hidden_rows
+
+
+def _expansion_cost(index: LeafIndex, node: _Node, kids: List[_Node], hidden: int) -> int:
+    indent = "  " * (node.depth + 1)
+    cost = 0
+    for k in kids:
+        k.n_children = _n_children(index, k)
+        cost += estimate_tokens(_node_line(index, k, indent))
+    if hidden:
+        cost += estimate_tokens(f"{indent}... {hidden} more values ({node.rows} rows)")
+    return cost
+
+
+def _render(index: LeafIndex, node: _Node, out: List[str]) -> None:
+    if node.children is None:
+        return
+    indent = "  " * (node.depth + 1)
+    for k in node.children:
+        out.append(_node_line(index, k, indent))
+        _render(index, k, out)
+    if node.hidden:
+        out.append(f"{indent}... {node.hidden} more values ({node.hidden_rows} rows)")
+
+
+def compile_routing_map(
+    index: LeafIndex,
+    dataset_id: str,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    prefix: Sequence[Optional[str]] = (),
+    max_children: int = DEFAULT_MAX_CHILDREN,
+) -> Optional[str]:
+    """
+    Render the leaf trie under ``prefix`` as an indented routing map within ``token_budget``.
+
+    Nodes are expanded largest-first by row count, so the budget goes to the
+    parts of the taxonomy that hold the data; each expansion lists at most
+    ``max_children`` values and folds the rest into a "N more values (M rows)"
+    line. Collapsed nodes report how many values sit beneath them. Returns None
+    when the prefix matches no leaf.
+    """
+    codes = index.encode(prefix) if prefix else ()
+    if codes is None:
+        return None
+    lo, hi = index.prefix_range(codes)
+    if hi <= lo:
+        return None
+
+    cumsum = index.rows_cumsum
+    root = _Node(depth=len(codes), path=tuple(codes), rows=int(cumsum[hi] - cumsum[lo]), label="")
+
+    header: List[str] = [f"dataset_id: {dataset_id}", "dims:"]
+    header += [f"  - {d}" for d in index.dims]
+    if index.metrics:
+        header.append("metrics:")
+        header += [f"  - {m}" for m in index.metrics]
+    if prefix:
+        path = ", ".join(f"{d}={v}" for d, v in zip(index.dims, prefix))
+        header.append(f"subtree: {path} (rows={root.rows})")
+    header.append("routing:")
+    remaining = token_budget - sum(estimate_tokens(line) for line in header)
+
+    # Max-heap on rows; the code path breaks ties so ordering stays deterministic.
+    heap: List[Tuple[int, Tuple[int, ...], _Node]] = [(-root.rows, root.path, root)]
+    truncated = False
+    while heap:
+        _, _, node = heapq.heappop(heap)
+        if node.depth >= len(index.dims):
+            continue
+        kids, hidden, hidden_rows = _expand(index, node, max_children)
+        cost = _expansion_cost(index, node, kids, hidden)
+        if cost > remaining and node is not root:
+            truncated = True
+            continue
+        remaining -= cost
+        node.children, node.hidden, node.hidden_rows = kids, hidden, hidden_rows
+        truncated = truncated or hidden > 0
+        for k in kids:
+            heapq.heappush(heap, (-k.rows, k.path, k))
+
+    lines = list(header)
+    _render(index, root, lines)
+    if truncated:
+        lines.append("# Pruned to fit the prompt; use RoutingSubtree(prefix=[...]) to list values under a path.")
+    return "\n".join(lines)
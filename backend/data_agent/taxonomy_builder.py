@@ -1,13 +1,83 @@
 from __future__ import annotations
 
-import json
 import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import replace
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import duckdb
+import numpy as np
 import pandas as pd
 
-from .dataset_registry import DatasetMetadata, dataset_dir, save_dataset
+from . import query_cache
+from .dataset_registry import DatasetMetadata, dataset_dir, get_dataset, save_dataset
+from .duckdb_init import ROW_ID_COLUMN, build_database, cursor, quote_ident, sql_string
+from .leaf_index import LeafIndex, build_leaf_index, get_leaf_index, leaf_frame, merge_leaf_index, write_leaf_index
+
+try:  # POSIX only: builds and appends are not serialized across processes without it
+    import fcntl
+except ImportError:  # pragma: no cover - depends on platform
+    fcntl = None  # type: ignore[assignment]
+
+
+_PARQUET_COMPRESSION = "zstd"
+_PARQUET_ROW_GROUP_SIZE = 122_880
+_NULL_TOKENS = ("", "nan", "none", "null")
+
+_ETL_ENGINES = ("duckdb", "pandas")
+_ETL_MEMORY_LIMIT = "1GB"
+# pandas.read_csv's default na_values, so both engines null out the same raw cells.
+_PANDAS_NA_VALUES = (
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+)
+# Every character str.strip() removes; DuckDB's one-argument trim() only strips spaces.
+_PY_WHITESPACE = (
+    " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005"
+    "\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+)
+_INT_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+}
+_FLOAT_TYPES = {"FLOAT", "DOUBLE", "REAL"}
+_ROW_ESTIMATE_BYTES = 1024 * 1024
+# What pandas.read_csv accepts as an integer, a float and a boolean cell.
+_CSV_INT_RE = r"[ \t]*[+-]?[0-9]+[ \t]*"
+_CSV_FLOAT_RE = r"[ \t]*[+-]?(?:(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|(?i:inf|infinity))[ \t]*"
+_CSV_BOOL_TOKENS = ("True", "TRUE", "true", "False", "FALSE", "false")
+_CSV_BLANK = sql_string(" \t")
+_TWO_63 = "CAST(9223372036854775808 AS HUGEINT)"
+_TWO_64 = "CAST(18446744073709551616 AS HUGEINT)"
+# pandas dtype kind -> the DuckDB type a column is stored as.
+_PANDAS_KIND_TYPES = {"i": "BIGINT", "u": "UBIGINT", "f": "DOUBLE", "b": "BOOLEAN"}
+_DELTAS_DIRNAME = "deltas"
+_LOCK_FILENAME = "dataset.lock"
+
+ProgressFn = Callable[[str, Dict[str, Any]], None]
+# Normalized column -> {"type": DuckDB type, "kind": _type_kind, "nullable": bool}.
+ColumnSchema = Dict[str, Dict[str, Any]]
+
+
+def _no_progress(stage: str, info: Dict[str, Any]) -> None:
+    return None
+
+
+def _estimate_rows(path: Path) -> int:
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        head = f.read(_ROW_ESTIMATE_BYTES)
+    lines = head.count(b"\n")
+    if not head or not lines:
+        return 0
+    if len(head) >= size:
+        return max(lines - 1, 0)
+    return int(size / (len(head) / lines))
 
 
 def _normalize_col(name: str) -> str:
@@ -22,29 +92,41 @@ def _normalize_val(value: Any) -> Optional[str]:
     if value is None:
         return None
     s = str(value).strip().lower()
-    if not s or s in {"nan", "none", "null"}:
+    if s in _NULL_TOKENS:
         return None
     return s
 
 
+def _normalize_series(values: pd.Series) -> pd.Series:
+    dtype = values.dtype
+    if not isinstance(dtype, np.dtype) or dtype.kind not in "biufO":
+        # Extension, categorical and datetime dtypes stringify differently under
+        # astype(str) than under str(), so they keep the per-cell path.
+        return values.map(_normalize_val)
+    # astype(str) calls str() on every cell (None -> "None", NaN -> "nan"), which
+    # is exactly what _normalize_val sees before strip/lower.
+    out = values.astype(str).str.strip().str.lower()
+    return out.where(~out.isin(_NULL_TOKENS), None)
+
+
 def _build_leaf_index(df: pd.DataFrame, dims: List[str], metrics: List[str]) -> pd.DataFrame:
     if not dims:
         df = df.copy()
         df["_rows_"] = 1
         agg = {"_rows_": "sum"}
         for m in metrics:
-            if m in df.columns:
+            if m in df.columns and df[m].dtype.kind in "biuf":
                 agg[m] = "sum"
         out = df.agg(agg)
         return out.to_frame().T
-    df = df.copy()
-    df["_rows_"] = 1
-    agg = {"_rows_": "sum"}
-    for m in metrics:
-        if m in df.columns:
-            agg[m] = "sum"
-    grouped = df.groupby(dims, dropna=False).agg(agg).reset_index()
-    return grouped
+    # Group the frame in place; adding a _rows_ column first would copy every row.
+    grouped = df.groupby(dims, dropna=False)
+    leaf = grouped.size().rename("_rows_").to_frame()
+    # Summing a text column concatenates strings, so only numeric metrics are kept.
+    metric_cols = [m for m in metrics if m in df.columns and df[m].dtype.kind in "biuf"]
+    if metric_cols:
+        leaf = leaf.join(grouped[metric_cols].sum())
+    return leaf.reset_index()
 
 
 def _taxonomy_yaml(
@@ -94,35 +176,39 @@ def _taxonomy_yaml(
     return "\n".join(lines)
 
 
-def _valid_sets(leaf_df: pd.DataFrame, dims: List[str]) -> Dict[str, Any]:
-    per_dim: Dict[str, List[str]] = {}
-    for d in dims:
-        if d not in leaf_df.columns:
-            continue;
-        vals = leaf_df[d].dropna().astype(str).str.strip().str.lower().unique().tolist()
-        vals = sorted({v for v in vals if v})
-        per_dim[d] = vals
-    combos_full: List[Tuple[str, ...]] = []
-    if dims:
-        for _, row in leaf_df[dims].iterrows():
-            combo = tuple(str(row[d]).strip().lower() if pd.notna(row[d]) else "nan" for d in dims)
-            combos_full.append(combo)
-    return {"per_dim": per_dim, "combos_full": combos_full}
+def _write_parquet(df: pd.DataFrame, path: Path, sort_dims: List[str]) -> None:
+    tmp_path = path.with_suffix(".parquet.tmp")
+    order_sql = ""
+    if sort_dims:
+        order_sql = " ORDER BY " + ", ".join(f"{quote_ident(d)} NULLS LAST" for d in sort_dims)
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.register("normalized_df", df)
+        conn.execute(
+            f"COPY (SELECT * FROM normalized_df{order_sql}) TO {sql_string(str(tmp_path))} "
+            f"(FORMAT PARQUET, COMPRESSION {_PARQUET_COMPRESSION}, ROW_GROUP_SIZE {_PARQUET_ROW_GROUP_SIZE})"
+        )
+    finally:
+        conn.close()
+    tmp_path.replace(path)
 
 
-def build_taxonomy(
+def _pandas_stage(
+    raw_path: Path,
+    norm_path: Path,
     meta: DatasetMetadata,
-    sample_size: Optional[int] = None,
-) -> DatasetMetadata:
-    if not meta.raw_path:
-        raise ValueError("DatasetMetadata.raw_path is required")
-    raw_path = Path(meta.raw_path)
-    if not raw_path.exists():
-        raise FileNotFoundError(str(raw_path))
-
+    sample_size: Optional[int],
+    progress: ProgressFn = _no_progress,
+) -> Tuple[List[str], List[str], pd.DataFrame, Dict[str, Any], ColumnSchema]:
     df = pd.read_csv(raw_path)
-    col_map = {_normalize_col(c): c for c in df.columns}
+    progress("normalizing", {"rows_total": int(df.shape[0]), "rows_processed": 0})
+    col_map = _column_map(df.columns)
+    df = df[[c for c in df.columns if col_map[_normalize_col(c)] == c]]
     df = df.rename(columns={v: k for k, v in col_map.items()})
+    schema: ColumnSchema = {}
+    for c in df.columns:
+        duckdb_type = _PANDAS_KIND_TYPES.get(df[c].dtype.kind, "VARCHAR")
+        schema[c] = {"type": duckdb_type, "kind": _type_kind(duckdb_type), "nullable": bool(df[c].isna().any())}
 
     dims = [_normalize_col(d) for d in meta.dims]
     metrics = [_normalize_col(m) for m in meta.metrics]
@@ -130,7 +216,8 @@ def build_taxonomy(
     metrics = [m for m in metrics if m in df.columns]
 
     for d in dims:
-        df[d] = df[d].map(_normalize_val)
+        df[d] = _normalize_series(df[d])
+    progress("leaf_index", {"rows_processed": int(df.shape[0])})
 
     if sample_size is not None and sample_size > 0:
         df_sample = df.head(sample_size)
@@ -143,28 +230,446 @@ def build_taxonomy(
         "leaf_rows": int(leaf_df.shape[0]),
         "cardinality": {d: int(df[d].nunique(dropna=True)) for d in dims},
     }
+    _write_parquet(df, norm_path, dims)
+    return dims, metrics, leaf_df, stats, schema
 
-    yaml_str = _taxonomy_yaml(meta.dataset_id, dims, metrics, leaf_df)
-    valid_sets = _valid_sets(leaf_df, dims)
 
+def _type_kind(duckdb_type: str) -> str:
+    t = duckdb_type.upper()
+    if t == "BOOLEAN":
+        return "bool"
+    if t in _INT_TYPES:
+        return "int"
+    if t in _FLOAT_TYPES or t.startswith("DECIMAL"):
+        return "float"
+    return "text"
+
+
+def _csv_source(raw_path: Path, names: List[str]) -> str:
+    # Every column is read verbatim under a positional name; types are decided
+    # afterwards the way pandas.read_csv decides them.
+    na_values = "[" + ", ".join(sql_string(v) for v in _PANDAS_NA_VALUES) + "]"
+    columns = "[" + ", ".join(sql_string(n) for n in names) + "]"
+    return (
+        f"read_csv({sql_string(str(raw_path))}, header=true, auto_detect=true, all_varchar=true, "
+        f"names={columns}, nullstr={na_values})"
+    )
+
+
+def _column_map(columns: Iterable[str]) -> Dict[str, str]:
+    # Normalized name -> raw header; when two headers normalize alike the last one wins.
+    return {_normalize_col(c): c for c in columns}
+
+
+def _infer_sql(expr: str) -> List[str]:
+    matches_int = f"regexp_full_match({expr}, {sql_string(_CSV_INT_RE)})"
+    return [
+        f"COUNT({expr})",
+        f"COUNT(*) FILTER (WHERE {matches_int})",
+        f"COUNT(TRY_CAST(trim({expr}, {_CSV_BLANK}) AS BIGINT)) FILTER (WHERE {matches_int})",
+        f"COUNT(TRY_CAST(trim({expr}, {_CSV_BLANK}) AS UBIGINT)) FILTER (WHERE {matches_int})",
+        f"COUNT(*) FILTER (WHERE regexp_full_match({expr}, {sql_string(_CSV_FLOAT_RE)}))",
+        f"COUNT(*) FILTER (WHERE {expr} IN ({', '.join(sql_string(t) for t in _CSV_BOOL_TOKENS)}))",
+    ]
+
+
+def _infer_column(total: int, counts: Tuple[int, ...]) -> Dict[str, Any]:
+    # The dtype pandas.read_csv would give a column, from _infer_sql's counts.
+    present, ints, int64s, uint64s, floats, bools = counts
+    nullable = present < total
+    if not present:
+        return {"type": "DOUBLE", "kind": "float", "nullable": nullable}
+    if ints == present and int64s == present:
+        return {"type": "BIGINT", "kind": "int", "nullable": nullable}
+    if ints == present and uint64s == present and not nullable:
+        return {"type": "UBIGINT", "kind": "int", "nullable": False}
+    if ints != present and floats == present:
+        return {"type": "DOUBLE", "kind": "float", "nullable": nullable}
+    if bools == present and not nullable:
+        return {"type": "BOOLEAN", "kind": "bool", "nullable": False}
+    return {"type": "VARCHAR", "kind": "text", "nullable": nullable}
+
+
+def _typed_sql(expr: str, col: Dict[str, Any]) -> str:
+    duckdb_type = col["type"]
+    if col["kind"] == "int" and col["nullable"]:
+        # pandas reads an int column with missing values as float64.
+        duckdb_type = "DOUBLE"
+    if duckdb_type == "VARCHAR":
+        return expr
+    if col["kind"] in ("int", "float"):
+        expr = f"trim({expr}, {_CSV_BLANK})"
+    return f"CAST({expr} AS {duckdb_type})"
+
+
+def _normalize_sql(expr: str, kind: str) -> str:
+    text = expr if kind == "text" else f"CAST({expr} AS VARCHAR)"
+    norm = f"lower(trim({text}, {sql_string(_PY_WHITESPACE)}))"
+    tokens = ", ".join(sql_string(t) for t in _NULL_TOKENS)
+    return f"CASE WHEN {norm} IN ({tokens}) THEN NULL ELSE {norm} END"
+
+
+def _sum_sql(expr: str, col: Dict[str, Any]) -> Optional[str]:
+    # pandas sums skip NaN and yield 0 for all-null groups; int64 and uint64 sums
+    # keep their dtype and wrap around on overflow like numpy's.
+    if col["kind"] == "bool":
+        return f"CAST(COALESCE(SUM(CAST({expr} AS INTEGER)), 0) AS BIGINT)"
+    if col["kind"] == "int" and not col["nullable"]:
+        total = f"CAST(COALESCE(SUM({expr}), 0) AS HUGEINT)"
+        if col["type"] == "UBIGINT":
+            return f"CAST({total} % {_TWO_64} AS UBIGINT)"
+        return f"CAST(((({total} + {_TWO_63}) % {_TWO_64}) + {_TWO_64}) % {_TWO_64} - {_TWO_63} AS BIGINT)"
+    if col["kind"] in ("int", "float"):
+        return f"CAST(COALESCE(SUM({expr}), 0) AS DOUBLE)"
+    return None
+
+
+def _leaf_sql(source: str, dims: List[str], metric_exprs: Dict[str, str]) -> str:
+    select = [quote_ident(d) for d in dims] + ["COUNT(*) AS _rows_"]
+    for m, expr in metric_exprs.items():
+        select.append(f"{expr} AS {quote_ident(m)}")
+    sql = f"SELECT {', '.join(select)} FROM {source}"
+    if dims:
+        group = ", ".join(quote_ident(d) for d in dims)
+        order = ", ".join(f"{quote_ident(d)} NULLS LAST" for d in dims)
+        sql += f" GROUP BY {group} ORDER BY {order}"
+    return sql
+
+
+def _duckdb_stage(
+    raw_path: Path,
+    norm_path: Path,
+    meta: DatasetMetadata,
+    sample_size: Optional[int],
+    memory_limit: Optional[str],
+    threads: Optional[int],
+    progress: ProgressFn = _no_progress,
+    schema: Optional[ColumnSchema] = None,
+) -> Tuple[List[str], List[str], pd.DataFrame, Dict[str, Any], ColumnSchema]:
+    temp_dir = norm_path.parent / "_etl_spill"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.execute(f"SET memory_limit = {sql_string(memory_limit or _ETL_MEMORY_LIMIT)}")
+        conn.execute(f"SET temp_directory = {sql_string(str(temp_dir))}")
+        if threads:
+            conn.execute(f"SET threads = {int(threads)}")
+
+        # pandas keeps headers verbatim (DuckDB would rename case-insensitive
+        # duplicates), so take them from pandas and read the columns by position.
+        headers = [str(c) for c in pd.read_csv(raw_path, nrows=0).columns]
+        positions = [f"c{i}" for i in range(len(headers))]
+        source = _csv_source(raw_path, positions)
+        col_map = _column_map(headers)
+        raw_exprs = {h: f"NULLIF({quote_ident(p)}, '')" for h, p in zip(headers, positions)}
+
+        dims = [_normalize_col(d) for d in meta.dims]
+        metrics = [_normalize_col(m) for m in meta.metrics]
+        dims = [d for d in dims if d in col_map]
+        metrics = [m for m in metrics if m in col_map]
+
+        # One streaming pass decides every column's type, so no later scan can
+        # fail on a value a sample never saw.
+        infer_sql = ["COUNT(*)"] + [part for raw in col_map.values() for part in _infer_sql(raw_exprs[raw])]
+        row = conn.execute(f"SELECT {', '.join(infer_sql)} FROM {source}").fetchone() or (0,)
+        out_schema: ColumnSchema = {}
+        for i, norm in enumerate(col_map):
+            out_schema[norm] = _infer_column(int(row[0]), tuple(row[1 + 6 * i : 7 + 6 * i]))
+        # An append reads its delta with the base dataset's types, so a column the
+        # delta alone would infer differently still normalizes the same way.
+        for norm, col in (schema or {}).items():
+            if norm in out_schema:
+                out_schema[norm] = dict(col)
+
+        select_parts: List[str] = []
+        for norm, raw in col_map.items():
+            expr = _typed_sql(raw_exprs[raw], out_schema[norm])
+            if norm in dims:
+                expr = _normalize_sql(expr, out_schema[norm]["kind"])
+            select_parts.append(f"{expr} AS {quote_ident(norm)}")
+        normalized_sql = f"SELECT {', '.join(select_parts)} FROM {source}"
+
+        order_sql = ""
+        if dims:
+            order_sql = " ORDER BY " + ", ".join(f"{quote_ident(d)} NULLS LAST" for d in dims)
+        tmp_path = norm_path.with_suffix(".parquet.tmp")
+        progress("normalizing", {})
+        conn.execute(
+            f"COPY ({normalized_sql}{order_sql}) TO {sql_string(str(tmp_path))} "
+            f"(FORMAT PARQUET, COMPRESSION {_PARQUET_COMPRESSION}, ROW_GROUP_SIZE {_PARQUET_ROW_GROUP_SIZE})"
+        )
+        tmp_path.replace(norm_path)
+        parquet = f"read_parquet({sql_string(str(norm_path))})"
+
+        counts_sql = ["COUNT(*)"] + [f"COUNT(DISTINCT {quote_ident(d)})" for d in dims]
+        totals = conn.execute(f"SELECT {', '.join(counts_sql)} FROM {parquet}").fetchone() or (0,)
+        progress("leaf_index", {"rows_total": int(totals[0]), "rows_processed": int(totals[0])})
+
+        metric_exprs: Dict[str, str] = {}
+        for m in metrics:
+            expr = _sum_sql(quote_ident(m), out_schema[m])
+            if expr is not None:
+                metric_exprs[m] = expr
+        leaf_source = parquet
+        if sample_size is not None and sample_size > 0:
+            leaf_source = f"({normalized_sql} LIMIT {int(sample_size)})"
+        leaf_df = conn.execute(_leaf_sql(leaf_source, dims, metric_exprs)).fetchdf()
+    finally:
+        conn.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    stats = {
+        "total_rows": int(totals[0]),
+        "leaf_rows": int(leaf_df.shape[0]),
+        "cardinality": {d: int(n) for d, n in zip(dims, totals[1:])},
+    }
+    return dims, metrics, leaf_df, stats, out_schema
+
+
+def build_taxonomy(
+    meta: DatasetMetadata,
+    sample_size: Optional[int] = None,
+    engine: str = "duckdb",
+    memory_limit: Optional[str] = None,
+    threads: Optional[int] = None,
+    progress: Optional[ProgressFn] = None,
+) -> DatasetMetadata:
+    if not meta.raw_path:
+        raise ValueError("DatasetMetadata.raw_path is required")
+    if engine not in _ETL_ENGINES:
+        raise ValueError(f"Unknown ETL engine: {engine}")
+    raw_path = Path(meta.raw_path)
+    if not raw_path.exists():
+        raise FileNotFoundError(str(raw_path))
+    with _dataset_lock(meta.dataset_id):
+        return _build_taxonomy(meta, raw_path, sample_size, engine, memory_limit, threads, progress)
+
+
+def _build_taxonomy(
+    meta: DatasetMetadata,
+    raw_path: Path,
+    sample_size: Optional[int],
+    engine: str,
+    memory_limit: Optional[str],
+    threads: Optional[int],
+    progress: Optional[ProgressFn],
+) -> DatasetMetadata:
     ddir = dataset_dir(meta.dataset_id)
-    norm_path = ddir / "normalized.csv"
+    norm_path = ddir / "normalized.parquet"
     yaml_path = ddir / "taxonomy.yaml"
-    valid_path = ddir / "valid_sets.json"
+    index_path = ddir / "leaf_index"
+    # Each build gets its own file: DuckDB hands a reopen of a path still open
+    # in this process the old database, so reusing the name would keep serving
+    # the previous build until every handle on it had closed.
+    routing_version = _new_routing_version()
+    db_path = ddir / f"dataset-{routing_version}.duckdb"
+
+    report = progress or _no_progress
+    report("reading", {"rows_total": _estimate_rows(raw_path)})
+    if engine == "duckdb":
+        dims, metrics, leaf_df, stats, schema = _duckdb_stage(
+            raw_path, norm_path, meta, sample_size, memory_limit, threads, report
+        )
+    else:
+        dims, metrics, leaf_df, stats, schema = _pandas_stage(raw_path, norm_path, meta, sample_size, report)
+
+    report("yaml", {})
+    yaml_str = _taxonomy_yaml(meta.dataset_id, dims, metrics, leaf_df)
+    sampled = sample_size is not None and sample_size > 0
 
-    df.to_csv(norm_path, index=False)
+    (ddir / "normalized.csv").unlink(missing_ok=True)
+    (ddir / "valid_sets.json").unlink(missing_ok=True)
     yaml_path.write_text(yaml_str, encoding="utf-8")
-    with valid_path.open("w", encoding="utf-8") as f:
-        json.dump(valid_sets, f, ensure_ascii=False, indent=2)
+    write_leaf_index(index_path, build_leaf_index(leaf_df, dims, metrics, sampled=sampled))
 
+    # A rebuild starts over from raw_path, so parts from earlier appends must not
+    # be folded into the new table or counted against the new stats.
+    # The saved metadata names the live files, even when meta is an older copy.
+    try:
+        live = get_dataset(meta.dataset_id)
+    except KeyError:
+        live = meta
+    stale_index_path = live.leaf_index_path
+    stale_db_path = live.duckdb_path
+    meta.delta_paths = []
+    meta.extra = {k: v for k, v in meta.extra.items() if k != "appends"}
     meta.normalized_path = str(norm_path)
+    meta.storage_format = "parquet"
+    report("duckdb", {})
+    build_database(meta, db_path)
+    meta.duckdb_path = str(db_path)
     meta.taxonomy_yaml_path = str(yaml_path)
-    meta.valid_sets_path = str(valid_path)
+    meta.valid_sets_path = None
+    meta.leaf_index_path = str(index_path)
     meta.dims = dims
     meta.metrics = metrics
     meta.stats = stats
+    meta.extra = {**meta.extra, "schema": schema}
+    meta.routing_version = routing_version
 
     save_dataset(meta)
+    query_cache.invalidate(meta.dataset_id)
+    shutil.rmtree(ddir / _DELTAS_DIRNAME, ignore_errors=True)
+    if stale_index_path and Path(stale_index_path) != index_path:
+        shutil.rmtree(stale_index_path, ignore_errors=True)
+    if stale_db_path and Path(stale_db_path) != db_path:
+        # Handles still open on it keep reading the unlinked file until they close.
+        _unlink_quietly(Path(stale_db_path))
     return meta
 
 
+def _unlink_quietly(path: Path) -> None:
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _new_routing_version() -> str:
+    return f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+
+def deltas_dir(dataset_id: str) -> Path:
+    d = dataset_dir(dataset_id) / _DELTAS_DIRNAME
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _number_rows(src: Path, dest: Path, start_row_id: int) -> None:
+    # Appended rows continue the main file's row numbering so keyset pagination
+    # and the DuckDB table agree on _row_id_.
+    tmp_path = dest.with_suffix(".parquet.tmp")
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.execute(
+            f"COPY (SELECT * EXCLUDE (file_row_number), file_row_number + {int(start_row_id)} AS {ROW_ID_COLUMN} "
+            f"FROM read_parquet({sql_string(str(src))}, file_row_number = true)) TO {sql_string(str(tmp_path))} "
+            f"(FORMAT PARQUET, COMPRESSION {_PARQUET_COMPRESSION}, ROW_GROUP_SIZE {_PARQUET_ROW_GROUP_SIZE})"
+        )
+    finally:
+        conn.close()
+    tmp_path.replace(dest)
+
+
+_INT_TEXT = re.compile(r"-?\d+")
+_NULLABLE_INT_TEXT = re.compile(r"-?\d+\.0")
+
+
+def _stored_schema(meta: DatasetMetadata, index: LeafIndex) -> ColumnSchema:
+    # Datasets built before the schema was recorded: non-dim columns keep their
+    # type in the normalized file, and a dim's stored values show how it was
+    # rendered ("5.0" only comes from an int column with missing values).
+    conn = duckdb.connect(database=":memory:")
+    try:
+        described = conn.execute(
+            f"DESCRIBE SELECT * FROM read_parquet({sql_string(str(meta.normalized_path))})"
+        ).fetchall()
+    finally:
+        conn.close()
+    schema: ColumnSchema = {}
+    for name, duckdb_type, *_ in described:
+        schema[name] = {"type": duckdb_type, "kind": _type_kind(duckdb_type), "nullable": False}
+    for d in meta.dims:
+        values = index.per_dim.get(d, [])
+        if values and all(_NULLABLE_INT_TEXT.fullmatch(v) for v in values):
+            schema[d] = {"type": "BIGINT", "kind": "int", "nullable": True}
+        elif values and all(_INT_TEXT.fullmatch(v) for v in values):
+            schema[d] = {"type": "BIGINT", "kind": "int", "nullable": False}
+        else:
+            schema[d] = {"type": "VARCHAR", "kind": "text", "nullable": False}
+    return schema
+
+
+_DATASET_LOCKS: Dict[str, threading.Lock] = {}
+_DATASET_LOCKS_GUARD = threading.Lock()
+
+
+@contextmanager
+def _dataset_lock(dataset_id: str) -> Iterator[None]:
+    # Builds and appends read the metadata, write new files and save it back. An
+    # exclusive flock on the dataset held across all of that keeps two workers
+    # from losing each other's update; the thread lock covers platforms without it.
+    with _DATASET_LOCKS_GUARD:
+        lock = _DATASET_LOCKS.setdefault(dataset_id, threading.Lock())
+    with lock, (dataset_dir(dataset_id) / _LOCK_FILENAME).open("a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def append_rows(
+    meta: DatasetMetadata,
+    raw_path: Path,
+    append_id: str,
+    memory_limit: Optional[str] = None,
+    threads: Optional[int] = None,
+    progress: Optional[ProgressFn] = None,
+) -> DatasetMetadata:
+    # Only the delta is normalized; it becomes a Parquet part read beside the DuckDB file.
+    if not raw_path.exists():
+        raise FileNotFoundError(str(raw_path))
+    with _dataset_lock(meta.dataset_id):
+        # Another worker may have appended or rebuilt while this one waited. A copy,
+        # so readers of the cached metadata never see it half updated.
+        meta = replace(get_dataset(meta.dataset_id))
+        if any(a.get("append_id") == append_id for a in meta.extra.get("appends", [])):
+            return meta
+        index = get_leaf_index(meta)
+        if index is None or not meta.leaf_index_path:
+            raise ValueError(f"Dataset {meta.dataset_id} has no leaf index; rebuild it before appending")
+        with cursor(meta) as (handle, _):
+            if handle.row_id != ROW_ID_COLUMN:
+                raise ValueError(f"Dataset {meta.dataset_id} has no {ROW_ID_COLUMN}; rebuild it before appending")
+
+        report = progress or _no_progress
+        report("reading", {"rows_total": _estimate_rows(raw_path)})
+        ddir = dataset_dir(meta.dataset_id)
+        norm_path = deltas_dir(meta.dataset_id) / f"{append_id}.normalized.parquet"
+        part_path = deltas_dir(meta.dataset_id) / f"{append_id}.parquet"
+        schema = meta.extra.get("schema") or _stored_schema(meta, index)
+        dims, _, leaf_df, stats, _ = _duckdb_stage(
+            raw_path, norm_path, meta, None, memory_limit, threads, report, schema=schema
+        )
+        missing = [d for d in meta.dims if d not in dims]
+        if missing:
+            norm_path.unlink(missing_ok=True)
+            raise ValueError(f"Delta is missing dims: {', '.join(missing)}")
+        start_row_id = int((meta.stats or {}).get("total_rows", 0))
+        _number_rows(norm_path, part_path, start_row_id)
+        norm_path.unlink(missing_ok=True)
+
+        merged = merge_leaf_index(index, leaf_df)
+        # Written beside the live index and switched over with the metadata, so
+        # readers never see counts that include rows the table does not have yet.
+        index_path = ddir / f"leaf_index-{append_id}"
+        write_leaf_index(index_path, merged)
+
+        report("yaml", {})
+        yaml_path = ddir / "taxonomy.yaml"
+        yaml_tmp = yaml_path.with_suffix(".yaml.tmp")
+        yaml_str = _taxonomy_yaml(meta.dataset_id, meta.dims, merged.metrics, leaf_frame(merged))
+        yaml_tmp.write_text(yaml_str, encoding="utf-8")
+        yaml_tmp.replace(yaml_path)
+
+        old_index_path = Path(meta.leaf_index_path)
+        delta_rows = int(stats["total_rows"])
+        meta.delta_paths = list(meta.delta_paths) + [str(part_path)]
+        meta.leaf_index_path = str(index_path)
+        meta.taxonomy_yaml_path = str(yaml_path)
+        meta.stats = {
+            **(meta.stats or {}),
+            "total_rows": start_row_id + delta_rows,
+            "leaf_rows": len(merged),
+            "cardinality": {d: len(merged.per_dim.get(d, [])) for d in meta.dims},
+        }
+        meta.extra = {
+            **meta.extra,
+            "appends": list(meta.extra.get("appends", []))
+            + [{"append_id": append_id, "rows": delta_rows, "at": time.time()}],
+        }
+        meta.routing_version = _new_routing_version()
+        save_dataset(meta)
+        query_cache.invalidate(meta.dataset_id)
+        if old_index_path != index_path:
+            shutil.rmtree(old_index_path, ignore_errors=True)
+        return meta
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+try:  # optional: only needed for .zst uploads
+    import zstandard  # type: ignore[import]
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None  # type: ignore[assignment]
+
+
+CHUNK_SIZE = 1024 * 1024
+_SAMPLE_ROWS = 100
+_SAMPLE_MAX_BYTES = 8 * 1024 * 1024
+# Cap on how much a single decompress call may emit, so a highly compressed
+# chunk cannot balloon into one huge bytes object.
+_MAX_PIECE = 4 * 1024 * 1024
+
+# What the decoders raise on a corrupt stream.
+_DECODE_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+@dataclass
+class UploadResult:
+    path: Path
+    columns: List[str]
+    inferred_types: Dict[str, str]
+    content_hash: str
+    bytes_received: int
+    bytes_written: int
+    compression: Optional[str] = None
+
+
+def infer_types(sample: bytes) -> Dict[str, str]:
+    df = pd.read_csv(io.BytesIO(sample), nrows=_SAMPLE_ROWS)
+    inferred: Dict[str, str] = {}
+    for c in df.columns:
+        dt = df[c].dtype
+        if pd.api.types.is_numeric_dtype(dt):
+            inferred[c] = "number"
+        elif pd.api.types.is_datetime64_any_dtype(dt):
+            inferred[c] = "datetime"
+        else:
+            inferred[c] = "string"
+    return inferred
+
+
+class _GzipDecoder:
+    def __init__(self, out: Callable[[bytes], None]) -> None:
+        self._out = out
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def write(self, data: bytes) -> None:
+        while data:
+            self._out(self._d.decompress(data, _MAX_PIECE))
+            while self._d.unconsumed_tail:
+                self._out(self._d.decompress(self._d.unconsumed_tail, _MAX_PIECE))
+            data = b""
+            # Concatenated gzip members (e.g. from `cat a.gz b.gz`) are valid gzip.
+            if self._d.eof and self._d.unused_data:
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def close(self) -> None:
+        self._out(self._d.flush())
+
+
+class _ZstdDecoder:
+    class _Writer(io.RawIOBase):
+        def __init__(self, out: Callable[[bytes], None]) -> None:
+            self._out = out
+
+        def writable(self) -> bool:
+            return True
+
+        def write(self, data: Any) -> int:
+            self._out(bytes(data))
+            return len(data)
+
+    def __init__(self, out: Callable[[bytes], None]) -> None:
+        if zstandard is None:
+            raise ValueError("zstd-compressed uploads require the 'zstandard' package")
+        self._w = zstandard.ZstdDecompressor().stream_writer(self._Writer(out), closefd=False)
+
+    def write(self, data: bytes) -> None:
+        self._w.write(data)
+
+    def close(self) -> None:
+        self._w.flush()
+
+
+class _PlainDecoder:
+    def __init__(self, out: Callable[[bytes], None]) -> None:
+        self._out = out
+
+    def write(self, data: bytes) -> None:
+        self._out(data)
+
+    def close(self) -> None:
+        return None
+
+
+def _detect_compression(filename: str, head: bytes) -> Optional[str]:
+    name = filename.lower()
+    if name.endswith(".gz") or head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if name.endswith(".zst") or name.endswith(".zstd") or head.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+@dataclass
+class UploadSink:
+    """
+    Single-pass upload writer.
+
+    Chunks are hashed as received, decompressed if needed and appended to
+    ``dest``; the first rows of the decompressed stream are kept aside so type
+    inference runs as soon as enough of the file has arrived. Memory use is
+    bounded by the chunk size plus the inference sample.
+    """
+
+    dest: Path
+    filename: str = ""
+    _hasher: Any = field(default_factory=hashlib.sha256, repr=False)
+    _file: Any = field(default=None, repr=False)
+    _decoder: Any = field(default=None, repr=False)
+    _sample: bytearray = field(default_factory=bytearray, repr=False)
+    _sample_done: bool = False
+    _inferred: Optional[Dict[str, str]] = None
+    compression: Optional[str] = None
+    bytes_received: int = 0
+    bytes_written: int = 0
+
+    def _emit(self, data: bytes) -> None:
+        if not data:
+            return
+        self._file.write(data)
+        self.bytes_written += len(data)
+        if self._sample_done:
+            return
+        room = _SAMPLE_MAX_BYTES - len(self._sample)
+        self._sample.extend(data[:room])
+        # Header plus the sample rows, with slack for records containing quoted newlines.
+        if self._sample.count(b"\n") > 2 * (_SAMPLE_ROWS + 1) or len(self._sample) >= _SAMPLE_MAX_BYTES:
+            self._sample_done = True
+            try:
+                self._inferred = infer_types(bytes(self._sample))
+            except Exception:
+                self._inferred = None
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self._decoder is None:
+            self.compression = _detect_compression(self.filename, chunk[:4])
+            self.dest.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.dest.open("wb")
+            if self.compression == "gzip":
+                self._decoder = _GzipDecoder(self._emit)
+            elif self.compression == "zstd":
+                self._decoder = _ZstdDecoder(self._emit)
+            else:
+                self._decoder = _PlainDecoder(self._emit)
+        self._hasher.update(chunk)
+        self.bytes_received += len(chunk)
+        try:
+            self._decoder.write(chunk)
+        except _DECODE_ERRORS as e:
+            raise ValueError(f"Corrupt {self.compression} stream: {e}")
+
+    def finish(self) -> UploadResult:
+        if self._decoder is None:
+            raise ValueError("Upload is empty")
+        try:
+            self._decoder.close()
+        except _DECODE_ERRORS as e:
+            raise ValueError(f"Corrupt {self.compression} stream: {e}")
+        finally:
+            self._file.close()
+        inferred = self._inferred
+        if inferred is None:
+            try:
+                inferred = infer_types(bytes(self._sample))
+            except Exception as e:
+                raise ValueError(f"Could not read CSV: {e}")
+        return UploadResult(
+            path=self.dest,
+            columns=list(inferred),
+            inferred_types=inferred,
+            content_hash=self._hasher.hexdigest(),
+            bytes_received=self.bytes_received,
+            bytes_written=self.bytes_written,
+            compression=self.compression,
+        )
+
+    def abort(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+        self.dest.unlink(missing_ok=True)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .dataset_registry import datasets_root
+
+
+_DB_FILENAME = "user_datasets.sqlite3"
+# The JSON file the mapping lived in before; imported once, then left alone.
+_LEGACY_FILENAME = "user_datasets.json"
+_BUSY_TIMEOUT_MS = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_datasets (
+    user_id TEXT PRIMARY KEY,
+    dataset_id TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_map_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _db_path() -> Path:
+    return datasets_root().parent / _DB_FILENAME
+
+
+class UserDatasetMap:
+    """
+    user_id -> current dataset_id in a small SQLite database.
+
+    Lookups are served from an in-process dict. ``PRAGMA data_version`` changes
+    only when another connection (another worker process) commits, so a single
+    pragma per lookup is enough to know whether the dict is stale. Writes are
+    single-row upserts, so concurrent writers never lose each other's updates.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._path: Optional[Path] = None
+        self._version: Optional[int] = None
+        self._cache: Dict[str, Optional[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _connect_locked(self) -> sqlite3.Connection:
+        path = _db_path()
+        if self._conn is not None and self._path == path:
+            return self._conn
+        conn = sqlite3.connect(
+            str(path), isolation_level=None, timeout=_BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+        conn.executescript(_SCHEMA)
+        _import_legacy(conn, path.parent / _LEGACY_FILENAME)
+        self._conn, self._path = conn, path
+        self._version = None
+        self._cache = {}
+        return conn
+
+    def _check_locked(self, conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            if self._version is not None:
+                self.reloads += 1
+            self._cache = {}
+            self._version = version
+
+    def get(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connect_locked()
+            self._check_locked(conn)
+            if user_id in self._cache:
+                self.hits += 1
+                return self._cache[user_id]
+            self.misses += 1
+            row = conn.execute("SELECT dataset_id FROM user_datasets WHERE user_id = ?", (user_id,)).fetchone()
+            value = row[0] if row else None
+            self._cache[user_id] = value
+            return value
+
+    def set(self, user_id: str, dataset_id: str) -> None:
+        with self._lock:
+            conn = self._connect_locked()
+            conn.execute(
+                "INSERT INTO user_datasets (user_id, dataset_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET dataset_id = excluded.dataset_id, "
+                "updated_at = excluded.updated_at",
+                (user_id, dataset_id, time.time()),
+            )
+            # This connection's own commits leave data_version unchanged, so the
+            # cache is updated here rather than reloaded.
+            self._check_locked(conn)
+            self._cache[user_id] = dataset_id
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn, self._path, self._version, self._cache = None, None, None, {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses, "reloads": self.reloads}
+
+
+def _import_legacy(conn: sqlite3.Connection, legacy_path: Path) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM user_map_state WHERE key = 'legacy_imported'").fetchone() is None:
+            mapping: Dict[str, str] = {}
+            if legacy_path.exists():
+                try:
+                    mapping = json.loads(legacy_path.read_text(encoding="utf-8"))
+                except Exception:
+                    mapping = {}
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_datasets (user_id, dataset_id, updated_at) VALUES (?, ?, ?)",
+                [(str(u), str(d), now) for u, d in mapping.items()],
+            )
+            conn.execute("INSERT INTO user_map_state (key, value) VALUES ('legacy_imported', ?)", (str(now),))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+_MAP = UserDatasetMap()
+
+
+def get_user_dataset(user_id: str) -> Optional[str]:
+    return _MAP.get(user_id)
+
+
+def set_user_dataset(user_id: str, dataset_id: str) -> None:
+    _MAP.set(user_id, dataset_id)
+
+
+def close() -> None:
+    _MAP.close()
+
+
+def stats() -> Dict[str, Any]:
+    return _MAP.stats()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .leaf_index import LeafIndex, from_valid_sets
+
+
+ValidSets = Union[LeafIndex, Dict[str, Any]]
+
+
+def _as_index(valid_sets: ValidSets, dims: List[str]) -> LeafIndex:
+    if isinstance(valid_sets, LeafIndex):
+        return valid_sets
+    return from_valid_sets(valid_sets, dims)
+
+
+def _canonical_value(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    s = str(value).strip().lower()
+    return s or None
+
+
+def canonicalize(
+    filters: Dict[str, List[Any]],
+    index: LeafIndex,
+) -> Tuple[Dict[str, List[str]], Dict[str, Any]]:
+    dims = index.dims
+    by_key = {str(k).strip().lower(): v for k, v in (filters or {}).items()}
+    unknown_dims = [k for k in by_key if k not in dims]
+    canonical: Dict[str, List[str]] = {}
+    dropped_values: Dict[str, List[str]] = {}
+    for dim in dims:
+        if dim not in by_key:
+            continue
+        vals = by_key[dim]
+        if isinstance(vals, (str, bytes)) or not isinstance(vals, (list, tuple, set)):
+            vals = [vals]
+        kept: List[str] = []
+        for v in vals:
+            s = _canonical_value(v)
+            if s is None or s in kept:
+                continue
+            if index.code(dim, s) is None:
+                dropped_values.setdefault(dim, []).append(s)
+                continue
+            kept.append(s)
+        if kept:
+            canonical[dim] = kept
+    return canonical, {"unknown_dims": unknown_dims, "dropped_values": dropped_values}
+
+
+def validate_and_backoff(
+    filters: Dict[str, List[Any]],
+    valid_sets: ValidSets,
+    dims: List[str],
+) -> Tuple[bool, Dict[str, List[str]], Dict[str, Any]]:
+    """
+    Resolve requested filters to the nearest populated ancestor in the leaf trie.
+
+    Values are canonicalized and checked against the per-dim dictionaries; if
+    the surviving filter set matches no leaf, the filter on the deepest dim (in
+    taxonomy order) is dropped until some leaf matches. Returns
+    ``(ok, canonical_filters, diag)``.
+    """
+    index = _as_index(valid_sets, dims)
+    candidates, notes = canonicalize(filters, index)
+    diag: Dict[str, Any] = {
+        "requested": filters,
+        "canonical_candidates": candidates,
+        "used": {},
+        "backoff_level": None,
+        "reason": None,
+        # A requested dim none of whose values exist is already a widening.
+        "dropped_dims": [d for d in index.dims if d in notes["dropped_values"] and d not in candidates],
+        "counts": {},
+        **notes,
+    }
+    if not candidates:
+        diag["reason"] = "no_valid_filters"
+        return False, {}, diag
+
+    used = dict(candidates)
+    order = [d for d in index.dims if d in used]
+    while order:
+        leaves, rows, _ = index.totals(index.constraints(used))
+        if leaves:
+            diag["used"] = used
+            diag["backoff_level"] = "exact" if not diag["dropped_dims"] else "ancestor"
+            diag["counts"] = {"matched_leaves": leaves, "matched_rows": rows, "rows_exact": not index.sampled}
+            return True, used, diag
+        deepest = order.pop()
+        diag["dropped_dims"].append(deepest)
+        used = {d: v for d, v in used.items() if d != deepest}
+
+    diag["backoff_level"] = "none"
+    diag["reason"] = "no_populated_ancestor"
+    return False, {}, diag
@@ -0,0 +1,87 @@
+"""
+Compare row-dict, columnar and Arrow result materialization for /run/filters.
+
+Run from the repository root:
+    python -m benchmarks.bench_columnar --rows 1000000 --dims 6 --metrics 3
+
+Each path is timed from the finished DuckDB query through to the encoded
+response body, so the numbers include JSON (or Arrow IPC) serialization.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from backend.data_agent.duckdb_query import _fetch_arrow, _fetch_columns, arrow_ipc_bytes, pyarrow
+
+
+def _make_frame(rows: int, dims: int, metrics: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(dims):
+        vocab = np.array([f"value_{i}_{k}" for k in range(20)], dtype=object)
+        data[f"dim_{i}"] = vocab[rng.integers(0, len(vocab), size=rows)]
+    for i in range(metrics):
+        data[f"metric_{i}"] = rng.random(rows) * 1000
+    return pd.DataFrame(data)
+
+
+def _row_dicts(cur: duckdb.DuckDBPyConnection) -> bytes:
+    rows = cur.fetchall()
+    columns = [d[0] for d in cur.description]
+    out = [dict(zip(columns, r)) for r in rows]
+    return json.dumps({"rows": out, "row_count": len(out)}, default=str).encode()
+
+
+def _columnar(cur: duckdb.DuckDBPyConnection) -> bytes:
+    return json.dumps(_fetch_columns(cur).to_columns(), default=str).encode()
+
+
+def _arrow(cur: duckdb.DuckDBPyConnection) -> bytes:
+    return arrow_ipc_bytes(_fetch_arrow(cur))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--dims", type=int, default=6)
+    parser.add_argument("--metrics", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    con = duckdb.connect(":memory:")
+    df = _make_frame(args.rows, args.dims, args.metrics)
+    con.register("df_view", df)
+    con.execute("CREATE TABLE data AS SELECT * FROM df_view")
+    con.unregister("df_view")
+
+    paths = [("row dicts + json", _row_dicts), ("columnar + json", _columnar)]
+    if pyarrow is not None:
+        paths.append(("arrow ipc", _arrow))
+
+    print(f"rows={args.rows} cols={args.dims + args.metrics}")
+    baseline = None
+    for label, fn in paths:
+        best = float("inf")
+        size = 0
+        for _ in range(args.repeat):
+            cur = con.cursor()
+            cur.execute("SELECT * FROM data")
+            t0 = time.perf_counter()
+            size = len(fn(cur))
+            best = min(best, time.perf_counter() - t0)
+            cur.close()
+        baseline = baseline or best
+        print(f"{label:18s} {best:8.3f}s  {size / 1e6:8.1f}MB  {baseline / best:6.2f}x")
+    if pyarrow is None:
+        print("arrow ipc          skipped (pyarrow not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare per-cell and vectorized dim normalization in the taxonomy build.
+
+Run from the repository root:
+    python -m benchmarks.bench_normalize --rows 2000000 --dims 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.data_agent.taxonomy_builder import _normalize_series, _normalize_val
+
+
+def _make_frame(rows: int, dims: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    vocab = np.array(
+        ["  Americas", "EUROPE ", "apac", "NaN", "None", "null", "", " Chemicals ", "Additives", "Adhesion"],
+        dtype=object,
+    )
+    data = {}
+    for i in range(dims):
+        col = vocab[rng.integers(0, len(vocab), size=rows)]
+        col[rng.random(rows) < 0.02] = None
+        data[f"dim_{i}"] = col
+    data["dim_int"] = rng.integers(0, 50, size=rows)
+    data["dim_float"] = np.where(rng.random(rows) < 0.05, np.nan, rng.integers(0, 50, size=rows).astype(float))
+    return pd.DataFrame(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dims", type=int, default=10)
+    args = parser.parse_args()
+
+    df = _make_frame(args.rows, args.dims)
+    cols = list(df.columns)
+
+    t0 = time.perf_counter()
+    per_cell = {c: df[c].map(_normalize_val) for c in cols}
+    t_map = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectorized = {c: _normalize_series(df[c]) for c in cols}
+    t_vec = time.perf_counter() - t0
+
+    for c in cols:
+        a = per_cell[c].where(per_cell[c].notna(), None).tolist()
+        b = vectorized[c].where(vectorized[c].notna(), None).tolist()
+        if a != b:
+            raise SystemExit(f"mismatch in column {c}")
+
+    print(f"rows={args.rows} cols={len(cols)}")
+    print(f"map(_normalize_val):   {t_map:8.3f}s")
+    print(f"_normalize_series:     {t_vec:8.3f}s")
+    print(f"speedup:               {t_map / t_vec:8.2f}x (outputs identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare the full taxonomy YAML with the token-budgeted routing map on a large taxonomy.
+
+Run from the repository root:
+    python -m benchmarks.bench_routing_map --leaves 100000 --budget 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.data_agent.leaf_index import build_leaf_index
+from backend.data_agent.routing_map import compile_routing_map, estimate_tokens
+from backend.data_agent.taxonomy_builder import _taxonomy_yaml
+
+
+_FANOUT = [8, 25, 50, 10]
+
+
+def _make_leaves(leaves: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dims = [f"l{i + 1}" for i in range(len(_FANOUT))]
+    grid = np.indices(_FANOUT).reshape(len(_FANOUT), -1).T
+    pick = rng.choice(grid.shape[0], size=min(leaves, grid.shape[0]), replace=False)
+    grid = grid[np.sort(pick)]
+    data = {d: [f"{d}_value_{v}" for v in grid[:, i]] for i, d in enumerate(dims)}
+    df = pd.DataFrame(data)
+    # Zipf-ish row counts so a few branches dominate, as in real spend data.
+    df["_rows_"] = rng.zipf(1.6, size=len(df)).clip(max=100_000)
+    df["revenue"] = df["_rows_"] * rng.random(len(df)) * 100
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leaves", type=int, default=100_000)
+    parser.add_argument("--budget", type=int, default=4000)
+    args = parser.parse_args()
+
+    leaf_df = _make_leaves(args.leaves)
+    dims = [c for c in leaf_df.columns if c.startswith("l")]
+    print(f"leaves={len(leaf_df)} dims={len(dims)}")
+
+    t0 = time.perf_counter()
+    yaml_str = _taxonomy_yaml("bench", dims, ["revenue"], leaf_df)
+    t_yaml = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    index = build_leaf_index(leaf_df, dims, ["revenue"])
+    t_index = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    routing = compile_routing_map(index, "bench", token_budget=args.budget) or ""
+    t_map = time.perf_counter() - t0
+
+    prefix = list(index.combo(0)[:2])
+    t0 = time.perf_counter()
+    subtree = compile_routing_map(index, "bench", token_budget=2000, prefix=prefix) or ""
+    t_sub = time.perf_counter() - t0
+
+    print(f"full yaml:     {len(yaml_str):>12,} chars ~{estimate_tokens(yaml_str):>10,} tokens  {t_yaml:8.3f}s")
+    print(f"routing map:   {len(routing):>12,} chars ~{estimate_tokens(routing):>10,} tokens  {t_map:8.3f}s")
+    print(f"subtree {prefix}: {len(subtree):,} chars ~{estimate_tokens(subtree):,} tokens  {t_sub:.4f}s")
+    print(f"(leaf index build {t_index:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
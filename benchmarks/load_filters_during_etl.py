@@ -0,0 +1,119 @@
+"""
+Measure /run/filters latency while a large ETL runs on the same worker.
+
+Start the API first (from the directory containing this repo package), e.g.:
+    uvicorn package.main:app --port 8000
+
+Then run from the repository root:
+    python -m benchmarks.load_filters_during_etl --base http://localhost:8000/api --rows 3000000
+
+The script creates a small dataset for a "reader" user, measures filter
+latency at rest, then starts a large ETL for a "writer" user and measures the
+same queries again while it runs. With blocking routes the p99 during ETL
+grows to the ETL duration; with the executor pools it should stay flat.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import requests
+
+
+_REGIONS = ["americas", "europe", "apac", "mea"]
+_CATEGORIES = ["chemicals", "metals", "packaging", "logistics", "services"]
+
+
+def _write_csv(path: Path, rows: int) -> None:
+    rng = random.Random(11)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Region", "Category", "Supplier", "Revenue"])
+        for i in range(rows):
+            w.writerow([rng.choice(_REGIONS), rng.choice(_CATEGORIES), f"supplier_{i}", rng.randint(1, 10_000)])
+
+
+def _create_dataset(base: str, user_id: str, path: Path) -> None:
+    with path.open("rb") as f:
+        preview = requests.post(f"{base}/users/{user_id}/datasets/preview", files={"file": (path.name, f, "text/csv")})
+    preview.raise_for_status()
+    body = {"upload_id": preview.json()["upload_id"], "dims": ["Region", "Category"], "metrics": ["Revenue"]}
+    created = requests.post(f"{base}/users/{user_id}/datasets", json=body)
+    created.raise_for_status()
+    job_id = created.json()["job_id"]
+    while True:
+        job = requests.get(f"{base}/users/{user_id}/jobs/{job_id}").json()
+        if job["status"] == "succeeded":
+            return
+        if job["status"] == "failed":
+            raise RuntimeError(job.get("error"))
+        time.sleep(0.5)
+
+
+def _measure(base: str, user_id: str, seconds: float, workers: int) -> List[float]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop() -> None:
+        rng = random.Random()
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            body = {"filters": {"region": [rng.choice(_REGIONS)], "category": [rng.choice(_CATEGORIES)]}, "limit": 50}
+            t0 = time.perf_counter()
+            resp = session.post(f"{base}/users/{user_id}/run/filters", json=body)
+            dt = time.perf_counter() - t0
+            if resp.status_code == 200:
+                with lock:
+                    latencies.append(dt)
+
+    threads = [threading.Thread(target=loop) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+
+def _report(label: str, latencies: List[float]) -> None:
+    if not latencies:
+        print(f"{label}: no successful requests")
+        return
+    qs = statistics.quantiles(latencies, n=100)
+    print(f"{label}: n={len(latencies)} p50={qs[49] * 1000:.1f}ms p99={qs[98] * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", default="http://localhost:8000/api")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        small = Path(tmp) / "small.csv"
+        large = Path(tmp) / "large.csv"
+        _write_csv(small, 20_000)
+        _write_csv(large, args.rows)
+
+        _create_dataset(args.base, "bench_reader", small)
+        _report("idle", _measure(args.base, "bench_reader", args.seconds / 2, args.workers))
+
+        etl = threading.Thread(target=_create_dataset, args=(args.base, "bench_writer", large))
+        etl.start()
+        time.sleep(0.5)
+        _report("during ETL", _measure(args.base, "bench_reader", args.seconds, args.workers))
+        etl.join()
+
+
+if __name__ == "__main__":
+    main()
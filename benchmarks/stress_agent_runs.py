@@ -0,0 +1,70 @@
+"""
+Stress run-scoped tool state with many concurrent simulated agent runs.
+
+Run from the repository root:
+    python -m benchmarks.stress_agent_runs --runs 200 --calls 8 --rows 5000
+
+Each run records tool outputs from asyncio tasks and query-pool threads the way
+DatasetQuery does, then checks that it collected exactly its own rows. Peak
+traced memory shows the effect of the spill threshold.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from backend.data_agent.agent_state import agent_run, collect_rows_from_runs, record_tool_run, tool_run_notes
+from backend.data_agent.executors import run_in
+
+
+def _fake_query(run_no: int, call_no: int, rows: int) -> Dict[str, Any]:
+    out_rows: List[Dict[str, Any]] = [
+        {"run": run_no, "call": call_no, "i": i, "supplier": f"supplier_{i}", "revenue": i * 1.5} for i in range(rows)
+    ]
+    out = {"ok": True, "rows": out_rows, "row_count": rows, "diag": {}}
+    record_tool_run("DatasetQuery", {"call": call_no}, out, ok=True)
+    return {"ok": True, "row_count": rows}
+
+
+async def _one_run(run_no: int, calls: int, rows: int, spill_rows: int) -> None:
+    with agent_run(spill_rows=spill_rows):
+        # Mirrors the SDK: tool calls fan out as tasks, the work runs on the query pool.
+        await asyncio.gather(*(run_in("query", _fake_query, run_no, c, rows) for c in range(calls)))
+        collected = await run_in("io", collect_rows_from_runs)
+        notes = tool_run_notes()
+    if len(collected) != calls * rows or any(r["run"] != run_no for r in collected):
+        raise SystemExit(f"run {run_no}: collected {len(collected)} rows, some from other runs")
+    if len(notes) != calls:
+        raise SystemExit(f"run {run_no}: expected {calls} notes, got {len(notes)}")
+
+
+async def _main(runs: int, calls: int, rows: int, spill_rows: int) -> None:
+    await asyncio.gather(*(_one_run(n, calls, rows, spill_rows) for n in range(runs)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--spill-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    asyncio.run(_main(args.runs, args.calls, args.rows, args.spill_rows))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = args.runs * args.calls * args.rows
+    print(f"runs={args.runs} calls/run={args.calls} rows/call={args.rows} spill_rows={args.spill_rows}")
+    print(f"all runs isolated; {total:,} rows in {elapsed:.2f}s, peak traced memory {peak / 1e6:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ type DatasetSummary = {
   dims: string[];
   metrics: string[];
   stats: Record<string, unknown>;
-  taxonomy_yaml: string;
+  has_taxonomy: boolean;
   is_current: boolean;
 };
 
@@ -132,7 +132,7 @@ const AgentUniversePage: React.FC = () => {
                     </span>
                   </h4>
                   <span className="rounded-full bg-slate-900 px-2 py-0.5 text-[10px] font-medium uppercase tracking-[0.18em] text-slate-400">
-                    {ds.taxonomy_yaml?.trim()
+                    {ds.has_taxonomy
                       ? "Ready"
                       : (ds.dims || []).length
                       ? "Configured"
@@ -140,7 +140,7 @@ const AgentUniversePage: React.FC = () => {
                   </span>
                 </div>
                 <p className="text-xs text-slate-400">
-                  {ds.taxonomy_yaml?.trim()
+                  {ds.has_taxonomy
                     ? "Taxonomy and validation are in place. You can query this agent."
                     : (ds.dims || []).length
                     ? "Config set — taxonomy was generated during dataset creation."
@@ -162,7 +162,7 @@ const AgentUniversePage: React.FC = () => {
                   </span>
                   <span
                     className={`rounded-full px-2 py-0.5 ${
-                      ds.taxonomy_yaml?.trim() ? "bg-sky-900/70 text-sky-200" : "bg-slate-900 text-slate-500"
+                      ds.has_taxonomy ? "bg-sky-900/70 text-sky-200" : "bg-slate-900 text-slate-500"
                     }`}
                   >
                     taxonomy
@@ -1,5 +1,28 @@
-import React, { useEffect, useState } from "react";
-import { DEFAULT_USER_ID, apiUrl } from "../api";
+import React, { useEffect, useRef, useState } from "react";
+import { DEFAULT_USER_ID, apiUrl, getJson } from "../api";
+
+type EtlJob = {
+  job_id: string;
+  status: "queued" | "running" | "succeeded" | "failed";
+  stage: string;
+  progress: number;
+  rows_processed: number;
+  rows_total: number | null;
+  eta_seconds: number | null;
+  error: string | null;
+};
+
+const JOB_POLL_MS = 1000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function describeJob(job: EtlJob): string {
+  if (job.status === "queued") return "Queued for processing…";
+  const pct = Math.round((job.progress || 0) * 100);
+  const rows = job.rows_total ? ` · ${job.rows_processed.toLocaleString()} / ${job.rows_total.toLocaleString()} rows` : "";
+  const eta = job.eta_seconds != null && job.eta_seconds > 0 ? ` · ~${Math.ceil(job.eta_seconds)}s left` : "";
+  return `Building dataset: ${job.stage} (${pct}%)${rows}${eta}`;
+}
 
 type Props = {
   datasetId?: string;
@@ -13,11 +36,30 @@ const ConfigPage: React.FC<Props> = ({ datasetId: initialId = "", onDatasetId, u
   const [retrievable, setRetrievable] = useState("");
   const [status, setStatus] = useState("");
   const [error, setError] = useState<string | null>(null);
+  const [isBuilding, setIsBuilding] = useState(false);
+  const mounted = useRef(true);
 
   useEffect(() => {
     if (initialId) setDatasetId(initialId);
   }, [initialId]);
 
+  useEffect(() => {
+    mounted.current = true;
+    return () => {
+      mounted.current = false;
+    };
+  }, []);
+
+  // Creation is an ETL job; the dataset only exists once the job succeeds.
+  const waitForJob = async (jobId: string): Promise<EtlJob> => {
+    while (true) {
+      const job = await getJson<EtlJob>(`/api/users/${DEFAULT_USER_ID}/jobs/${jobId}`);
+      if (job.status === "succeeded" || job.status === "failed" || !mounted.current) return job;
+      setStatus(describeJob(job));
+      await sleep(JOB_POLL_MS);
+    }
+  };
+
   const saveConfig = async () => {
     setError(null);
     setStatus("");
@@ -31,6 +73,7 @@ const ConfigPage: React.FC<Props> = ({ datasetId: initialId = "", onDatasetId, u
       metrics: retrievable.split(",").map((s) => s.trim()).filter(Boolean),
       display_name: datasetId || undefined,
     };
+    setIsBuilding(true);
     try {
       const res = await fetch(apiUrl(`/api/users/${DEFAULT_USER_ID}/datasets`), {
         method: "POST",
@@ -43,6 +86,14 @@ const ConfigPage: React.FC<Props> = ({ datasetId: initialId = "", onDatasetId, u
       }
       const json = await res.json();
       const createdId = json.dataset_id as string;
+      setStatus("Queued for processing…");
+      const job = await waitForJob(json.job_id as string);
+      if (!mounted.current) return;
+      if (job.status === "failed") {
+        setStatus("");
+        setError(`Dataset build failed: ${(job.error || "unknown error").split("\n")[0]}`);
+        return;
+      }
       setDatasetId(createdId);
       onDatasetId?.(createdId);
       setStatus(
@@ -51,7 +102,11 @@ const ConfigPage: React.FC<Props> = ({ datasetId: initialId = "", onDatasetId, u
         )}, metrics=${(json.metrics || []).join(", ")}`
       );
     } catch (e: any) {
+      if (!mounted.current) return;
+      setStatus("");
       setError(e?.message || "Failed to create dataset");
+    } finally {
+      if (mounted.current) setIsBuilding(false);
     }
   };
 
@@ -108,9 +163,10 @@ const ConfigPage: React.FC<Props> = ({ datasetId: initialId = "", onDatasetId, u
       <button
         type="button"
         onClick={saveConfig}
-        className="inline-flex items-center gap-1 rounded-full bg-accent px-3 py-1.5 text-xs font-semibold text-slate-950 shadow-sm shadow-sky-500/50 hover:bg-sky-300 transition-colors"
+        disabled={isBuilding}
+        className="inline-flex items-center gap-1 rounded-full bg-accent px-3 py-1.5 text-xs font-semibold text-slate-950 shadow-sm shadow-sky-500/50 hover:bg-sky-300 transition-colors disabled:opacity-60"
       >
-        Save configuration
+        {isBuilding ? "Building…" : "Save configuration"}
       </button>
       {status && (
         <div className="rounded-xl border border-emerald-600/70 bg-emerald-950/40 px-3 py-2 text-xs text-emerald-100">
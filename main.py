@@ -1,12 +1,23 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
 from .backend.api import datasets as datasets_api
 from .backend.api import query as query_api
+from .backend.data_agent import etl_jobs, executors
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    etl_jobs.resume_pending()
+    yield
+    executors.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(datasets_api.router, prefix="/api")
 app.include_router(query_api.router, prefix="/api")
@@ -15,5 +26,3 @@ app.include_router(query_api.router, prefix="/api")
 @app.get("/health")
 async def health() -> dict:
     return {"ok": True}
-
-
@@ -9,10 +9,13 @@ This intentionally mirrors the SupplierDiscovery Metacube tool:
 
 from __future__ import annotations
 
+from pathlib import Path
 from typing import Dict, List, Optional
 
-from backend.services import duckdb_store, validation
-from backend.storage import get_dataset
+from backend.data_agent import validation
+from backend.data_agent.dataset_registry import get_dataset
+from backend.data_agent.duckdb_query import run_query
+from backend.data_agent.leaf_index import get_leaf_index
 
 
 def get_tool_description() -> Dict[str, object]:
@@ -38,25 +41,25 @@ def get_tool_description() -> Dict[str, object]:
 
 
 def categorical_data_query(dataset_id: str, filters: Dict[str, List[str]], limit: Optional[int] = None) -> Dict[str, object]:
-    rec = get_dataset(dataset_id)
-    if not rec.valid_sets:
+    meta = get_dataset(dataset_id)
+    index = get_leaf_index(meta)
+    if index is None:
         return {"ok": False, "error": "validation_missing", "diag": {"reason": "run_etl_first"}}
-    if not duckdb_store.is_initialized(dataset_id):
+    if not meta.normalized_path:
         return {"ok": False, "error": "duckdb_missing", "diag": {"reason": "init_duckdb_first"}}
 
-    ok, canonical_filters, diag = validation.validate_and_backoff(filters, rec.valid_sets, rec.dims)
+    ok, canonical_filters, diag = validation.validate_and_backoff(filters, index, meta.dims)
     if not ok:
         return {"ok": False, "error": "invalid_filters", "diag": diag}
 
-    df = duckdb_store.query(dataset_id, canonical_filters, limit)
-    rows = df.to_dict(orient="records")
+    rows, row_count = run_query(dataset_id, canonical_filters, limit=limit, meta=meta)
     diag["counts"] = diag.get("counts", {})
-    diag["counts"]["returned_rows"] = len(rows)
+    diag["counts"]["returned_rows"] = row_count
 
     return {
         "ok": True,
         "rows": rows,
-        "row_count": len(rows),
+        "row_count": row_count,
         "canonical_filters": canonical_filters,
         "diag": diag,
     }
@@ -66,11 +69,14 @@ def taxonomy_context(dataset_id: str) -> Dict[str, object]:
     """
     Helper to surface taxonomy and schema to the agent at init.
     """
-    rec = get_dataset(dataset_id)
+    meta = get_dataset(dataset_id)
+    yaml_str = ""
+    if meta.taxonomy_yaml_path and Path(meta.taxonomy_yaml_path).exists():
+        yaml_str = Path(meta.taxonomy_yaml_path).read_text(encoding="utf-8")
     return {
         "dataset_id": dataset_id,
-        "taxonomy_yaml": rec.taxonomy_yaml or "",
-        "dims": rec.dims,
-        "filterable": rec.config.filterable_columns if rec.config else [],
-        "retrievable": rec.config.retrievable_columns if rec.config else [],
+        "taxonomy_yaml": yaml_str,
+        "dims": meta.dims,
+        "filterable": meta.dims,
+        "retrievable": meta.retrievable_columns or (meta.dims + meta.metrics),
     }
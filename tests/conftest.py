@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from backend.data_agent import dataset_registry, duckdb_init, leaf_index, query_cache, user_map
+
+
+@pytest.fixture(autouse=True)
+def data_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    # Every test gets its own data_agent/ tree and cold module-level caches.
+    monkeypatch.setattr(dataset_registry, "_project_root", lambda: tmp_path)
+    dataset_registry._CACHE.clear()
+    leaf_index._INDEXES.clear()
+    query_cache.invalidate()
+    user_map.close()
+    yield tmp_path / "data_agent"
+    for meta in list(dataset_registry._CACHE.values()):
+        duckdb_init.close_dataset(meta[1].dataset_id)
+    user_map.close()
+
+
+def write_csv(path: Path, text: str) -> Path:
+    path.write_text(text.lstrip(), encoding="utf-8")
+    return path
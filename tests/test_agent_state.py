@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Dict
+
+from backend.data_agent.agent_state import RowBuffer, agent_run, collect_rows_from_runs, record_tool_run, tool_run_notes
+from backend.data_agent.executors import run_in
+
+
+def _fake_query(run_no: int, call_no: int, rows: int) -> Dict[str, Any]:
+    out_rows = [{"run": run_no, "call": call_no, "i": i} for i in range(rows)]
+    record_tool_run("DatasetQuery", {"call": call_no}, {"ok": True, "rows": out_rows, "row_count": rows}, ok=True)
+    return {"ok": True}
+
+
+async def _one_run(run_no: int, calls: int, rows: int) -> None:
+    # A low spill threshold forces the NDJSON path under concurrency too.
+    with agent_run(spill_rows=50):
+        await asyncio.gather(*(run_in("query", _fake_query, run_no, c, rows) for c in range(calls)))
+        collected = await run_in("io", collect_rows_from_runs)
+        notes = tool_run_notes()
+    assert len(collected) == calls * rows
+    assert {r["run"] for r in collected} == {run_no}
+    assert len(notes) == calls
+
+
+def test_concurrent_runs_collect_only_their_own_rows() -> None:
+    async def main() -> None:
+        await asyncio.gather(*(_one_run(n, calls=6, rows=40) for n in range(30)))
+
+    asyncio.run(main())
+
+
+def test_rows_outside_a_run_are_not_recorded() -> None:
+    _fake_query(0, 0, 5)
+    assert collect_rows_from_runs() == []
+
+
+def test_dedup_memory_stays_bounded_across_many_pages(tmp_path: Path) -> None:
+    buf = RowBuffer(tmp_path / "rows.ndjson", spill_rows=100, max_seen=500)
+    for page in range(200):
+        buf.extend({"page": page, "i": i} for i in range(50))
+        assert len(buf._seen) <= 500 and len(buf._rows) <= 100
+    assert len(buf) == 200 * 50
+
+    # Recently seen rows are still dropped when a later query returns them again.
+    buf.extend({"page": 199, "i": i} for i in range(50))
+    assert len(buf) == 200 * 50 and buf.duplicates == 50
+    buf.close()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+from backend.data_agent import agents
+from backend.data_agent.agent_state import agent_run, collect_rows_from_runs
+from backend.data_agent.agents import AgentCache
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _dataset(tmp_path: Path, dataset_id: str = "u_1") -> DatasetMetadata:
+    rows = "\n".join(f"{['Europe', 'APAC'][i % 2]},c{i % 5},{i}" for i in range(40))
+    raw = write_csv(tmp_path / f"{dataset_id}.csv", "region,category,revenue\n" + rows + "\n")
+    meta = DatasetMetadata(dataset_id=dataset_id, raw_path=str(raw), dims=["region", "category"], metrics=["revenue"])
+    save_dataset(meta)
+    return build_taxonomy(meta)
+
+
+def test_agent_cache_reuses_agents_until_the_dataset_changes(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    cache = AgentCache(max_entries=1)
+    first = cache.get("u_1")
+    assert cache.get("u_1") is first
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    build_taxonomy(meta)
+    rebuilt = cache.get("u_1")
+    assert rebuilt is not first and cache.stats()["stale"] == 1
+
+    _dataset(tmp_path, "u_2")
+    cache.get("u_2")
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 1
+    assert cache.invalidate("u_2") == 1 and cache.stats()["entries"] == 0
+
+
+def test_repeated_queries_in_a_run_are_answered_by_reference(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    ctx = SimpleNamespace(state=None)
+    with agent_run():
+        first = agents._dataset_query(ctx, "u_1", {"region": ["Europe"], "category": ["c1", "c3"]})
+        again = agents._dataset_query(ctx, "u_1", {"category": ["C3", "c1", "c1"], "region": [" europe "]})
+        assert first["row_count"] == 8 and len(first["rows"]) == 8
+        assert again["cached"] and again["ref"] == first["ref"]
+        assert again["rows"] == [] and again["row_count"] == 8
+
+        # Overlapping queries contribute each row to the run's results once.
+        wider = agents._dataset_query(ctx, "u_1", {"region": ["europe"]})
+        assert wider["row_count"] == 20 and not wider.get("cached")
+        assert len(collect_rows_from_runs()) == 20
+
+
+def test_batch_answers_each_named_slice_from_one_query(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    ctx = SimpleNamespace(state=None)
+    slices = [
+        {"name": "eu", "filters": {"region": ["europe"], "category": ["c0"]}},
+        {"name": "apac", "filters": {"region": ["APAC"], "category": ["c1"]}},
+        {"name": "bogus", "filters": {"nope": ["x"]}},
+    ]
+    with agent_run():
+        out = agents._dataset_query_batch(ctx, "u_1", slices)
+        assert out["ok"] and [s["name"] for s in out["slices"]] == ["eu", "apac", "bogus"]
+        eu, apac, bogus = out["slices"]
+        assert eu["row_count"] == 4 and {r["slice"] for r in eu["rows"]} == {"eu"}
+        assert {r["region"] for r in eu["rows"]} == {"europe"}
+        assert apac["row_count"] == 4 and {r["category"] for r in apac["rows"]} == {"c1"}
+        assert not bogus["ok"] and bogus["rows"] == []
+        assert out["row_count"] == 8
+
+        again = agents._dataset_query_batch(ctx, "u_1", slices[:1])
+        assert again["slices"][0]["cached"] and again["slices"][0]["ref"] == eu["ref"]
+
+    too_many = [{"filters": {"region": ["europe"]}}] * (agents._MAX_SLICES + 1)
+    assert not agents._dataset_query_batch(ctx, "u_1", too_many)["ok"]
+
+
+def test_backed_off_batch_slices_are_paged(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    ctx = SimpleNamespace(state=None)
+    slices = [
+        {"name": "wide", "filters": {"region": ["europe"], "category": ["nothing"]}},
+        {"name": "exact", "filters": {"region": ["europe"], "category": ["c0"]}},
+    ]
+    out = agents._dataset_query_batch(ctx, "u_1", slices, limit_per_slice=5)
+    wide, exact = out["slices"]
+    assert wide["diag"]["backoff_level"] == "ancestor"
+    assert wide["row_count"] == 5 and wide["truncated"] and wide["total"] == 20
+    assert exact["row_count"] == 4 and "next_cursor" not in exact
+
+    more = agents._dataset_query(ctx, "u_1", {"region": ["europe"]}, cursor=wide["next_cursor"])
+    assert more["row_count"] == 15 and more["next_cursor"] is None
+    assert not {r["revenue"] for r in more["rows"]} & {r["revenue"] for r in wide["rows"]}
+
+    # Without a limit the slice still gets DatasetQuery's default page.
+    out = agents._dataset_query_batch(ctx, "u_1", slices[:1])
+    assert out["slices"][0]["row_count"] == 20 and not out["slices"][0]["truncated"]
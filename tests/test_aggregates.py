@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from backend.data_agent.aggregates import aggregate
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _dataset(tmp_path: Path) -> tuple:
+    df = pd.DataFrame(
+        {
+            "region": [["europe", "apac", "americas"][i % 3] for i in range(90)],
+            "category": [f"c{i % 7}" for i in range(90)],
+            "revenue": [float(i * i % 101) for i in range(90)],
+        }
+    )
+    raw = write_csv(tmp_path / "raw.csv", df.to_csv(index=False))
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region", "category"], metrics=["revenue"])
+    save_dataset(meta)
+    return build_taxonomy(meta), df
+
+
+def test_totals_and_top_k_match_a_table_scan(tmp_path: Path) -> None:
+    meta, df = _dataset(tmp_path)
+    out = aggregate(meta, {"region": ["Europe", "APAC"]}, group_by="category", order_by="revenue", top_k=3)
+    scan = df[df["region"].isin(["europe", "apac"])]
+    assert out["exact"]
+    assert out["total"]["rows"] == len(scan)
+    assert out["total"]["sums"]["revenue"] == pytest.approx(scan["revenue"].sum())
+
+    by_cat = scan.groupby("category")["revenue"].agg(["sum", "size"]).sort_values("sum", ascending=False)
+    assert out["groups_total"] == 7
+    assert [g["value"] for g in out["groups"]] == by_cat.index[:3].tolist()
+    assert [g["rows"] for g in out["groups"]] == by_cat["size"][:3].tolist()
+    assert [g["sums"]["revenue"] for g in out["groups"]] == pytest.approx(by_cat["sum"][:3].tolist())
+
+
+def test_unknown_values_match_nothing_and_unknown_dims_are_rejected(tmp_path: Path) -> None:
+    meta, _ = _dataset(tmp_path)
+    out = aggregate(meta, {"region": ["atlantis"]})
+    assert out["total"]["rows"] == 0 and out["total"]["leaves"] == 0
+    with pytest.raises(ValueError):
+        aggregate(meta, {"planet": ["earth"]})
+    with pytest.raises(ValueError):
+        aggregate(meta, {}, group_by="region", order_by="profit")
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import duckdb
+
+from backend.data_agent.dataset_registry import DatasetMetadata, get_dataset, save_dataset
+from backend.data_agent.duckdb_query import run_query
+from backend.data_agent.leaf_index import get_leaf_index
+from backend.data_agent.taxonomy_builder import append_rows, build_taxonomy
+
+from .conftest import write_csv
+
+
+_BASE = """
+region,code,revenue
+Europe,1,10
+Europe,,5
+APAC,2,7
+APAC,3,1
+"""
+
+
+def _dataset(tmp_path: Path) -> DatasetMetadata:
+    raw = write_csv(tmp_path / "base.csv", _BASE)
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region", "code"], metrics=["revenue"])
+    save_dataset(meta)
+    return build_taxonomy(meta)
+
+
+def test_append_keeps_base_value_rendering(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    assert get_leaf_index(meta).per_dim["code"] == ["1.0", "2.0", "3.0"]
+    leaves_before = meta.stats["leaf_rows"]
+
+    # No nulls in the delta: on its own it would sniff "code" as a non-null int.
+    delta = write_csv(tmp_path / "delta.csv", "region,code,revenue\nEurope,1,4\nAPAC,2,6\n")
+    meta = append_rows(meta, delta, "a1")
+
+    index = get_leaf_index(meta)
+    assert index.per_dim["code"] == ["1.0", "2.0", "3.0"]
+    assert meta.stats["cardinality"] == {"region": 2, "code": 3}
+    assert meta.stats["leaf_rows"] == leaves_before
+    assert meta.stats["total_rows"] == 6
+    _, rows, sums = index.totals(index.constraints({"region": ["europe"], "code": ["1.0"]}))
+    assert rows == 2 and sums.tolist() == [14.0]
+
+    found, count = run_query("u_1", {"code": ["1.0"]}, meta=meta, use_cache=False)
+    assert count == 2 and sorted(r["revenue"] for r in found) == [4, 10]
+
+
+def test_append_infers_schema_for_datasets_built_without_one(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    meta.extra.pop("schema")
+    save_dataset(meta)
+
+    delta = write_csv(tmp_path / "delta.csv", "region,code,revenue\nEurope,1,4\n")
+    meta = append_rows(get_dataset("u_1"), delta, "a1")
+    assert get_leaf_index(meta).per_dim["code"] == ["1.0", "2.0", "3.0"]
+    assert meta.stats["cardinality"] == {"region": 2, "code": 3}
+
+
+def test_append_leaves_duckdb_file_to_other_readers(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    run_query("u_1", {}, meta=meta, use_cache=False)
+    db_path = Path(meta.duckdb_path)
+    before = db_path.stat().st_mtime_ns
+    # Another worker process holding the file read-only.
+    reader = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import duckdb, sys; c = duckdb.connect(sys.argv[1], read_only=True); "
+            "print('ok', flush=True); sys.stdin.read()",
+            str(db_path),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert reader.stdout.readline().strip() == "ok"
+        delta = write_csv(tmp_path / "delta.csv", "region,code,revenue\nAmericas,4,3\n")
+        meta = append_rows(meta, delta, "a1")
+    finally:
+        reader.communicate("")
+    assert db_path.stat().st_mtime_ns == before
+
+    # The handle pooled before the append is reopened for the new version.
+    found, count = run_query("u_1", {}, meta=meta, use_cache=False)
+    assert count == 5
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM u_1").fetchone()[0] == 4
+
+
+def test_append_is_idempotent_per_append_id(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    delta = write_csv(tmp_path / "delta.csv", "region,code,revenue\nAmericas,4,3\n")
+    append_rows(meta, delta, "a1")
+    meta = append_rows(get_dataset("u_1"), delta, "a1")
+    assert meta.stats["total_rows"] == 5
+    _, count = run_query("u_1", {"region": ["americas"]}, meta=meta, use_cache=False)
+    assert count == 1
+
+
+def test_rebuild_drops_earlier_appends(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    delta = write_csv(tmp_path / "delta.csv", "region,code,revenue\nAmericas,4,3\nAmericas,5,2\n")
+    meta = append_rows(meta, delta, "a1")
+    assert meta.stats["total_rows"] == 6
+
+    meta = build_taxonomy(get_dataset("u_1"))
+    assert meta.delta_paths == []
+    assert "appends" not in meta.extra
+    assert meta.stats["total_rows"] == 4
+    assert meta.stats["cardinality"] == {"region": 2, "code": 3}
+    _, count = run_query("u_1", {}, meta=meta, use_cache=False)
+    assert count == 4
+    _, count = run_query("u_1", {"region": ["americas"]}, meta=meta, use_cache=False)
+    assert count == 0
+
+
+_APPEND_WORKER = """
+import sys
+from pathlib import Path
+
+from backend.data_agent import dataset_registry
+
+dataset_registry._project_root = lambda: Path(sys.argv[1])
+from backend.data_agent.dataset_registry import get_dataset
+from backend.data_agent.taxonomy_builder import append_rows
+
+meta = get_dataset("u_1")
+sys.stdin.read()
+append_rows(meta, Path(sys.argv[2]), sys.argv[3])
+"""
+
+
+def test_appends_from_several_workers_are_all_kept(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    workers = []
+    for i in range(4):
+        delta = write_csv(tmp_path / f"delta{i}.csv", f"region,code,revenue\nW{i},{i},1\nW{i},{i},2\n")
+        workers.append(
+            subprocess.Popen(
+                [sys.executable, "-c", _APPEND_WORKER, str(tmp_path), str(delta), f"a{i}"],
+                cwd=Path(__file__).resolve().parents[1],
+                stdin=subprocess.PIPE,
+                text=True,
+            )
+        )
+    # Every worker has read the same metadata before any of them appends.
+    for w in workers:
+        w.stdin.close()
+    assert [w.wait(timeout=60) for w in workers] == [0] * 4
+
+    meta = get_dataset("u_1")
+    assert sorted(a["append_id"] for a in meta.extra["appends"]) == ["a0", "a1", "a2", "a3"]
+    assert meta.stats["total_rows"] == 12
+    assert len(get_leaf_index(meta).per_dim["region"]) == 6
+    _, count = run_query("u_1", {}, meta=meta, use_cache=False)
+    assert count == 12
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import HTTPException
+
+from backend.api.datasets import _owned_dataset
+from backend.data_agent.dataset_registry import DatasetMetadata, dataset_owner, list_datasets, save_dataset
+
+
+def test_legacy_owner_comes_from_the_last_underscore() -> None:
+    assert dataset_owner(DatasetMetadata(dataset_id="a_b_1700000000")) == "a_b"
+    assert dataset_owner(DatasetMetadata(dataset_id="a_1700000000")) == "a"
+    assert dataset_owner(DatasetMetadata(dataset_id="a_b_1700000000", user_id="c")) == "c"
+    assert dataset_owner(DatasetMetadata(dataset_id="shared")) is None
+
+
+def test_legacy_dataset_is_not_readable_by_a_prefix_user() -> None:
+    save_dataset(DatasetMetadata(dataset_id="a_b_1700000000"))
+    assert _owned_dataset("a_b", "a_b_1700000000").dataset_id == "a_b_1700000000"
+    with pytest.raises(HTTPException) as e:
+        _owned_dataset("a", "a_b_1700000000")
+    assert e.value.status_code == 404
+    assert [m.dataset_id for m in list_datasets(user_id="a")] == []
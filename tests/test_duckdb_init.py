@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.duckdb_init import HandlePool
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _dataset(tmp_path: Path, dataset_id: str) -> DatasetMetadata:
+    raw = write_csv(tmp_path / f"{dataset_id}.csv", "region,revenue\nEurope,1\nAPAC,2\n")
+    meta = DatasetMetadata(dataset_id=dataset_id, raw_path=str(raw), dims=["region"], metrics=["revenue"])
+    save_dataset(meta)
+    return build_taxonomy(meta)
+
+
+def _count(pool: HandlePool, meta: DatasetMetadata) -> int:
+    with pool.cursor(meta) as (handle, cur):
+        return cur.execute(f"SELECT COUNT(*) FROM {handle.table_name}").fetchone()[0]
+
+
+def test_pool_evicts_idle_handles_past_its_byte_budget(tmp_path: Path) -> None:
+    a, b = _dataset(tmp_path, "u_1"), _dataset(tmp_path, "u_2")
+    pool = HandlePool(max_bytes=Path(a.duckdb_path).stat().st_size)
+    try:
+        assert _count(pool, a) == 2
+        assert _count(pool, b) == 2
+        stats = pool.stats()
+        assert stats["open_handles"] == 1 and stats["evictions"] == 1
+
+        # Handles with a cursor out are never evicted, even over budget.
+        with pool.cursor(a) as (handle, cur):
+            with pool.cursor(b):
+                assert pool.stats()["open_handles"] == 2
+            assert pool.stats()["open_handles"] == 1
+            assert cur.execute(f"SELECT COUNT(*) FROM {handle.table_name}").fetchone()[0] == 2
+        assert pool.stats()["in_use"] == 0
+    finally:
+        pool.close("u_1")
+        pool.close("u_2")
+
+
+def test_pool_closes_handles_left_idle(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path, "u_1")
+    pool = HandlePool(idle_seconds=0.01)
+    try:
+        assert _count(pool, meta) == 2
+        assert pool.stats()["open_handles"] == 1
+        time.sleep(0.05)
+        pool.configure()
+        assert pool.stats()["open_handles"] == 0
+        assert _count(pool, meta) == 2 and pool.stats()["opens"] == 2
+    finally:
+        pool.close("u_1")
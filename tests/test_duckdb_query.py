@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+from decimal import Decimal
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from backend.api.datasets import _json_response
+from backend.data_agent.dataset_registry import DatasetMetadata, get_dataset, save_dataset
+from backend.data_agent.duckdb_init import cursor
+from backend.data_agent.duckdb_query import _fetch_columns, estimate_total, run_query, run_query_page
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _dataset(tmp_path: Path, rows: int = 60) -> DatasetMetadata:
+    lines = ["region,category,revenue"]
+    for i in range(rows):
+        lines.append(f"{['Europe', 'APAC', 'Americas'][i % 3]},cat_{i % 4},{i}")
+    raw = write_csv(tmp_path / "raw.csv", "\n".join(lines) + "\n")
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region", "category"], metrics=["revenue"])
+    save_dataset(meta)
+    return build_taxonomy(meta)
+
+
+def test_keyset_pages_cover_the_unpaged_result(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    filters = {"region": ["europe", "apac"]}
+    expected, count = run_query("u_1", filters, meta=meta)
+
+    seen = []
+    token = None
+    while True:
+        page = run_query_page("u_1", filters, page_size=7, cursor_token=token, meta=meta)
+        assert page.total == count and page.total_exact
+        seen.extend(page.result.rows())
+        token = page.next_cursor
+        if token is None:
+            break
+    assert sorted(r["revenue"] for r in seen) == sorted(r["revenue"] for r in expected)
+    assert len(seen) == count == 40
+
+
+def test_cursor_is_bound_to_filters_and_version(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    page = run_query_page("u_1", {"region": ["europe"]}, page_size=5, meta=meta)
+    assert page.next_cursor is not None
+    with pytest.raises(ValueError):
+        run_query_page("u_1", {"region": ["apac"]}, page_size=5, cursor_token=page.next_cursor, meta=meta)
+    meta.routing_version = "rebuilt"
+    with pytest.raises(ValueError):
+        run_query_page("u_1", {"region": ["europe"]}, page_size=5, cursor_token=page.next_cursor, meta=meta)
+    with pytest.raises(ValueError):
+        run_query_page("u_1", {"region": ["europe"]}, page_size=5, cursor_token="not-a-cursor", meta=meta)
+
+
+_TYPED_SQL = (
+    "SELECT * FROM (VALUES"
+    " (1, 2.5::DOUBLE, 'a', DATE '2024-01-02', TIMESTAMP '2024-01-02 03:04:05', 1.25::DECIMAL(6, 2)),"
+    " (NULL, NULL, NULL, NULL, NULL, NULL)) t(i, f, s, d, ts, dec)"
+)
+
+
+def test_fetch_columns_keeps_fetchall_value_types() -> None:
+    conn = duckdb.connect()
+    try:
+        expected = conn.execute(_TYPED_SQL).fetchall()
+        result = _fetch_columns(conn.sql(_TYPED_SQL))
+        plain = _fetch_columns(conn.sql("SELECT i, f, s FROM (" + _TYPED_SQL + ")"))
+    finally:
+        conn.close()
+    assert [tuple(r.values()) for r in result.rows()] == expected
+    assert isinstance(result.data["d"][0], dt.date) and not isinstance(result.data["d"][0], dt.datetime)
+    assert isinstance(result.data["dec"][0], Decimal)
+    assert plain.data == {"i": [1, None], "f": [2.5, None], "s": ["a", None]}
+
+
+def test_json_response_renders_dates_in_iso_format() -> None:
+    body = _json_response({"rows": [{"d": dt.date(2024, 1, 2), "ts": dt.datetime(2024, 1, 2, 3, 4, 5)}]}).body
+    assert json.loads(body)["rows"] == [{"d": "2024-01-02", "ts": "2024-01-02T03:04:05"}]
+
+
+def test_rebuild_is_seen_while_an_old_cursor_is_in_flight(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path, rows=12)
+    with cursor(meta):
+        # The pooled handle is still checked out while the dataset is rebuilt.
+        lines = "\n".join(f"Europe,cat_{i % 4},{i}" for i in range(25))
+        write_csv(Path(meta.raw_path), "region,category,revenue\n" + lines + "\n")
+        meta = build_taxonomy(get_dataset("u_1"))
+        _, count = run_query("u_1", {"region": ["europe"]}, meta=meta, use_cache=False)
+        assert count == 25
+    _, count = run_query("u_1", {"region": ["europe"]}, meta=meta, use_cache=False)
+    assert count == 25
+    assert [p.name for p in Path(meta.duckdb_path).parent.glob("*.duckdb")] == [Path(meta.duckdb_path).name]
+
+
+def test_datasets_stored_as_csv_still_load(tmp_path: Path) -> None:
+    norm = write_csv(tmp_path / "normalized.csv", "region,revenue\neurope,1\napac,2\neurope,3\n")
+    meta = DatasetMetadata(dataset_id="u_1", normalized_path=str(norm), dims=["region"], metrics=["revenue"])
+    save_dataset(meta)
+
+    found, count = run_query("u_1", {"region": ["europe"]}, meta=get_dataset("u_1"), use_cache=False)
+    assert count == 2 and sorted(r["revenue"] for r in found) == [1, 3]
+
+
+def test_queries_read_the_materialized_duckdb_file(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    assert meta.duckdb_path and Path(meta.duckdb_path).exists()
+    # Everything a query needs is in the DuckDB file, not the Parquet it was built from.
+    Path(meta.normalized_path).unlink()
+
+    with cursor(meta) as (handle, cur):
+        assert handle.row_id == "_row_id_"
+        row_ids = [r[0] for r in cur.execute(f"SELECT _row_id_ FROM {handle.table_name}").fetchall()]
+        with pytest.raises(duckdb.Error):
+            cur.execute(f"DELETE FROM {handle.table_name}")
+    assert row_ids == sorted(row_ids) == list(range(60))
+    _, count = run_query("u_1", {"region": ["apac"]}, meta=meta, use_cache=False)
+    assert count == 20
+
+
+def test_legacy_valid_sets_give_no_total_estimate(tmp_path: Path) -> None:
+    meta = _dataset(tmp_path)
+    assert estimate_total(meta, {"region": ["europe"]}) == (20, True)
+
+    valid_sets = tmp_path / "valid_sets.json"
+    valid_sets.write_text(json.dumps({"combos_full": [["europe", "cat_0"], ["apac", "cat_1"]]}), encoding="utf-8")
+    meta.leaf_index_path = None
+    meta.valid_sets_path = str(valid_sets)
+    # One "row" per combination is not a count, even scaled by the known total.
+    assert estimate_total(meta, {"region": ["europe"]}) is None
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+
+from backend.data_agent import etl_jobs
+from backend.data_agent.etl_jobs import EtlJob, EtlJobManager
+
+
+def _write_job(job_id: str, status: str = "running", user_id: str = "u") -> None:
+    job = EtlJob(job_id=job_id, kind="fake", dataset_id="d", user_id=user_id, status=status, created_at=time.time())
+    etl_jobs._job_path(job_id).write_text(json.dumps(asdict(job)), encoding="utf-8")
+
+
+def _manager(ran: list) -> EtlJobManager:
+    manager = EtlJobManager()
+    manager.register_runner("fake", lambda job, report: ran.append(job.job_id) or {})
+    return manager
+
+
+def _wait(manager: EtlJobManager, job_id: str) -> EtlJob:
+    deadline = time.monotonic() + 10
+    while manager.get(job_id).status in etl_jobs.ACTIVE_STATUSES and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return manager.get(job_id)
+
+
+def test_list_includes_jobs_persisted_by_other_workers() -> None:
+    _write_job("other", status="succeeded")
+    _write_job("someone_else", status="succeeded", user_id="v")
+    ran: list = []
+    manager = _manager(ran)
+    mine = manager.submit("fake", "d", {}, user_id="u")
+    _wait(manager, mine.job_id)
+    assert {j.job_id for j in manager.list("u")} == {"other", mine.job_id}
+
+
+def test_resume_skips_jobs_claimed_by_a_live_worker() -> None:
+    _write_job("orphaned")
+    _write_job("busy")
+    # A live worker holding its claim on "busy".
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import fcntl, sys; f = open(sys.argv[1], 'a+b'); fcntl.flock(f, fcntl.LOCK_EX);"
+            " print('ok', flush=True); sys.stdin.read()",
+            str(etl_jobs._lock_path("busy")),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "ok"
+        ran: list = []
+        first, second = _manager(ran), _manager(ran)
+        resumed = [j.job_id for j in first.resume_pending()] + [j.job_id for j in second.resume_pending()]
+        assert resumed == ["orphaned"]
+        assert _wait(first, "orphaned").status == "succeeded"
+        assert ran == ["orphaned"]
+        assert first.get("busy").status == "running"
+    finally:
+        holder.communicate("")
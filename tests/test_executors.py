@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from backend.api.limits import RouteLimit
+from backend.data_agent.executors import run_in
+
+_REQUEST = contextvars.ContextVar("_REQUEST", default="none")
+
+
+def test_run_in_keeps_the_loop_free_and_carries_context() -> None:
+    release = threading.Event()
+
+    def blocking() -> tuple:
+        release.wait(5)
+        return threading.current_thread().name, _REQUEST.get()
+
+    async def main() -> tuple:
+        _REQUEST.set("req-1")
+        pending = asyncio.ensure_future(run_in("etl", blocking))
+        # The loop keeps serving other work while the ETL call blocks its thread.
+        await asyncio.sleep(0.01)
+        assert not pending.done()
+        release.set()
+        return await pending
+
+    thread_name, request = asyncio.run(main())
+    assert thread_name.startswith("data_agent_etl")
+    assert request == "req-1"
+
+
+def test_run_in_rejects_unknown_pools() -> None:
+    with pytest.raises(KeyError):
+        asyncio.run(run_in("nope", lambda: None))
+
+
+def test_route_limit_rejects_instead_of_queueing() -> None:
+    limit = RouteLimit("test", 1, retry_after=7)
+
+    async def main() -> None:
+        async with limit.slot():
+            with pytest.raises(HTTPException) as exc:
+                async with limit.slot():
+                    pass
+            assert exc.value.status_code == 429
+            assert exc.value.headers == {"Retry-After": "7"}
+        async with limit.slot():
+            assert limit.active == 1
+
+    asyncio.run(main())
+    assert limit.stats() == {"active": 0, "max_concurrent": 1, "rejected": 1}
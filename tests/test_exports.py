@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api import datasets as datasets_api
+from backend.api import limits
+from backend.data_agent import user_map
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _dataset(tmp_path: Path) -> None:
+    lines = "\n".join(f"Europe,{i}" for i in range(100))
+    raw = write_csv(tmp_path / "raw.csv", "region,revenue\n" + lines + "\n")
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region"], metrics=["revenue"])
+    save_dataset(meta)
+    build_taxonomy(meta)
+    user_map.set_user_dataset("u", "u_1")
+
+
+def test_streamed_export_releases_its_slot(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    app = FastAPI()
+    app.include_router(datasets_api.router, prefix="/api")
+    res = TestClient(app).post("/api/users/u/run/filters/export", json={"filters": {"region": ["europe"]}})
+    assert res.status_code == 200
+    assert len([json.loads(line) for line in res.text.splitlines()]) == 100
+    assert limits.EXPORT.active == 0
+
+
+def test_export_that_never_starts_sending_releases_its_slot(tmp_path: Path) -> None:
+    _dataset(tmp_path)
+    body = datasets_api.FiltersExportRequest(filters={"region": ["europe"]})
+
+    async def main() -> None:
+        response = await datasets_api.export_user_filters("u", body)
+        assert limits.EXPORT.active == 1
+
+        async def receive() -> dict:
+            await asyncio.sleep(3600)
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            raise OSError("client went away")
+
+        # Starlette surfaces the send failure wrapped in an exception group.
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    asyncio.run(main())
+    assert limits.EXPORT.active == 0
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import itertools
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.data_agent.leaf_index import LeafIndex, build_leaf_index, load_leaf_index, write_leaf_index
+
+
+_DIMS = ["l1", "l2", "l3", "l4"]
+
+
+def _leaf_df(seed: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    fanout = [3, 4, 5, 3]
+    grid = np.indices(fanout).reshape(len(fanout), -1).T
+    grid = grid[rng.random(grid.shape[0]) < 0.6]
+    data = {}
+    for i, d in enumerate(_DIMS):
+        col = np.array([f"{d}_{v}" for v in grid[:, i]], dtype=object)
+        col[grid[:, i] == 0] = None
+        data[d] = col
+    df = pd.DataFrame(data)
+    df["_rows_"] = rng.integers(1, 50, size=len(df))
+    df["revenue"] = rng.random(len(df)) * 100
+    return df
+
+
+@pytest.fixture()
+def indexes(tmp_path: Path) -> tuple:
+    leaf_df = _leaf_df()
+    write_leaf_index(tmp_path / "leaf_index", build_leaf_index(leaf_df, _DIMS, ["revenue"]))
+    with_rollup = load_leaf_index(tmp_path / "leaf_index")
+    scan_only = load_leaf_index(tmp_path / "leaf_index")
+    scan_only._rollup, scan_only._rollup_loaded = None, True
+    assert with_rollup.rollup is not None
+    return with_rollup, scan_only
+
+
+def _filters(index: LeafIndex) -> list:
+    out = []
+    values = {d: [None] + index.per_dim[d] for d in _DIMS}
+    for n in (1, 2, 3):
+        for dims in itertools.combinations(_DIMS, n):
+            for combo in itertools.islice(itertools.product(*(values[d] for d in dims)), 12):
+                out.append({d: [v] for d, v in zip(dims, combo)})
+    out.append({"l1": ["l1_1", "l1_2"], "l3": ["l3_1", "l3_4", None]})
+    out.append({"l2": ["l2_3"], "l4": []})
+    return out
+
+
+def test_rollup_totals_match_leaf_scan(indexes: tuple) -> None:
+    with_rollup, scan_only = indexes
+    for filters in _filters(with_rollup):
+        fast = with_rollup.totals(with_rollup.constraints(filters))
+        slow = scan_only.totals(scan_only.constraints(filters))
+        assert fast[:2] == slow[:2], filters
+        assert fast[2] == pytest.approx(slow[2]), filters
+
+
+def test_rollup_children_match_leaf_scan(indexes: tuple) -> None:
+    with_rollup, scan_only = indexes
+    paths = [()] + [(int(c),) for c in scan_only.children(())[0]]
+    paths += [p + (int(c),) for p in paths[1:] for c in scan_only.children(p)[0]]
+    for path in paths:
+        for a, b in zip(with_rollup.children(path), scan_only.children(path)):
+            assert np.asarray(a).tolist() == np.asarray(b).tolist(), path
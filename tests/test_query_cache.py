@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from backend.data_agent import query_cache
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.duckdb_query import run_query
+from backend.data_agent.query_cache import QueryCache, make_key
+from backend.data_agent.taxonomy_builder import build_taxonomy
+
+from .conftest import write_csv
+
+
+def _key(dataset_id: str, value: str) -> tuple:
+    return make_key(dataset_id, "v1", {"region": [value]}, None, ["region"])
+
+
+def test_cache_evicts_least_recently_used_entries_past_its_budget() -> None:
+    cache = QueryCache(max_bytes=300)
+    for value in ("a", "b", "c"):
+        cache.put(_key("u_1", value), value, size=100)
+    assert cache.get(_key("u_1", "a")) == "a"
+
+    cache.put(_key("u_1", "d"), "d", size=100)
+    assert cache.get(_key("u_1", "b")) is None
+    assert [cache.get(_key("u_1", v)) for v in ("a", "c", "d")] == ["a", "c", "d"]
+    assert cache.stats()["bytes"] == 300 and cache.stats()["evictions"] == 1
+
+    cache.put(_key("u_1", "huge"), "huge", size=301)
+    assert cache.get(_key("u_1", "huge")) is None
+    assert cache.invalidate("u_1") == 3 and cache.stats()["bytes"] == 0
+
+
+def test_make_key_ignores_filter_order() -> None:
+    a = make_key("u_1", "v1", {"region": ["b", "a"], "cat": ["x"]}, 10, ["region"])
+    b = make_key("u_1", "v1", {"cat": ["x"], "region": ["a", "b", "a"]}, 10, ["region"])
+    assert a == b
+    assert a != make_key("u_1", "v2", {"region": ["a", "b"], "cat": ["x"]}, 10, ["region"])
+
+
+def test_run_query_is_cached_until_the_dataset_is_rebuilt(tmp_path: Path) -> None:
+    raw = write_csv(tmp_path / "raw.csv", "region,revenue\nEurope,1\nAPAC,2\n")
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region"], metrics=["revenue"])
+    save_dataset(meta)
+    meta = build_taxonomy(meta)
+
+    first, _ = run_query("u_1", {"region": ["europe"]}, meta=meta)
+    hits = query_cache.stats()["hits"]
+    again, _ = run_query("u_1", {"region": ["europe"]}, meta=meta)
+    assert again == first and query_cache.stats()["hits"] == hits + 1
+
+    write_csv(tmp_path / "raw.csv", "region,revenue\nEurope,1\nEurope,5\n")
+    meta = build_taxonomy(meta)
+    found, count = run_query("u_1", {"region": ["europe"]}, meta=meta)
+    assert count == 2 and sorted(r["revenue"] for r in found) == [1, 5]
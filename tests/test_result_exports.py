@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+
+import duckdb
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api import datasets as datasets_api
+from backend.data_agent import exports, user_map
+from backend.data_agent.agent_state import RowBuffer
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+
+
+def _rows(tmp_path: Path, n: int = 120) -> RowBuffer:
+    # A small spill threshold puts most rows in the NDJSON file, as a long run would.
+    buf = RowBuffer(tmp_path / "run" / "rows.ndjson", spill_rows=25)
+    buf.extend({"region": "europe", "i": i} for i in range(n - 1))
+    buf.extend([{"region": "apac", "i": n - 1, "late": "x"}])
+    return buf
+
+
+def test_csv_result_is_written_from_the_spilled_buffer(tmp_path: Path) -> None:
+    export = exports.start_result_export("u_1", "e1", _rows(tmp_path), fmt="csv")
+    export.future.result(timeout=10)
+    assert export.status == "ready" and export.row_count == 120 and not export.truncated
+
+    with export.path.open(encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == ["region", "i", "late"]
+    assert len(rows) == 120 and rows[-1] == {"region": "apac", "i": "119", "late": "x"}
+    assert not (tmp_path / "run").exists()
+
+
+def test_parquet_result_types_late_columns(tmp_path: Path) -> None:
+    export = exports.start_result_export("u_1", "e2", _rows(tmp_path), fmt="parquet")
+    export.future.result(timeout=10)
+    assert export.status == "ready", export.error
+    conn = duckdb.connect()
+    try:
+        count, late = conn.execute(
+            "SELECT COUNT(*), COUNT(late) FROM read_parquet(?)", [str(export.path)]
+        ).fetchone()
+    finally:
+        conn.close()
+    assert (count, late) == (120, 1)
+
+
+def test_finished_exports_are_found_on_disk_under_their_run_dataset(tmp_path: Path) -> None:
+    export = exports.start_result_export("u_1", "e3", _rows(tmp_path), fmt="xlsx")
+    export.future.result(timeout=10)
+    assert export.status == "ready", export.error
+    exports._EXPORTS.clear()
+
+    found = exports.find_result_export("e3")
+    assert found is not None and found.path == export.path and found.status == "ready"
+    assert found.dataset_id == "u_1"
+    assert exports.find_result_export("../e3") is None
+
+
+def test_exports_without_a_record_are_found_under_the_given_datasets(tmp_path: Path) -> None:
+    export = exports.start_result_export("u_1", "e4", _rows(tmp_path), fmt="csv")
+    export.future.result(timeout=10)
+    exports._EXPORTS.clear()
+    exports._record_path("e4").unlink()
+
+    assert exports.find_result_export("e4") is None
+    assert exports.find_result_export("e4", ["u_2"]) is None
+    found = exports.find_result_export("e4", ["u_2", "u_1"])
+    assert found is not None and found.dataset_id == "u_1" and found.format == "csv"
+
+
+def test_export_stays_downloadable_after_switching_datasets(tmp_path: Path) -> None:
+    app = FastAPI()
+    app.include_router(datasets_api.router, prefix="/api")
+    client = TestClient(app)
+    for dataset_id in ("u_1", "u_2"):
+        save_dataset(DatasetMetadata(dataset_id=dataset_id, raw_path="raw.csv", dims=["region"], metrics=["i"]))
+    user_map.set_user_dataset("u", "u_1")
+    export = exports.start_result_export("u_1", "e5", _rows(tmp_path), fmt="csv")
+    export.future.result(timeout=10)
+    exports._EXPORTS.clear()
+    user_map.set_user_dataset("u", "u_2")
+
+    res = client.get("/api/users/u/exports/e5")
+    assert res.status_code == 200 and len(res.text.splitlines()) == 121
+    assert client.get("/api/users/v/exports/e5").status_code == 404
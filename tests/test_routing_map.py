@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from backend.data_agent.leaf_index import build_leaf_index
+from backend.data_agent.routing_map import compile_routing_map, estimate_tokens
+
+
+def _index():
+    rows = []
+    for i in range(30):
+        for j in range(20):
+            rows.append({"region": f"r{i:02d}", "city": f"c{j:02d}", "_rows_": (30 - i) * 10 + j, "revenue": 1.0})
+    return build_leaf_index(pd.DataFrame(rows), ["region", "city"], ["revenue"])
+
+
+def test_map_fits_the_budget_and_spends_it_on_the_largest_nodes() -> None:
+    index = _index()
+    text = compile_routing_map(index, "u_1", token_budget=400)
+    assert text is not None
+    lines = text.splitlines()
+    assert lines[-1].startswith("# Pruned to fit the prompt")
+    assert sum(estimate_tokens(line) for line in lines[:-1]) <= 400
+    # The root lists the 12 largest regions and folds the other 18.
+    assert "  r00 (rows=" in text and "  r11 (rows=" in text and "  r12 (rows=" not in text
+    assert any(line.strip().startswith("... 18 more values") for line in lines)
+
+
+def test_generous_budget_lists_every_leaf() -> None:
+    index = _index()
+    text = compile_routing_map(index, "u_1", token_budget=100_000, max_children=100)
+    assert text is not None
+    assert "# Pruned" not in text
+    assert sum(1 for line in text.splitlines() if line.startswith("    c")) == 600
+
+
+def test_subtree_renders_under_a_prefix() -> None:
+    index = _index()
+    text = compile_routing_map(index, "u_1", prefix=["r03"], max_children=100)
+    assert text is not None
+    assert f"subtree: region=r03 (rows={sum(270 + j for j in range(20))})" in text
+    assert sum(1 for line in text.splitlines() if line.startswith("    c")) == 20
+    assert compile_routing_map(index, "u_1", prefix=["nowhere"]) is None
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.leaf_index import get_leaf_index, leaf_frame
+from backend.data_agent.taxonomy_builder import _normalize_series, _normalize_val, build_taxonomy
+
+from .conftest import write_csv
+
+
+_RAW = """
+Region,Category,Code,Score,Revenue,Units
+  Europe ,Chemicals,1,0.5,10.5,3
+EUROPE,chemicals,,1.5,4,
+APAC,Adhesives,2,,7.25,1
+apac,NULL,2,2.5,,2
+Americas,n/a,3,0.5,1,1
+,Additives,1,1.5,2,4
+Europe,Chemicals,1,0.5,3,5
+"""
+
+# Cells each engine used to type differently: zero-padded codes, T/F flags,
+# headers that normalize alike, and ints past int64 whose sums wrap.
+_EDGE_RAW = """
+Zip,Flag,Ok,A,a ,Code,Ratio,Wide,Big,Won
+02134,T,True,x,p,1,2134.,-1,9223372036854775808,True
+001,F,false,y,q,,.5,99999999999999999999,9223372036854775809,False
+02134,T,TRUE,x,p,1,2134.0,-1,9223372036854775808,True
+7,F,false,z,q,2,1E5,3,1,False
+"""
+
+
+def _read_parquet(path: str) -> pd.DataFrame:
+    conn = duckdb.connect()
+    try:
+        return conn.execute("SELECT * FROM read_parquet(?)", [path]).fetchdf()
+    finally:
+        conn.close()
+
+
+def _build(
+    tmp_path: Path,
+    dataset_id: str,
+    engine: str,
+    text: str = _RAW,
+    dims: Optional[List[str]] = None,
+    metrics: Optional[List[str]] = None,
+) -> DatasetMetadata:
+    raw = write_csv(tmp_path / f"{dataset_id}.csv", text)
+    meta = DatasetMetadata(
+        dataset_id=dataset_id,
+        raw_path=str(raw),
+        dims=dims or ["Region", "Category", "Code", "Score"],
+        metrics=metrics or ["Revenue", "Units"],
+    )
+    save_dataset(meta)
+    return build_taxonomy(meta, engine=engine)
+
+
+def test_normalize_series_matches_per_cell() -> None:
+    df = pd.DataFrame(
+        {
+            "text": ["  Americas", "EUROPE ", "NaN", "None", "null", "", None, " apac "],
+            "ints": [1, 2, 3, 4, 5, 6, 7, 8],
+            "floats": [1.0, np.nan, 2.5, 3.0, np.nan, 0.0, -1.0, 4.0],
+        }
+    )
+    for col in df.columns:
+        expected = df[col].map(_normalize_val).where(lambda s: s.notna(), None).tolist()
+        actual = _normalize_series(df[col]).where(lambda s: s.notna(), None).tolist()
+        assert actual == expected, col
+
+
+def test_engines_build_identical_taxonomies(tmp_path: Path) -> None:
+    duck = _build(tmp_path, "u_1", "duckdb")
+    pand = _build(tmp_path, "u_2", "pandas")
+
+    assert duck.dims == pand.dims == ["region", "category", "code", "score"]
+    assert duck.metrics == pand.metrics == ["revenue", "units"]
+    assert duck.stats == pand.stats
+
+    a, b = get_leaf_index(duck), get_leaf_index(pand)
+    assert a is not None and b is not None
+    assert a.per_dim == b.per_dim
+    assert a.per_dim["code"] == ["1.0", "2.0", "3.0"]
+    pd.testing.assert_frame_equal(leaf_frame(a), leaf_frame(b))
+
+    norm_a = _read_parquet(duck.normalized_path)
+    norm_b = _read_parquet(pand.normalized_path)
+    for d in duck.dims:
+        assert norm_a[d].tolist() == norm_b[d].tolist(), d
+    assert norm_a["revenue"].fillna(-1).tolist() == pytest.approx(norm_b["revenue"].fillna(-1).tolist())
+
+
+def test_engines_infer_column_types_like_pandas(tmp_path: Path) -> None:
+    dims = ["Zip", "Flag", "Ok", "a", "Code", "Ratio", "Wide"]
+    metrics = ["Big", "Won"]
+    duck = _build(tmp_path, "u_1", "duckdb", _EDGE_RAW, dims, metrics)
+    pand = _build(tmp_path, "u_2", "pandas", _EDGE_RAW, dims, metrics)
+    assert duck.stats == pand.stats
+
+    a, b = get_leaf_index(duck), get_leaf_index(pand)
+    assert a is not None and b is not None
+    assert a.per_dim == b.per_dim
+    assert a.per_dim["zip"] == ["1", "2134", "7"]
+    assert a.per_dim["flag"] == ["f", "t"]
+    assert a.per_dim["ok"] == ["false", "true"]
+    assert a.per_dim["a"] == ["p", "q"]
+    assert a.per_dim["code"] == ["1.0", "2.0"]
+    assert a.per_dim["ratio"] == ["0.5", "100000.0", "2134.0"]
+    assert a.per_dim["wide"] == ["-1", "3", "99999999999999999999"]
+    frame = leaf_frame(a)
+    pd.testing.assert_frame_equal(frame, leaf_frame(b))
+    # Two 2**63 cells in one leaf wrap to 0 in pandas' uint64 sum.
+    assert frame.loc[frame["zip"] == "2134", "big"].tolist() == [0]
+
+    norm_a = _read_parquet(duck.normalized_path)
+    norm_b = _read_parquet(pand.normalized_path)
+    assert list(norm_a.columns) == list(norm_b.columns)
+    for col in norm_a.columns:
+        assert norm_a[col].tolist() == norm_b[col].tolist(), col
+
+
+def test_build_stores_sorted_zstd_parquet(tmp_path: Path) -> None:
+    meta = _build(tmp_path, "u_1", "duckdb")
+    norm = Path(meta.normalized_path)
+    assert meta.storage_format == "parquet"
+    assert norm.name == "normalized.parquet"
+    assert not (norm.parent / "normalized.csv").exists()
+
+    conn = duckdb.connect()
+    try:
+        codecs = {r[0] for r in conn.execute("SELECT compression FROM parquet_metadata(?)", [str(norm)]).fetchall()}
+    finally:
+        conn.close()
+    assert codecs == {"ZSTD"}
+    regions = _read_parquet(str(norm))["region"].tolist()
+    assert regions == ["americas", "apac", "apac", "europe", "europe", "europe", None]
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api import datasets as datasets_api
+from backend.api.datasets import _uploads_dir
+
+
+_CSV = b"region,revenue\n" + b"".join(b"Europe,%d\n" % i for i in range(50_000))
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.include_router(datasets_api.router, prefix="/api")
+    return TestClient(app)
+
+
+def test_multipart_preview_streams_the_file_part() -> None:
+    body = gzip.compress(_CSV)
+    res = _client().post(
+        "/api/users/u/datasets/preview",
+        data={"note": "before the file"},
+        files={"file": ("sales.csv.gz", body, "application/gzip")},
+    )
+    assert res.status_code == 200, res.text
+    preview = res.json()
+    assert preview["compression"] == "gzip"
+    assert preview["columns"] == ["region", "revenue"]
+    assert preview["size_bytes"] == len(_CSV)
+    assert (_uploads_dir() / f"{preview['upload_id']}.csv").read_bytes() == _CSV
+
+
+def test_multipart_preview_requires_a_file() -> None:
+    client = _client()
+    res = client.post("/api/users/u/datasets/preview", data={"note": "x"}, files={"other": ("a", b"")})
+    assert res.status_code == 400
+    assert client.post("/api/users/u/datasets/preview", content=b"a,b\n1,2\n").status_code == 400
+
+
+def _preview(filename: str, body: bytes) -> int:
+    res = _client().post("/api/users/u/datasets/preview", files={"file": (filename, body, "application/octet-stream")})
+    return res.status_code
+
+
+def test_corrupt_gzip_upload_is_rejected() -> None:
+    assert _preview("sales.csv.gz", gzip.compress(_CSV)[:10] + b"not gzip at all" * 100) == 400
+
+
+def test_corrupt_zstd_upload_is_rejected() -> None:
+    zstandard = pytest.importorskip("zstandard")
+    body = zstandard.ZstdCompressor().compress(_CSV)
+    assert _preview("sales.csv.zst", body[:8] + b"\xff" * 4096) == 400
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+import threading
+
+from backend.data_agent import user_map
+from backend.data_agent.dataset_registry import datasets_root
+from backend.data_agent.user_map import UserDatasetMap
+
+
+def test_legacy_json_is_imported_once() -> None:
+    legacy = datasets_root().parent / "user_datasets.json"
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    legacy.write_text(json.dumps({"alice": "alice_1", "bob": "bob_1"}), encoding="utf-8")
+
+    assert user_map.get_user_dataset("alice") == "alice_1"
+    user_map.set_user_dataset("alice", "alice_2")
+    legacy.write_text(json.dumps({"alice": "alice_9", "carol": "carol_1"}), encoding="utf-8")
+    user_map.close()
+
+    assert user_map.get_user_dataset("alice") == "alice_2"
+    assert user_map.get_user_dataset("carol") is None
+
+
+def test_cached_reads_see_writes_from_other_workers() -> None:
+    user_map.set_user_dataset("alice", "alice_1")
+    assert user_map.get_user_dataset("alice") == "alice_1"
+    hits = user_map.stats()["hits"]
+    assert user_map.get_user_dataset("alice") == "alice_1"
+    assert user_map.stats()["hits"] == hits + 1
+
+    other = UserDatasetMap()
+    try:
+        other.set("alice", "alice_2")
+    finally:
+        other.close()
+    assert user_map.get_user_dataset("alice") == "alice_2"
+    assert user_map.stats()["reloads"] >= 1
+
+
+def test_concurrent_writers_do_not_lose_updates() -> None:
+    maps = [UserDatasetMap() for _ in range(4)]
+
+    def write(n: int) -> None:
+        for i in range(25):
+            maps[n].set(f"user{n}_{i}", f"ds{n}_{i}")
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for m in maps:
+        m.close()
+    assert all(user_map.get_user_dataset(f"user{n}_{i}") == f"ds{n}_{i}" for n in range(4) for i in range(25))
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+
+from backend.data_agent import agents
+from backend.data_agent.dataset_registry import DatasetMetadata, save_dataset
+from backend.data_agent.leaf_index import build_leaf_index
+from backend.data_agent.taxonomy_builder import build_taxonomy
+from backend.data_agent.validation import validate_and_backoff
+
+from .conftest import write_csv
+
+
+def _index():
+    leaf_df = pd.DataFrame(
+        {
+            "region": ["europe", "europe", "apac"],
+            "category": ["books", "games", "books"],
+            "_rows_": [3, 2, 4],
+            "revenue": [1.0, 2.0, 3.0],
+        }
+    )
+    return build_leaf_index(leaf_df, ["region", "category"], ["revenue"])
+
+
+def test_exact_match() -> None:
+    ok, used, diag = validate_and_backoff({"region": ["Europe"], "category": ["books"]}, _index(), [])
+    assert ok and used == {"region": ["europe"], "category": ["books"]}
+    assert diag["backoff_level"] == "exact" and diag["dropped_dims"] == []
+
+
+def test_dim_with_only_unknown_values_is_a_backoff() -> None:
+    ok, used, diag = validate_and_backoff({"region": ["europe"], "category": ["nothing"]}, _index(), [])
+    assert ok and used == {"region": ["europe"]}
+    assert diag["dropped_dims"] == ["category"]
+    assert diag["backoff_level"] == "ancestor"
+    assert diag["counts"]["matched_rows"] == 5
+
+
+def test_unpopulated_combination_backs_off_deepest_dim() -> None:
+    ok, used, diag = validate_and_backoff({"region": ["apac"], "category": ["games"]}, _index(), [])
+    assert ok and used == {"region": ["apac"]}
+    assert diag["dropped_dims"] == ["category"] and diag["backoff_level"] == "ancestor"
+
+
+def test_backed_off_dataset_query_is_paged(tmp_path: Path) -> None:
+    rows = "\n".join(f"Europe,c{i % 7},{i}" for i in range(500))
+    raw = write_csv(tmp_path / "base.csv", "region,category,revenue\n" + rows + "\n")
+    meta = DatasetMetadata(dataset_id="u_1", raw_path=str(raw), dims=["region", "category"], metrics=["revenue"])
+    save_dataset(meta)
+    build_taxonomy(meta)
+
+    ctx = SimpleNamespace(state=None)
+    out = agents._dataset_query(ctx, "u_1", {"region": ["europe"], "category": ["nothing"]})
+    assert out["ok"] and out["diag"]["backoff_level"] == "ancestor"
+    assert out["row_count"] == agents._DEFAULT_PAGE_SIZE
+    assert out["total"] == 500 and out["next_cursor"]
+
+    out = agents._dataset_query(ctx, "u_1", {"region": ["europe"]}, cursor=out["next_cursor"])
+    assert out["row_count"] == agents._DEFAULT_PAGE_SIZE